@@ -0,0 +1,147 @@
+# Actualizador de precios desacoplado de la interfaz: mantiene la caché de precios al
+# día para todos los fondos conocidos y la interfaz se limita a leerla.
+#
+# Dentro de la aplicación se arranca un hilo por proceso con iniciar(). También puede
+# ejecutarse aparte (cron, systemd...) contra el mismo directorio de caché:
+#
+#   python actualizador.py            # bucle continuo
+#   python actualizador.py --una-vez  # una sola pasada
+
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cache_precios
+import historico
+from registro import obtener_registro
+
+# Horas a las que se refrescan todos los precios. Las gestoras publican el valor
+# liquidativo al cierre o a primera hora del día siguiente.
+HORAS_ACTUALIZACION = tuple(
+    int(h) for h in os.environ.get("FONDOS_HORAS_ACTUALIZACION", "7,10,13,19,22").split(",")
+)
+# Con la variable activada la aplicación no arranca el hilo (el actualizador corre aparte)
+ACTUALIZADOR_EXTERNO = os.environ.get("FONDOS_ACTUALIZADOR_EXTERNO", "") not in ("", "0")
+
+_hilo = None
+_calentando = threading.Event()
+_detener = threading.Event()
+_cerrojo = threading.Lock()
+
+
+def isins_conocidos():
+    return obtener_registro().isins()
+
+
+def proxima_hora(ahora=None):
+    # Siguiente hora programada estrictamente posterior a ahora
+    ahora = ahora or datetime.now()
+    for dias in range(2):
+        dia = ahora.date() + timedelta(days=dias)
+        for hora in sorted(HORAS_ACTUALIZACION):
+            momento = datetime(dia.year, dia.month, dia.day, hora)
+            if momento > ahora:
+                return momento
+    return ahora + timedelta(days=1)
+
+
+def pendientes(isins, almacen, forzar=False):
+    # ISIN sin precio guardado, caducados o cuyo valor liquidativo esperado aún no ha llegado
+    cache = almacen.leer(isins)
+    return [
+        isin for isin in isins
+        if forzar or isin not in cache or cache_precios.esta_caducado(cache[isin])
+    ]
+
+
+def actualizar(isins=None, almacen=None, forzar=False):
+    # Una pasada: refresca los precios pendientes y completa los históricos ya iniciados
+    almacen = almacen or cache_precios.obtener_almacen()
+    isins = isins or isins_conocidos()
+    refrescar = pendientes(isins, almacen, forzar)
+    if refrescar:
+        cache_precios.refrescar(refrescar, almacen)
+    for isin in isins:
+        serie = historico.leer_historico(isin, locales=False)
+        if len(serie) and historico.necesita_actualizar(isin, serie):
+            try:
+                historico.actualizar_historico(isin)
+            except Exception as e:
+                print(f"Error al actualizar el histórico de {isin}: {e}")
+    return refrescar
+
+
+def _espera(almacen, isins):
+    # Hasta la siguiente hora programada o, si falta algún valor liquidativo, hasta el
+    # próximo reintento
+    espera = (proxima_hora() - datetime.now()).total_seconds()
+    cache = almacen.leer(isins)
+    if any(isin not in cache or cache[isin]["fecha"] < cache_precios.ultimo_dia_habil() for isin in isins):
+        espera = min(espera, cache_precios.REINTENTO_MINIMO)
+    return max(espera, 1)
+
+
+def bucle(isins=None, almacen=None):
+    almacen = almacen or cache_precios.obtener_almacen()
+    isins = isins or isins_conocidos()
+    siguiente = proxima_hora()
+    forzar = False
+    while not _detener.is_set():
+        try:
+            actualizar(isins, almacen, forzar)
+        except Exception as e:
+            print(f"Error en el actualizador de precios: {e}")
+        finally:
+            _calentando.clear()
+        if _detener.wait(_espera(almacen, isins)):
+            break
+        # Al llegar una hora programada de día laborable se refresca todo
+        forzar = datetime.now() >= siguiente and siguiente.weekday() < 5
+        if datetime.now() >= siguiente:
+            siguiente = proxima_hora()
+
+
+def iniciar():
+    # Arranca el hilo una sola vez por proceso; las siguientes ejecuciones del script lo reutilizan
+    global _hilo
+    if ACTUALIZADOR_EXTERNO:
+        return None
+    with _cerrojo:
+        if _hilo is None or not _hilo.is_alive():
+            _detener.clear()
+            _calentando.set()
+            _hilo = threading.Thread(target=bucle, name="actualizador-precios", daemon=True)
+            _hilo.start()
+        return _hilo
+
+
+def calentando():
+    # True mientras el hilo hace la primera pasada tras arrancar
+    return _calentando.is_set()
+
+
+def detener():
+    _detener.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantiene al día la caché de precios de los fondos")
+    parser.add_argument("--una-vez", action="store_true", help="hace una pasada y termina")
+    parser.add_argument("--forzar", action="store_true", help="refresca todos los precios aunque no hayan caducado")
+    args = parser.parse_args()
+
+    if args.una_vez:
+        inicio = time.perf_counter()
+        refrescados = actualizar(forzar=args.forzar)
+        print(f"{len(refrescados)} precios consultados en {time.perf_counter() - inicio:.1f} s")
+        return
+    try:
+        bucle()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
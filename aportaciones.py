@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+import requests
+
+from cliente_http import cliente
+from configuracion import DIRECTORIO_CACHE
+from metricas import contar, tramo
+from valoracion import huellas_por_fondo
+
+DIRECTORIO_LIBRO = os.path.join(DIRECTORIO_CACHE, "libro")
+RUTA_INDICE = os.path.join(DIRECTORIO_LIBRO, "indice.json")
+# Durante este intervalo se sirve la copia en memoria sin preguntar a Drive
+REVALIDAR_CADA = int(os.environ.get("FONDOS_REVALIDAR_LIBRO", 300))
+TIMEOUT_DESCARGA = (5, 60)
+
+_en_memoria = {}
+# Libros subidos o locales ya parseados, por contenido
+_por_contenido = OrderedDict()
+MAX_LIBROS_EN_MEMORIA = 64
+# Un cerrojo por URL: cada libro se descarga una sola vez aunque lo pidan varias sesiones
+_cerrojos = {}
+_cerrojo = threading.Lock()
+_cerrojo_indice = threading.Lock()
+
+
+# Columnas del libro que usa la aplicación y sus tipos. El fondo es categórico: cada fila
+# guarda un código de un byte en vez del nombre; fechas e importes siguen en 64 bits
+# porque las sumas de un libro grande en float32 se desvían en céntimos.
+COLUMNAS = ["Fecha", "Fondo", "Dinero Inv.", "Valor Compra"]
+TIPOS = {"Fondo": "category", "Dinero Inv.": "float64", "Valor Compra": "float64"}
+MOTOR_EXCEL = os.environ.get("FONDOS_MOTOR_EXCEL", "auto")
+# Cambia cuando cambia el esquema normalizado, para invalidar las copias en disco
+VERSION_ESQUEMA = "2"
+
+
+def _normalizar(df):
+    faltan = [c for c in COLUMNAS if c not in df.columns]
+    if faltan:
+        raise ValueError(f"Faltan columnas en el libro: {', '.join(faltan)}")
+    df = df[COLUMNAS].dropna(how="all")
+    df = df.assign(Fecha=pd.to_datetime(df["Fecha"]))
+    return df.astype(TIPOS).reset_index(drop=True)
+
+
+def _leer_calamine(contenido):
+    return pd.read_excel(BytesIO(contenido), engine="calamine", usecols=COLUMNAS)
+
+
+def _leer_openpyxl_streaming(contenido):
+    # Modo solo lectura: recorre las filas sin construir el modelo completo del libro
+    from openpyxl import load_workbook
+
+    libro = load_workbook(BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        cabecera = next(filas, ())
+        posiciones = {nombre: i for i, nombre in enumerate(cabecera) if nombre in COLUMNAS}
+        indices = [posiciones[c] for c in COLUMNAS if c in posiciones]
+        columnas = [c for c in COLUMNAS if c in posiciones]
+        datos = [[fila[i] if i < len(fila) else None for i in indices] for fila in filas]
+    finally:
+        libro.close()
+    return pd.DataFrame(datos, columns=columnas)
+
+
+def _leer_openpyxl(contenido):
+    return pd.read_excel(BytesIO(contenido), engine="openpyxl", usecols=COLUMNAS)
+
+
+MOTORES = {
+    "calamine": _leer_calamine,
+    "openpyxl-streaming": _leer_openpyxl_streaming,
+    "openpyxl": _leer_openpyxl,
+}
+
+
+def motor_por_defecto():
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return "openpyxl-streaming"
+    return "calamine"
+
+
+def leer_libro(contenido, motor=None):
+    # Cada motor falla a su manera con un fichero que no es un libro de Excel
+    # (CalamineError, BadZipFile, KeyError...): todos llegan como ValueError
+    motor = motor or MOTOR_EXCEL
+    if motor == "auto":
+        motor = motor_por_defecto()
+    lector = MOTORES[motor]
+    try:
+        df = lector(contenido)
+    except (ImportError, ValueError):
+        raise
+    except Exception as e:
+        raise ValueError(f"El fichero no es un libro de Excel válido ({type(e).__name__}: {e})") from e
+    return _normalizar(df)
+
+
+def clave_contenido(contenido):
+    return hashlib.sha256(VERSION_ESQUEMA.encode() + contenido).hexdigest()
+
+
+def _leer_indice():
+    try:
+        with open(RUTA_INDICE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _escribir_indice(indice):
+    os.makedirs(DIRECTORIO_LIBRO, exist_ok=True)
+    temporal = RUTA_INDICE + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(indice, f)
+    os.replace(temporal, RUTA_INDICE)
+
+
+def _ruta_parquet(clave):
+    return os.path.join(DIRECTORIO_LIBRO, f"{clave}.parquet")
+
+
+def _copia_en_disco(entrada):
+    if not entrada:
+        return None
+    try:
+        return pd.read_parquet(_ruta_parquet(entrada["clave"]))
+    except (OSError, ValueError):
+        return None
+
+
+def _guardar_parquet(clave, df):
+    os.makedirs(DIRECTORIO_LIBRO, exist_ok=True)
+    ruta = _ruta_parquet(clave)
+    if not os.path.exists(ruta):
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, ruta)
+
+
+def _guardar(url, clave, df, respuesta):
+    _guardar_parquet(clave, df)
+    # El índice es común a todas las URL: se relee y se escribe bajo su propio cerrojo
+    with _cerrojo_indice:
+        indice = _leer_indice()
+        anterior = indice.get(url, {}).get("clave")
+        indice[url] = {
+            "clave": clave,
+            "etag": respuesta.headers.get("ETag"),
+            "last_modified": respuesta.headers.get("Last-Modified"),
+        }
+        _escribir_indice(indice)
+        # La copia anterior deja de ser necesaria si ninguna otra URL la usa
+        if anterior and anterior != clave and all(e["clave"] != anterior for e in indice.values()):
+            try:
+                os.remove(_ruta_parquet(anterior))
+            except OSError:
+                pass
+
+
+def _marcar(df, clave):
+    # Huellas del contenido y de cada fondo en el propio libro para que las etapas
+    # posteriores lo identifiquen sin recorrer sus filas (ver cartera.huella_libro y
+    # valoracion.AgregadosFondos). Las de los fondos se calculan una sola vez por libro.
+    if df.attrs.get("huella") != clave or "huellas_fondos" not in df.attrs:
+        df.attrs.update(huella=clave, filas=len(df), huellas_fondos=huellas_por_fondo(df))
+
+
+def leer_libro_en_cache(contenido):
+    # Libro a partir de su contenido (fichero local o subido), parseado una sola vez:
+    # se reutiliza la copia en memoria o en disco de un contenido idéntico
+    clave = clave_contenido(contenido)
+    with _cerrojo:
+        df = _por_contenido.get(clave)
+        if df is not None:
+            _por_contenido.move_to_end(clave)
+            contar("libro", resultado="memoria")
+            return df.copy(deep=False)
+    df = _copia_en_disco({"clave": clave})
+    if df is not None:
+        contar("libro", resultado="copia_disco")
+    else:
+        contar("libro", resultado="leido")
+        with tramo("libro_lectura"):
+            df = leer_libro(contenido)
+        _guardar_parquet(clave, df)
+    _marcar(df, clave)
+    with _cerrojo:
+        _por_contenido[clave] = df
+        while len(_por_contenido) > MAX_LIBROS_EN_MEMORIA:
+            _por_contenido.popitem(last=False)
+    return df.copy(deep=False)
+
+
+def _cerrojo_de(url):
+    with _cerrojo:
+        return _cerrojos.setdefault(url, threading.Lock())
+
+
+def _ultima_copia(url, clave, df, entrada, resultado):
+    # Drive no disponible o libro ilegible: última copia buena (memoria o disco).
+    # Se llama con el cerrojo de la URL tomado.
+    contar("libro", resultado=resultado)
+    if df is None:
+        df = _copia_en_disco(entrada)
+        clave = entrada["clave"] if entrada else None
+    if df is None:
+        return None, False
+    # No se vuelve a intentar la descarga hasta el siguiente intervalo
+    _marcar(df, clave)
+    _en_memoria[url] = (clave, df, time.monotonic(), True)
+    return df.copy(deep=False), True
+
+
+def cargar_aportaciones(url):
+    # Devuelve (df, desde_copia). El libro solo se descarga si ha podido cambiar y solo
+    # se vuelve a parsear si su contenido es distinto; si Drive no responde se usa la
+    # última copia buena. df es None si no hay ninguna copia disponible.
+    # Se devuelve una copia superficial: con copy-on-write la copia en memoria no cambia
+    # aunque se modifique el df devuelto, y no se duplican los datos en cada ejecución.
+    with _cerrojo_de(url):
+        clave, df, revalidado, desde_copia = _en_memoria.get(url, (None, None, 0, False))
+        if df is not None and time.monotonic() - revalidado < REVALIDAR_CADA:
+            contar("libro", resultado="memoria")
+            return df.copy(deep=False), desde_copia
+
+        indice = _leer_indice()
+        entrada = indice.get(url)
+        cabeceras = {}
+        if entrada and entrada.get("etag"):
+            cabeceras["If-None-Match"] = entrada["etag"]
+        if entrada and entrada.get("last_modified"):
+            cabeceras["If-Modified-Since"] = entrada["last_modified"]
+
+        try:
+            with tramo("libro_descarga"):
+                respuesta = cliente.get(url, timeout=TIMEOUT_DESCARGA, condicional=False, headers=cabeceras)
+        except requests.RequestException as e:
+            print(f"⚠️ No se pudo descargar el libro ({e}).")
+            respuesta = None
+
+        if respuesta is not None and respuesta.status_code == 304 and entrada:
+            contar("libro", resultado="no_modificado")
+            if clave != entrada["clave"] or df is None:
+                clave, df = entrada["clave"], _copia_en_disco(entrada)
+        elif respuesta is not None and respuesta.status_code == 200:
+            nueva_clave = clave_contenido(respuesta.content)
+            if nueva_clave != clave or df is None:
+                nuevo = _copia_en_disco(entrada) if entrada and entrada["clave"] == nueva_clave else None
+                if nuevo is None:
+                    try:
+                        with tramo("libro_lectura"):
+                            nuevo = leer_libro(respuesta.content)
+                    except ValueError as e:
+                        # Drive responde 200 con una página de aviso o un fichero a medio
+                        # subir: se sigue sirviendo la última copia buena
+                        print(f"⚠️ El libro descargado no se puede leer ({e}).")
+                        return _ultima_copia(url, clave, df, entrada, "ilegible")
+                    contar("libro", resultado="leido")
+                else:
+                    contar("libro", resultado="copia_disco")
+                clave, df = nueva_clave, nuevo
+            else:
+                contar("libro", resultado="sin_cambios")
+            _guardar(url, clave, df, respuesta)
+        else:
+            return _ultima_copia(url, clave, df, entrada, "sin_conexion")
+
+        if df is None:
+            return None, False
+        _marcar(df, clave)
+        _en_memoria[url] = (clave, df, time.monotonic(), False)
+        return df.copy(deep=False), False
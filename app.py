@@ -1,13 +1,39 @@
 import streamlit as st
 import pandas as pd
-import requests
-from io import BytesIO
-from bs4 import BeautifulSoup
-import plotly.graph_objects as go
-import plotly.express as px
-import re
-from datetime import datetime
-import io
+import numpy as np
+import time
+
+import actualizador
+import cache_precios
+import metricas
+from cartera import (
+    cargar_cartera,
+    cargar_libro,
+    carteras_configuradas,
+    fondos_sin_isin,
+    fondos_sin_precio,
+    informe_de,
+    isins_del_libro,
+)
+from cliente_http import cliente
+from escenarios import DIAS_ANIO, PERCENTILES, modelo_rentabilidades, montecarlo, todo_en_un_fondo, valor_con_choques
+from graficos import (
+    figura_acumulada,
+    figura_correlacion,
+    figura_distribucion,
+    figura_inversion_estimacion,
+    figura_montecarlo,
+    figura_pesos,
+    figura_valor_compra,
+)
+from historico import obtener_historicos, version_historicos
+from precios import salud
+from rebalanceo import error_seguimiento, tabla_rebalanceo
+from registro import obtener_registro
+from riesgo import COLUMNA_CARTERA, TASA_LIBRE_RIESGO
+from valoracion import COLUMNAS_RESUMEN
+
+inicio_ejecucion = time.perf_counter()
 
 # Configuración de página
 st.set_page_config(page_title="Fondos de Inversión", layout="wide", initial_sidebar_state="collapsed")
@@ -35,123 +61,44 @@ def formato_euro_es(x):
         return f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + " €"
     return x
 
-def obtener_url_alternativa(isin):
-    urls = {
-        "IE00BYX5NX33": "https://markets.ft.com/data/funds/tearsheet/historical?s=IE00BYX5NX33:EUR",
-        "LU1213836080": "https://markets.ft.com/data/funds/tearsheet/historical?s=LU1213836080:EUR",
-        "LU1953238794": "https://markets.ft.com/data/funds/tearsheet/historical?s=LU1953238794:EUR",
-        "IE0031786696": "https://markets.ft.com/data/funds/tearsheet/historical?s=IE0031786696:EUR",
-        "LU1694789451": "https://markets.ft.com/data/funds/tearsheet/historical?s=LU1694789451:EUR",
-        "LU1598720172": "https://markets.ft.com/data/funds/tearsheet/historical?s=LU1598720172:EUR",
-        "ES0140072028": "https://markets.ft.com/data/funds/tearsheet/historical?s=ES0140072028:EUR",
-        "LU0625737910": "https://markets.ft.com/data/funds/tearsheet/historical?s=LU0625737910:EUR",
-        "LU3038481936": "https://markets.ft.com/data/funds/tearsheet/historical?s=LU3038481936:EUR",
-        "ES0165243025": "https://markets.ft.com/data/funds/tearsheet/historical?s=ES0165243025:EUR",
-        "IE00BH6XSF26": "https://markets.ft.com/data/funds/tearsheet/historical?s=IE00BH6XSF26:EUR",
-        "ES0112611001": "https://markets.ft.com/data/funds/tearsheet/historical?s=ES0112611001:EUR",
-        "ES0116567035": "https://markets.ft.com/data/funds/tearsheet/historical?s=ES0116567035:EUR",
-        "LU1112771503": "https://markets.ft.com/data/funds/tearsheet/historical?s=LU1112771503:EUR",
-        "ES0146309002": "https://markets.ft.com/data/funds/tearsheet/historical?s=ES0146309002:EUR"
-    }
-    return urls.get(isin)
-def obtener_url_morningstar(isin):
-    urls = {
-        "IE00BYX5NX33": 'https://www.morningstarfunds.ie/ie/funds/snapshot/snapshot.aspx?id=F00001019E',
-        "LU1213836080": 'https://www.morningstarfunds.ie/ie/funds/snapshot/snapshot.aspx?id=F00000VKNA',
-        "IE0031786696": 'https://www.morningstarfunds.ie/ie/funds/snapshot/snapshot.aspx?id=0P00012I6A',
-        "LU0625737910": 'https://www.morningstar.co.uk/uk/funds/snapshot/snapshot.aspx?id=F00000MO6Y',
-        "ES0165243025": 'https://www.morningstar.es/es/funds/snapshot/snapshot.aspx?id=F00001LWDD'
-    }
-    return urls.get(isin)
-def obtener_precio_y_fecha_alt(isin):
-    website = obtener_url_alternativa(isin)
-    if not website:
-        return None, None
-    result = requests.get(website)
-    soup = BeautifulSoup(result.text, 'lxml')
-    precio_box = soup.find('span', class_='mod-ui-data-list__value')
-    if not precio_box:
-        print(f"⚠️ No se encontró el precio para {isin} en FT.")
-        return None, None
-    precio_str = precio_box.text.strip()
-    precio_str = precio_str.replace(',', '')  # elimina separador de miles
-    precio = float(precio_str)
-    #precio=float(precio_box.text.strip())
-    fecha_box = soup.find('div', class_='mod-disclaimer')
-    match = re.search(r'as of ([A-Za-z]+ \d{1,2} \d{4})', fecha_box.text.strip())
-    fecha_str = match.group(1)
-    fecha_obj = datetime.strptime(fecha_str, "%b %d %Y")
-    return round(precio, 2) if precio else None, fecha_obj
-def obtener_precio_y_fecha_mor(isin):
-    website = obtener_url_morningstar(isin)
-    if not website:
-        return None, None
-    try:
-        result = requests.get(website)
-        soup = BeautifulSoup(result.text, 'lxml')
-        precio_box = soup.find('td', class_='line text')
-        fecha_box = soup.find('td', class_='line heading')
-
-        if not precio_box or not fecha_box:
-            return None, None
-
-        # Obtener precio
-        precio_texto = precio_box.text.strip()
-        # Extraer el número final (normalmente viene como "EUR 123.45")
-        match_precio = re.search(r"(\d+,\d+|\d+\.\d+)$", precio_texto)
-        if not match_precio:
-            return None, None
-        precio = float(match_precio.group(1).replace(",", "."))
-
-        # Obtener fecha
-        fecha_texto = fecha_box.text.strip()
-        # Extraer fechas válidas (día entre 1 y 31)
-        match_fecha = re.search(r"\b([1-9]|[12][0-9]|3[01])/([01][0-9])/(\d{4})\b", fecha_texto)
-        if not match_fecha:
-            return None, None
-        fecha = datetime.strptime(match_fecha.group(0), "%d/%m/%Y")
-
-        return round(precio, 2), fecha
-    except Exception as e:
-        print(f"Error mor ({isin}): {e}")
-        return None, None
-@st.cache_data(ttl=3600)
-def obtener_precio_y_fecha(isin):
-    precio1, fecha1 = obtener_precio_y_fecha_mor(isin)
-    precio2, fecha2 = obtener_precio_y_fecha_alt(isin)
-
-    # Casos posibles:
-    if fecha1 and fecha2:
-        if fecha1 > fecha2:
-            return precio1, fecha1
+# Los precios los mantiene al día el actualizador (un hilo por proceso o un proceso aparte);
+# la interfaz solo lee la caché y nunca espera a FT ni a Morningstar
+actualizador.iniciar()
+metricas.iniciar_servidor()
+
+def obtener_precios(isins):
+    precios = cache_precios.leer_precios(isins)
+    if actualizador.calentando() and any(precio is None for precio, _ in precios.values()):
+        st.info("Actualizando precios en segundo plano; recarga la página en unos segundos.")
+    return precios
+
+# Cartera de la sesión: una de las configuradas (Drive, fichero local...) o un libro subido.
+# Cada libro se carga y se guarda en caché por separado; los precios son comunes a todas.
+carteras = carteras_configuradas()
+cartera_seleccionada = st.sidebar.selectbox("💼 Cartera", list(carteras)) if len(carteras) > 1 else next(iter(carteras))
+libro_subido = st.sidebar.file_uploader("…o sube tu libro de aportaciones", type=["xlsx"])
+
+# Descargar el archivo Excel desde Google Drive (solo si ha cambiado desde la última vez)
+try:
+    with metricas.tramo("libro"):
+        if libro_subido is not None:
+            df, desde_copia = cargar_libro(contenido=libro_subido.getvalue())
+            clave_cartera = f"subido:{libro_subido.file_id}"
         else:
-            return precio2, fecha2
-    elif fecha1:
-        return precio1, fecha1
-    elif fecha2:
-        return precio2, fecha2
-    else:
-        return None, None
-
-# Enlace de Google Drive (enlace directo de descarga)
-url = 'https://drive.google.com/uc?export=download&id=18zva1x4v5UCxamu9qbV97EVA6DbZAOzb'  # Cambia este ID por el tuyo
-
-# Descargar el archivo Excel desde Google Drive
-response = requests.get(url)
+            df, desde_copia = cargar_cartera(carteras[cartera_seleccionada])
+            clave_cartera = carteras[cartera_seleccionada]
+except (OSError, ValueError) as e:
+    st.error(f"No se pudo leer el libro de aportaciones: {e}")
+    st.stop()
 
 # Verificar si la descarga fue exitosa
-if response.status_code == 200:
-    # Usar BytesIO para leer el archivo Excel desde la respuesta
-    df = pd.read_excel(BytesIO(response.content), engine="openpyxl")
-    st.write("¡Archivo cargado correctamente!")
-else:
+if df is None:
     st.error("Hubo un problema al descargar el archivo desde Google Drive.")
     st.stop()
-
-# Procesamiento de fechas
-df['Fecha'] = pd.to_datetime(df['Fecha'])
-df['Fecha Formateada'] = df['Fecha'].dt.strftime("%d/%m/%Y")
-
+elif desde_copia:
+    st.warning("No se pudo contactar con Google Drive: se muestra la última copia guardada del archivo.")
+else:
+    st.write("¡Archivo cargado correctamente!")
 
 
 opcion_seleccionada = st.sidebar.radio(
@@ -160,60 +107,30 @@ opcion_seleccionada = st.sidebar.radio(
     index=1
 )
 
-isin_map = {
-        "MSCI World": "IE00BYX5NX33",
-        "Global Technology": "LU1213836080",
-        "Evercapital": "LU1953238794",
-        "Emerging Markets": "IE0031786696",
-        "Cobas": "LU1598720172",
-        "Dunas": "LU1694789451",
-        "Abaco Renta Fija": "ES0140072028",
-        "Pictet China": "LU0625737910",
-        "Hamco": "LU3038481936",
-        "MyInvestor Value":"ES0165243025",
-        "Heptagon": "IE00BH6XSF26",
-        "AZValor": "ES0112611001",
-        "CartesioX": "ES0116567035",
-        "Helium": "LU1112771503",
-        "Horos": "ES0146309002"
-}
-
 
-if opcion_seleccionada == "Fondo Individual":
-    # Fondos disponibles
-    fondos_disponibles = df['Fondo'].unique()
+@st.fragment
+def vista_fondo(informe):
+    # Fragmento: al cambiar de fondo solo se vuelve a ejecutar esta vista, no el script
+    # entero (libro, precios...)
+    inicio_vista = time.perf_counter()
+    # Aportaciones ya valoradas por el informe
+    valoradas = informe['valoradas']
+    fondos_disponibles = valoradas['Fondo'].unique()
     fondo_seleccionado = st.selectbox("🎯 Seleccionar un fondo", fondos_disponibles)
 
-    # Filtrar datos por fondo
-    datos = df[df['Fondo'] == fondo_seleccionado].copy()
-
-    # Ordenar los datos por fecha de más reciente a más antigua
-    datos.sort_values('Fecha', ascending=False, inplace=True)
-
-    # Formatear la columna 'Fecha' a un formato legible
-    datos['Fecha'] = datos['Fecha'].dt.strftime('%d/%m/%Y')
+    # Filtrar datos por fondo y ordenarlos de más reciente a más antigua. La fecha se
+    # queda como fecha: solo se formatea al mostrar la tabla
+    datos = valoradas[valoradas['Fondo'] == fondo_seleccionado].sort_values('Fecha', ascending=False)
 
-    # Asignar ISIN
-    
-    isin = isin_map.get(fondo_seleccionado.strip(), None)
-    precio_actual, fecha = obtener_precio_y_fecha(isin)
+    isin = obtener_registro().isin(fondo_seleccionado)
+    precio_actual, fecha = informe.precios.get(isin, (None, None))
 
-    # Cálculo de rendimiento
-    datos['Total Invertido'] = datos['Dinero Inv.'].cumsum()
+    # Rendimiento de cada aportación
     if precio_actual:
-        datos['Valor Actual Estimado'] = datos['Dinero Inv.'] / datos['Valor Compra'] * precio_actual
-        datos['Estimación Acumulada'] = datos['Valor Actual Estimado'].cumsum()
-
-        # Calcular el rendimiento comparado con el precio actual
-        datos['Rendimiento (%)'] = ((precio_actual - datos['Valor Compra']) / datos['Valor Compra']) * 100
-        # Redondear a 2 decimales
-        datos['Rendimiento (%)'] = datos['Rendimiento (%)'].round(2)
-        
-        # Calcular el valor actual de cada aportación
-        datos['Valor Actual'] = (datos['Dinero Inv.'] / datos['Valor Compra']) * precio_actual
-        datos['Diferencia'] = datos['Valor Actual']-datos['Dinero Inv.'] 
+        datos['Rendimiento (%)'] = (((precio_actual - datos['Valor Compra']) / datos['Valor Compra']) * 100).round(2)
+        datos['Valor Actual'] = datos['Valor Actual Estimado']
+        datos['Diferencia'] = datos['Valor Actual'] - datos['Dinero Inv.']
     else:
-        datos['Estimación Acumulada'] = None
         datos['Rendimiento (%)'] = None
         datos['Valor Actual'] = None
         datos['Diferencia'] = None
@@ -222,12 +139,13 @@ if opcion_seleccionada == "Fondo Individual":
     datos['Valor Actual'] = datos['Valor Actual'].fillna('-')
     datos['Rendimiento (%)'] = datos['Rendimiento (%)'].fillna('-')
 
-    # Calcular el precio medio de compra ponderado
-    total_invertido = datos['Dinero Inv.'].sum()
-    valor_estimado_total = datos['Valor Actual Estimado'].sum() if 'Valor Actual Estimado' in datos.columns else 0
-
-    # Calcular el precio medio de compra ponderado
-    precio_medio_compra = (datos['Valor Compra'] * datos['Dinero Inv.']).sum() / total_invertido
+    # Valoración, precio medio, TIR y TWR del fondo: los del resumen del informe
+    resumen_fondo = informe['resumen'].set_index('Fondo').loc[fondo_seleccionado]
+    total_invertido = resumen_fondo['Dinero Inv.']
+    valor_estimado_total = resumen_fondo['Valor Actual Estimado']
+    precio_medio_compra = resumen_fondo['Precio Medio Compra']
+    tir_fondo = resumen_fondo['TIR (%)'] if precio_actual else None
+    twr_fondo = resumen_fondo['TWR (%)'] if precio_actual else None
 
     if fecha is None:
         fecha = ""
@@ -235,7 +153,7 @@ if opcion_seleccionada == "Fondo Individual":
         fecha_fin=fecha.date()
         fecha=fecha_fin.strftime("%d de %B de %Y")
     # Crear columnas de métricas
-    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    col1, col2, col3, col4, col5, col6, col7, col8 = st.columns(8)
     with col1:
         if precio_actual is not None:
             texto_fecha = f"💶 Precio actual con fecha: {fecha}" if fecha else "💶 Precio actual"
@@ -256,16 +174,14 @@ if opcion_seleccionada == "Fondo Individual":
             st.metric("📈 Rendimiento total (%)", f"{porcentaje:.2f} %")
         else:
             st.metric("📈 Rendimiento total (%)", "N/A")
+    with col7:
+        st.metric("📆 TIR anual (%)", f"{tir_fondo:.2f} %" if tir_fondo is not None and pd.notna(tir_fondo) else "N/A")
+    with col8:
+        st.metric("⏱️ TWR (%)", f"{twr_fondo:.2f} %" if twr_fondo is not None and pd.notna(twr_fondo) else "N/A")
 
     # Mostrar tabla con solo las columnas deseadas
     st.subheader("🔍 Datos del fondo seleccionado")
 
-    # Asegúrate de que 'Valor Compra' esté en formato numérico antes de las operaciones
-    datos['Valor Compra'] = pd.to_numeric(datos['Valor Compra'], errors='coerce')
-
-    # Eliminar columna redundante "Fecha Formateada" y renombrar
-    datos = datos.drop(columns=["Fecha Formateada"])
-
     # Función para formatear los valores con símbolo de euro y porcentaje
     def formato_decimal_con_simbolos(x, tipo='euro'):
         if isinstance(x, (int, float)):
@@ -298,6 +214,7 @@ if opcion_seleccionada == "Fondo Individual":
             .map(color_rendimiento, subset=['Rendimiento (%)']) \
             .map(color_rendimiento, subset=['Diferencia']) \
             .format({
+                'Fecha': lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else '-',
                 'Valor Compra': lambda x: formato_decimal_con_simbolos(x, tipo='euro'),
                 'Dinero Inv.': lambda x: formato_decimal_con_simbolos(x, tipo='euro'),
                 'Valor Actual': lambda x: formato_decimal_con_simbolos(x, tipo='euro'),
@@ -308,6 +225,7 @@ if opcion_seleccionada == "Fondo Individual":
     else:
         styled_df = datos[columnas_mostrar].style \
             .format({
+                'Fecha': lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else '-',
                 'Valor Compra': lambda x: formato_decimal_con_simbolos(x, tipo='euro'),
                 'Dinero Inv.': lambda x: formato_decimal_con_simbolos(x, tipo='euro'),
                 'Valor Actual': lambda x: formato_decimal_con_simbolos(x, tipo='euro'),
@@ -324,401 +242,408 @@ if opcion_seleccionada == "Fondo Individual":
         hide_index=True
     )
 
-    # Crear una columna de fechas reales para ordenar y graficar correctamente
-    datos['Fecha_dt'] = pd.to_datetime(datos['Fecha'], format='%d/%m/%Y')
-    datos.sort_values('Fecha_dt', inplace=True)
+    # Ordenar los datos por fecha de la más antigua a la más reciente
+    datos = datos.sort_values('Fecha')
 
     # Título de la sección del primer gráfico
     st.subheader("📈 Evolución del valor de compra")
 
     # Gráfico de valor de compra
-    fig1 = go.Figure()
-    fig1.add_trace(go.Scatter(
-        x=datos['Fecha_dt'], y=datos['Valor Compra'],
-        mode='lines+markers', name='Valor Compra', line=dict(color='teal')
-    ))
-    fig1.update_layout(
-        xaxis_title="Fecha",
-        yaxis_title="Valor",
-        template="plotly_white",
-        yaxis=dict(tickformat=".2f"),  # Formato del eje Y con 2 decimales
-        height=500,  # Aumentar el tamaño del gráfico
-        width=1000  # Aumentar el tamaño del gráfico
-    )
-    st.plotly_chart(fig1, use_container_width=True)
-
-    # Asegurarse de que la columna 'Fecha' esté en formato datetime antes de ordenar
-    datos['Fecha'] = pd.to_datetime(datos['Fecha'], format='%d/%m/%Y')
-
-    # Ordenar los datos por fecha de la más antigua a la más reciente
-    datos = datos.sort_values('Fecha')
+    with metricas.tramo("grafico", grafico="valor_compra"):
+        st.plotly_chart(figura_valor_compra(datos[['Fecha', 'Valor Compra']]), use_container_width=True)
 
     # Gráfico comparativo de barras superpuestas sin acumulación
     if precio_actual:
         st.subheader("💰 Inversión vs Estimación por Fecha")
-        fig2 = go.Figure()
-
-        # Total invertido (sin acumulación)
-        fig2.add_trace(go.Bar(
-            x=datos['Fecha'], y=datos['Dinero Inv.'], 
-            name="Total Invertido", 
-            marker=dict(color="#2c3e50")
-        ))
-
-        # Estimación acumulada (sin acumulación)
-        fig2.add_trace(go.Bar(
-            x=datos['Fecha'], y=datos['Valor Actual Estimado'], 
-            name="Valor Estimado Actual", 
-            marker=dict(color="#27ae60")
-        ))
-
-        fig2.update_layout(
-            barmode='group',  # Barras superpuestas
-            xaxis_title="Fecha", yaxis_title="Euros", template="plotly_white",
-            xaxis=dict(showgrid=True), yaxis=dict(showgrid=True),
-            plot_bgcolor="rgba(245, 247, 250, 1)",
-            height=500,  # Aumentar el tamaño del gráfico
-            width=1000,  # Aumentar el tamaño del gráfico
-            legend=dict(
-                orientation="h",  # Establecer la orientación horizontal
-                yanchor="bottom",  # Posicionar la leyenda debajo del gráfico
-                y=-0.2  # Colocar la leyenda un poco debajo
-            )
-        )
+        with metricas.tramo("grafico", grafico="inversion_estimacion"):
+            st.plotly_chart(figura_inversion_estimacion(datos[['Fecha', 'Dinero Inv.', 'Valor Actual Estimado']]), use_container_width=True)
+    metricas.anotar_tramo("vista", time.perf_counter() - inicio_vista, vista="fondo")
 
-        st.plotly_chart(fig2, use_container_width=True)
 
+@st.fragment
+def tabla_historial(df_aportaciones):
+    # Fragmento: filtros y paginación solo vuelven a ejecutar la tabla del historial
 
-elif opcion_seleccionada == "Total de la Inversión":
-    st.subheader("📊 Resumen General de la Inversión")
+    # ================== FILTROS Y PAGINACIÓN ==================
 
-    df['Valor Actual Estimado'] = 0.0  # Inicializar columna
-    fecha_ult_actualizacion = None
+    # Sin ninguna fecha no hay rango que ofrecer (min() sería NaT)
+    if df_aportaciones['Fecha'].isna().all():
+        st.info("No hay aportaciones en el historial.")
+        return
 
-    for fondo in df['Fondo'].unique():
-        isin_fondo = isin_map.get(fondo)
-        if not isin_fondo:
-            st.warning(f"ISIN no definido para {fondo}")
-            continue
-
-        try:
-            precio_actual, fecha = obtener_precio_y_fecha(isin_fondo)
-            fecha_ult_actualizacion = fecha  # Tomamos la última con éxito
-            indices = df[df['Fondo'] == fondo].index
-            df.loc[indices, 'Valor Actual Estimado'] = (
-                df.loc[indices, 'Dinero Inv.'] / df.loc[indices, 'Valor Compra']
-            ) * precio_actual
-        except Exception as e:
-            st.warning(f"No se pudo obtener el precio de {fondo} ({isin_fondo}): {e}")
-
-    resumen_total = df.groupby('Fondo').agg({
-        'Dinero Inv.': 'sum',
-        'Valor Actual Estimado': 'sum'
-    }).reset_index()
-
-    resumen_total['Rendimiento (%)'] = (
-        (resumen_total['Valor Actual Estimado'] - resumen_total['Dinero Inv.']) /
-        resumen_total['Dinero Inv.']
-    ) * 100
-    resumen_total['Rendimiento (%)'] = resumen_total['Rendimiento (%)'].round(2)
-    resumen_total['Diferencia (€)'] = (
-    resumen_total['Valor Actual Estimado'] - resumen_total['Dinero Inv.']).round(2)
-
-    # Mostrar métricas generales
-    total_invertido = resumen_total['Dinero Inv.'].sum()
-    total_estimado = resumen_total['Valor Actual Estimado'].sum()
-    rendimiento_total = (
-        ((total_estimado - total_invertido) / total_invertido) * 100
-        if total_invertido else 0
+    col_filtro1, col_filtro2 = st.columns(2)
+    fondos_filtro = col_filtro1.multiselect(
+        "Fondos", sorted(df_aportaciones['Fondo'].dropna().unique()), placeholder="Todos los fondos"
     )
-
-    if fecha_ult_actualizacion:
-        st.caption(f"🕒 Última actualización de precios: {fecha_ult_actualizacion}")
-
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric("📥 Total Invertido", f"{total_invertido:.2f} €")
-    col2.metric("📌 Valor Estimado", f"{total_estimado:.2f} €")
-    col3.metric("📌 Diferencia", f"{total_estimado-total_invertido:.2f} €")
-    col4.metric("📈 Rendimiento Total", f"{rendimiento_total:.2f} %")
-    # Tabla resumen
-    st.subheader("📊 Detalle por Fondo")
-
-    def color_total(val):
-        try:
-            val = float(val)
-            if val > 0:
-                return 'color: green'
-            elif val < 0:
-                return 'color: red'
-            else:
-                return 'color: black'
-        except:
-            return 'color: gray'
-
-    resumen_total['Precio Medio Compra'] = 0.0  # Inicializar columna
-    resumen_total['Precio Actual'] = 0.0  # Inicializar columna
-    resumen_total['Fecha Precio'] = ""
-
-    for fondo in resumen_total['Fondo']:
-        isin_fondo = isin_map.get(fondo)
-        if not isin_fondo:
-            continue
-        
-        # Filtrar los datos para el fondo actual
-        datos_fondo = df[df['Fondo'] == fondo]
-        
-        # Calcular el precio medio ponderado de compra
-        total_invertido_fondo = datos_fondo['Dinero Inv.'].sum()
-        valor_compra_ponderado = (datos_fondo['Valor Compra'] * datos_fondo['Dinero Inv.']).sum()
-        if total_invertido_fondo != 0:
-            precio_medio_compra_fondo = valor_compra_ponderado / total_invertido_fondo
-            resumen_total.loc[resumen_total['Fondo'] == fondo, 'Precio Medio Compra'] = precio_medio_compra_fondo
-
-        # Obtener el precio actual
-        precio_actual_fondo, fecha_fondo = obtener_precio_y_fecha(isin_fondo)
-        if precio_actual_fondo:
-            resumen_total.loc[resumen_total['Fondo'] == fondo, 'Precio Actual'] = precio_actual_fondo
-            resumen_total.loc[resumen_total['Fondo'] == fondo,'Fecha Precio'] = fecha_fondo.strftime("%d/%m/%Y")
-    orden_fondos = [
-    "MSCI World",
-    "Cobas",
-    "Horos",
-    "AZValor",
-    "Hamco",
-    "Heptagon",
-    "Emerging Markets",
-    "Pictet China",
-    "MyInvestor Value",
-    "Evercapital",
-    "Abaco Renta Fija",
-    "Dunas",
-    "Helium",
-    "CartesioX"
-    ]
-
-    resumen_total['Fondo'] = pd.Categorical(
-    resumen_total['Fondo'],
-    categories=orden_fondos,
-    ordered=True
-    )
-
-    resumen_total = resumen_total.sort_values('Fondo')
-
-
-    #resumen_total = resumen_total.sort_values(by='Dinero Inv.', ascending=False)
-    
-
-    # Añadir las nuevas métricas a la tabla resumen
-    styled_resumen = resumen_total.style \
-        .map(color_total, subset=['Rendimiento (%)', 'Diferencia (€)']) \
-        .format({
-            'Dinero Inv.': formato_euro_es,
-            'Valor Actual Estimado': formato_euro_es,
-            'Diferencia (€)': formato_euro_es,
-            'Precio Medio Compra': formato_euro_es,
-            'Precio Actual': formato_euro_es,
-            'Rendimiento (%)': lambda x: f"{x:.2f}".replace(".", ",") + " %",
-            'Fecha Precio': lambda x: x
-        }) \
-        .set_properties(**{'text-align': 'center', 'font-weight': 'bold'})
-
-    altura_tabla = 35* len(resumen_total) +38
-    # Mostrar la tabla
-    st.dataframe(styled_resumen, use_container_width=True, hide_index=True,height=altura_tabla )
-    #st.table(styled_resumen.hide(axis="index"))
-    fig_rendimiento = px.bar(resumen_total,
-                                 x='Fondo',
-                                 y='Rendimiento (%)',
-                                 color='Rendimiento (%)',
-                                 color_continuous_scale='Viridis',  # Escala de colores atractiva
-                                 labels={'Rendimiento (%)': 'Rendimiento (%)'},
-                                 title="📊 Rendimiento por Fondo",
-                                 template="plotly_dark",  # Estilo oscuro para un diseño más moderno
-                                 height=800) # Mejorar el tamaño del gráfico
-                            
-
-    # Asegurar formato datetime
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-
-    # Agrupar por fecha y sumar valores
-    df_acumulado = df.groupby('Fecha').agg({
-        'Dinero Inv.': 'sum',
-        'Valor Actual Estimado': 'sum'
-    }).sort_index().cumsum().reset_index()
-    fig_acum = px.line(df_acumulado, x='Fecha',
-                       y=['Dinero Inv.', 'Valor Actual Estimado'],
-                       labels={'value': '€', 'variable': 'Indicador'},
-                       title=' ')
-
-    fig_acum.update_layout(
-        template="plotly_dark",
-        xaxis_title="Fecha",
-        yaxis_title="Euros (€)",
-        legend_title="Indicador",
-        showlegend=True
-    )
-    st.subheader("📈 Evolución Acumulada: Inversión vs Valor Actual")
-    st.plotly_chart(fig_acum, use_container_width=True)
-
-    st.subheader("🥧 Distribución de la inversión por fondo")
-    # Agrupar por fondo y sumar el dinero invertido
-    distribucion = df.groupby('Fondo')['Dinero Inv.'].sum().reset_index()
-
-    # Ordenar de mayor a menor
-    distribucion = distribucion.sort_values(by='Dinero Inv.', ascending=False)
-
-    # Crear gráfico tipo donut más estilizado
-    fig_pie = go.Figure(
-        data=[
-            go.Pie(
-                labels=distribucion['Fondo'],
-                values=distribucion['Dinero Inv.'],
-                hole=0.5,  # donut más marcado
-                textinfo='percent+label',
-                hovertemplate='%{label}<br>€%{value:,.2f} (%{percent})<extra></extra>',
-                marker=dict(colors=px.colors.sequential.RdBu, line=dict(color='white', width=2))
-            )
-        ]
-    )
-
-    fig_pie.update_layout(
-        title_text=' ',
-        title_font_size=20,
-        title_x=0.5,
-        showlegend=False,
-        margin=dict(t=60, b=0, l=0, r=0),
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
+    fecha_min = df_aportaciones['Fecha'].min().date()
+    fecha_max = df_aportaciones['Fecha'].max().date()
+    rango_fechas = col_filtro2.date_input(
+        "Rango de fechas", value=(fecha_min, fecha_max), min_value=fecha_min, max_value=fecha_max,
+        format="DD/MM/YYYY"
     )
 
-    # Mostrar en Streamlit
-    st.plotly_chart(fig_pie, use_container_width=True)
-
-    # Crear diccionario de precios actuales por fondo
-    precios_actuales = {}
-
-    for fondo, isin in isin_map.items():
-        try:
-            precio, _ = obtener_precio_y_fecha(isin)
-            if precio:
-                precios_actuales[fondo] = precio
-        except:
-            precios_actuales[fondo] = None
-
-   # ================== CALCULO DE VALOR ACTUAL POR APORTACIÓN ==================
-
-    # Mapear precio actual a cada fila
-    df['Precio Actual'] = df['Fondo'].map(precios_actuales)
-
-    # Evitar divisiones por 0 o NaN
-    df = df[df['Valor Compra'] > 0]
-
-    # Si algún fondo no tiene precio actual, usar precio de compra
-    df['Precio Actual'] = df['Precio Actual'].fillna(df['Valor Compra'])
-
-    # Calcular valor actual de cada aportación
-    df['Valor Actual Aportación'] = (df['Dinero Inv.'] / df['Valor Compra']) * df['Precio Actual']
-
-    # Rentabilidad %
-    df['Rentabilidad %'] = ((df['Valor Actual Aportación'] - df['Dinero Inv.']) / df['Dinero Inv.']) * 100
-
-    # Beneficio en €
-    df['Beneficio €'] = df['Valor Actual Aportación'] - df['Dinero Inv.']
-
-
-    # ================== HISTORIAL COMPLETO DE APORTACIONES ==================
+    filtro = pd.Series(True, index=df_aportaciones.index)
+    if fondos_filtro:
+        filtro &= df_aportaciones['Fondo'].isin(fondos_filtro)
+    if len(rango_fechas) == 2:
+        filtro &= df_aportaciones['Fecha'].between(
+            pd.Timestamp(rango_fechas[0]), pd.Timestamp(rango_fechas[1]) + pd.Timedelta(days=1), inclusive="left"
+        )
+    df_aportaciones = df_aportaciones[filtro]
 
-    st.subheader("📋 Historial completo de aportaciones")
+    col_pag1, col_pag2, col_pag3 = st.columns([1, 1, 2])
+    filas_por_pagina = col_pag1.selectbox("Filas por página", (25, 50, 100, 250), index=1)
+    total_paginas = max(1, -(-len(df_aportaciones) // filas_por_pagina))
+    pagina = col_pag2.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1)
+    col_pag3.caption(f"{len(df_aportaciones)} aportaciones · página {pagina} de {total_paginas}")
 
-    df_aportaciones = df.copy()
-    df_aportaciones['Fecha'] = pd.to_datetime(df_aportaciones['Fecha'])
-    df_aportaciones = df_aportaciones.sort_values('Fecha', ascending=False)
-    df_aportaciones['Fecha'] = df_aportaciones['Fecha'].dt.strftime("%d/%m/%Y")
+    # Solo la página visible se formatea y se envía al navegador
+    inicio_pagina = (pagina - 1) * filas_por_pagina
+    tabla_aportaciones = df_aportaciones.iloc[inicio_pagina:inicio_pagina + filas_por_pagina].copy()
+    tabla_aportaciones['Fecha'] = tabla_aportaciones['Fecha'].dt.strftime("%d/%m/%Y")
 
 
     # ================== COLORES ==================
 
-    def color_rentabilidad(val):
-        try:
-            val = float(val)
-            if val > 0:
-                return "color: #27ae60; font-weight: bold"   # verde
-            elif val < 0:
-                return "color: #c0392b; font-weight: bold"   # rojo
-        except:
-            pass
-        return "color: black"
+    def colores_rentabilidad(tabla):
+        # Estilos de toda la tabla de una vez según el signo de cada valor
+        return pd.DataFrame(
+            np.select(
+                [tabla > 0, tabla < 0],
+                ["color: #27ae60; font-weight: bold", "color: #c0392b; font-weight: bold"],  # verde, rojo
+                default="color: black"
+            ),
+            index=tabla.index, columns=tabla.columns
+        )
 
 
     # ================== TABLA FINAL ==================
 
-    tabla_aportaciones = df_aportaciones[['Fecha', 'Fondo', 'Dinero Inv.', 'Valor Compra',
-                                          'Precio Actual', 'Valor Actual Aportación',
-                                          'Beneficio €', 'Rentabilidad %']]
+    with metricas.tramo("tabla", tabla="historial"):
+        st.dataframe(
+            tabla_aportaciones.style
+            .format({
+                'Dinero Inv.': "{:,.2f} €",
+                'Valor Compra': "{:,.2f}",
+                'Precio Actual': "{:,.2f}",
+                'Valor Actual Aportación': "{:,.2f} €",
+                'Beneficio €': "{:,.2f} €",
+                'Rentabilidad %': "{:.2f} %"
+            })
+            .apply(colores_rentabilidad, axis=None, subset=['Rentabilidad %', 'Beneficio €']),
+            use_container_width=True,
+            hide_index=True
+        )
+
 
+@st.fragment
+def vista_escenarios(informe):
+    # Fragmento: mover los controles de un escenario solo recalcula los escenarios
+    nav = informe['nav']
+    resumen = informe['resumen']
+    valor_actual = resumen['Valor Actual Estimado'].sum()
+    if nav.empty:
+        st.info("No hay valores liquidativos guardados de los fondos para simular escenarios.")
+        return
+    nombres = {isin: nombre for nombre, isin in obtener_registro().mapa_isin.items() if isin in nav.columns}
+
+    st.subheader("🔀 ¿Y si todo hubiera ido a un solo fondo?")
+    with metricas.tramo("escenario", escenario="asignacion"):
+        alternativas = todo_en_un_fondo(informe.df, nav, nombres)
+    st.caption(f"Valor actual real de la cartera: {formato_euro_es(valor_actual)}. "
+               "Sin valor en los fondos sin valores liquidativos en alguna de las fechas de aportación.")
     st.dataframe(
-        tabla_aportaciones.style
-        .format({
-            'Dinero Inv.': "{:,.2f} €",
-            'Valor Compra': "{:,.2f}",
-            'Precio Actual': "{:,.2f}",
-            'Valor Actual Aportación': "{:,.2f} €",
-            'Beneficio €': "{:,.2f} €",
-            'Rentabilidad %': "{:.2f} %"
-        })
-        .map(color_rentabilidad, subset=['Rentabilidad %', 'Beneficio €']),
-        use_container_width=True,
-        hide_index=True
+        alternativas[['Fondo', 'Valor Final', 'Diferencia (€)', 'Rendimiento (%)']].style.format({
+            'Valor Final': formato_euro_es,
+            'Diferencia (€)': formato_euro_es,
+            'Rendimiento (%)': lambda x: f"{x:.2f}".replace(".", ",") + " %" if pd.notna(x) else "-",
+        }, na_rep="-"),
+        use_container_width=True, hide_index=True
     )
 
+    # Valor actual por ISIN; lo de los fondos sin valores liquidativos no se mueve
+    isin_fondo = resumen['Fondo'].astype(str).map(obtener_registro().mapa_isin)
+    valores = resumen['Valor Actual Estimado'].groupby(isin_fondo).sum().reindex(nav.columns, fill_value=0.0)
+    fijo = valor_actual - valores.sum()
+
+    st.subheader("⚡ Choque de precios")
+    col_choque1, col_choque2 = st.columns([1, 2])
+    choque = col_choque1.slider("Variación del precio (%)", -50, 50, -20, step=5)
+    afectados = col_choque2.multiselect(
+        "Fondos afectados", list(nav.columns), format_func=lambda isin: nombres.get(isin, isin),
+        placeholder="Todos los fondos"
+    )
+    choques = np.where(nav.columns.isin(afectados or list(nav.columns)), choque / 100, 0.0)
+    valor_choque = valor_con_choques(valores, choques)[0] + fijo
+    col1, col2 = st.columns(2)
+    col1.metric("💥 Valor con el choque", f"{valor_choque:.2f} €")
+    col2.metric("📌 Diferencia", f"{valor_choque - valor_actual:.2f} €")
+
+    st.subheader("🎲 Monte Carlo")
+    col_mc1, col_mc2 = st.columns(2)
+    anios = col_mc1.slider("Horizonte (años)", 1, 10, 1)
+    caminos = col_mc2.selectbox("Trayectorias", (1000, 10000, 50000), index=1)
+    with metricas.tramo("escenario", escenario="montecarlo"):
+        media, factor = modelo_rentabilidades(nav)
+        simulacion = montecarlo(valores.to_numpy(), media, factor, caminos=caminos, anios=anios, semilla=0, fijo=fijo)
+    fechas = nav.index[-1] + pd.to_timedelta(simulacion['dias'] * 365 / DIAS_ANIO, unit="D")
+    bandas = pd.DataFrame(simulacion['percentiles'].T, index=fechas, columns=[f"P{p}" for p in PERCENTILES])
+    finales = simulacion['finales']
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("📉 Percentil 5", f"{np.percentile(finales, 5):.2f} €")
+    col2.metric("📊 Mediana", f"{np.median(finales):.2f} €")
+    col3.metric("📈 Percentil 95", f"{np.percentile(finales, 95):.2f} €")
+    col4.metric("⚠️ Probabilidad de pérdida", f"{(finales < valor_actual).mean() * 100:.1f} %")
+    st.caption("Rentabilidades diarias normales correlacionadas estimadas con los últimos tres años de valores liquidativos.")
+    with metricas.tramo("grafico", grafico="montecarlo"):
+        st.plotly_chart(figura_montecarlo(bandas), use_container_width=True)
+
+
+@st.fragment
+def vista_rebalanceo(informe):
+    # Fragmento: editar los objetivos o el plan solo recalcula el rebalanceo
+    st.subheader("🎯 Pesos objetivo y rebalanceo")
+    resumen = informe['resumen']
+    objetivos = obtener_registro().objetivos()
+    # Fondos de la cartera y fondos con objetivo en el registro aunque aún no estén en ella
+    fondos = list(dict.fromkeys([*resumen['Fondo'].astype(str), *objetivos]))
+    valores = resumen.set_index(resumen['Fondo'].astype(str))['Valor Actual Estimado'].reindex(fondos, fill_value=0.0)
+    total = valores.sum()
+    if total <= 0 and not objetivos:
+        st.info("La cartera no tiene valor de mercado para calcular pesos.")
+        return
+    pesos = valores / total * 100 if total > 0 else valores * 0.0
+    # Objetivo inicial: el del registro o, si ningún fondo lo tiene, el peso actual
+    inicial = [objetivos.get(fondo, 0.0) for fondo in fondos] if objetivos else pesos.round(2).tolist()
+    editada = st.data_editor(
+        pd.DataFrame({'Fondo': fondos, 'Peso Actual (%)': pesos.to_numpy().round(2), 'Objetivo (%)': inicial}),
+        disabled=['Fondo', 'Peso Actual (%)'], hide_index=True, use_container_width=True
+    )
+    objetivo = editada['Objetivo (%)'].fillna(0).clip(lower=0).to_numpy()
+    if objetivo.sum() <= 0:
+        st.warning("Indica algún peso objetivo mayor que 0.")
+        return
+    if abs(objetivo.sum() - 100) > 0.01:
+        st.caption(f"Los objetivos suman {objetivo.sum():.2f} %; se reparten en proporción.")
+
+    col1, col2 = st.columns(2)
+    plan = col1.radio("Plan", ["Aportar", "Comprar y vender"], horizontal=True,
+                      help="Aportar solo compra (o, con un importe negativo, solo vende)")
+    importe = col2.number_input("Importe (€)", value=1000.0, step=100.0, help="Negativo para retirar")
+    try:
+        with metricas.tramo("rebalanceo"):
+            tabla = tabla_rebalanceo(
+                fondos, valores.to_numpy(), objetivo, importe, "aportar" if plan == "Aportar" else "compraventa"
+            )
+    except ValueError as e:
+        st.warning(str(e))
+        return
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("📐 Error de seguimiento actual", f"{error_seguimiento(tabla['Valor Actual'], objetivo):.2f} pp")
+    col2.metric("🎯 Error tras el plan", f"{error_seguimiento(tabla['Valor Final'], objetivo):.2f} pp")
+    compras = tabla['Movimiento (€)'].clip(lower=0).sum()
+    ventas = abs(tabla['Movimiento (€)'].clip(upper=0).sum())
+    col3.metric("🔁 Compras / ventas", f"{compras:.2f} € / {ventas:.2f} €")
+    st.caption("Pesos a valor de mercado. El error de seguimiento es la distancia entre los pesos y el objetivo, "
+               "en puntos porcentuales; el plan es el que lo deja en el mínimo posible.")
+    with metricas.tramo("grafico", grafico="pesos"):
+        st.plotly_chart(figura_pesos(tabla), use_container_width=True)
+    formato_pct = lambda x: f"{x:.2f}".replace(".", ",") + " %"
+    st.dataframe(
+        tabla.style.format({
+            'Valor Actual': formato_euro_es,
+            'Peso Actual (%)': formato_pct,
+            'Objetivo (%)': formato_pct,
+            'Desviación (%)': formato_pct,
+            'Desviación (€)': formato_euro_es,
+            'Movimiento (€)': formato_euro_es,
+            'Valor Final': formato_euro_es,
+            'Peso Final (%)': formato_pct,
+        }),
+        use_container_width=True, hide_index=True
+    )
 
 
+# Todos los precios de la vista desde la caché y el cálculo en el núcleo, común a las
+# dos vistas. El informe se calcula por etapas, solo las que pide la vista o la pestaña
+# abierta, y se reutiliza entre ejecuciones mientras no cambien el libro, los precios ni
+# los históricos guardados; estos solo se leen si hace falta la serie diaria
+isins = isins_del_libro(df)
+precios_fondos = obtener_precios(isins)
+informe = informe_de(
+    df, precios_fondos, lambda: obtener_historicos(isins, inicio=df['Fecha'].min()),
+    cartera=clave_cartera, version=version_historicos(isins)
+)
 
+if opcion_seleccionada == "Fondo Individual":
+    vista_fondo(informe)
 
+elif opcion_seleccionada == "Total de la Inversión":
+    st.subheader("📊 Resumen General de la Inversión")
 
+    for fondo in fondos_sin_isin(df):
+        st.warning(f"ISIN no definido para {fondo}")
+    for fondo, isin_fondo in fondos_sin_precio(df, precios_fondos):
+        st.warning(f"No se pudo obtener el precio de {fondo} ({isin_fondo})")
 
+    with metricas.tramo("informe"):
+        totales = informe['totales']
 
+    total_invertido = totales['invertido']
+    total_estimado = totales['estimado']
+    rendimiento_total = totales['rendimiento']
+    tir_total = totales['tir']
+    twr_total = totales['twr']
+    fecha_ult_actualizacion = totales['fecha_precios']
 
+    if fecha_ult_actualizacion:
+        st.caption(f"🕒 Última actualización de precios: {fecha_ult_actualizacion}")
 
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    col1.metric("📥 Total Invertido", f"{total_invertido:.2f} €")
+    col2.metric("📌 Valor Estimado", f"{total_estimado:.2f} €")
+    col3.metric("📌 Diferencia", f"{total_estimado-total_invertido:.2f} €")
+    col4.metric("📈 Rendimiento Total", f"{rendimiento_total:.2f} %")
+    col5.metric("📆 TIR anual", f"{tir_total:.2f} %" if pd.notna(tir_total) else "N/A")
+    col6.metric("⏱️ TWR", f"{twr_total:.2f} %" if pd.notna(twr_total) else "N/A")
+
+    # Solo se ejecuta el contenido de la pestaña abierta; cambiar de pestaña vuelve a
+    # ejecutar el script, que reutiliza el informe ya calculado
+    (pestana_resumen, pestana_evolucion, pestana_distribucion, pestana_historial, pestana_escenarios,
+     pestana_riesgo) = st.tabs(
+        ["📊 Detalle por Fondo", "📈 Evolución", "🥧 Distribución", "📋 Historial", "🧪 Escenarios", "📉 Riesgo"],
+        on_change="rerun", key="pestana_total"
+    )
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    if pestana_resumen.open:
+        with pestana_resumen:
+            resumen_total = informe['resumen']
+
+            def color_total(val):
+                try:
+                    val = float(val)
+                    if val > 0:
+                        return 'color: green'
+                    elif val < 0:
+                        return 'color: red'
+                    else:
+                        return 'color: black'
+                except:
+                    return 'color: gray'
+
+            # Añadir las nuevas métricas a la tabla resumen
+            styled_resumen = resumen_total[COLUMNAS_RESUMEN + ['TIR (%)', 'TWR (%)']].style \
+                .map(color_total, subset=['Rendimiento (%)', 'Diferencia (€)', 'TIR (%)', 'TWR (%)']) \
+                .format({
+                    'Dinero Inv.': formato_euro_es,
+                    'Valor Actual Estimado': formato_euro_es,
+                    'Diferencia (€)': formato_euro_es,
+                    'Precio Medio Compra': formato_euro_es,
+                    'Precio Actual': formato_euro_es,
+                    'Rendimiento (%)': lambda x: f"{x:.2f}".replace(".", ",") + " %",
+                    'TIR (%)': lambda x: f"{x:.2f}".replace(".", ",") + " %" if pd.notna(x) else "-",
+                    'TWR (%)': lambda x: f"{x:.2f}".replace(".", ",") + " %" if pd.notna(x) else "-",
+                    'Fecha Precio': lambda x: x
+                }) \
+                .set_properties(**{'text-align': 'center', 'font-weight': 'bold'})
+
+            altura_tabla = 35* len(resumen_total) +38
+            # Mostrar la tabla
+            with metricas.tramo("tabla", tabla="resumen"):
+                st.dataframe(styled_resumen, use_container_width=True, hide_index=True,height=altura_tabla )
+
+    if pestana_evolucion.open:
+        with pestana_evolucion:
+            # Las figuras se reutilizan mientras no cambian sus datos; la serie diaria se reduce
+            # a unos cientos de puntos antes de enviarla al navegador
+            st.subheader("📈 Evolución Acumulada: Inversión vs Valor Actual")
+            with metricas.tramo("grafico", grafico="acumulado"):
+                st.plotly_chart(figura_acumulada(informe['diario']), use_container_width=True)
+
+    if pestana_distribucion.open:
+        with pestana_distribucion:
+            st.subheader("🥧 Distribución de la inversión por fondo")
+            # Dinero invertido por fondo del resumen, de mayor a menor
+            distribucion = informe['resumen'][['Fondo', 'Dinero Inv.']].sort_values(by='Dinero Inv.', ascending=False)
+
+            # Mostrar en Streamlit
+            with metricas.tramo("grafico", grafico="distribucion"):
+                st.plotly_chart(figura_distribucion(distribucion), use_container_width=True)
+
+            vista_rebalanceo(informe)
+
+    if pestana_historial.open:
+        with pestana_historial:
+            st.subheader("📋 Historial completo de aportaciones")
+            tabla_historial(informe['historial'])
+
+    if pestana_escenarios.open:
+        with pestana_escenarios:
+            vista_escenarios(informe)
+
+    if pestana_riesgo.open:
+        with pestana_riesgo:
+            st.subheader("📉 Riesgo por fondo y de la cartera")
+            # Métricas y correlaciones de todos los fondos en una pasada, memorizadas con el informe
+            riesgo_fondos, correlacion = informe['riesgo']
+            nombres_isin = {isin: nombre for nombre, isin in obtener_registro().mapa_isin.items()}
+            riesgo_fondos = riesgo_fondos.rename(index=nombres_isin).rename_axis('Fondo').reset_index()
+            correlacion = correlacion.rename(index=nombres_isin, columns=nombres_isin)
+            if not (riesgo_fondos['Observaciones'] >= 2).any():
+                st.info("No hay valores liquidativos suficientes para calcular el riesgo.")
+            else:
+                formato_pct = lambda x: f"{x:.2f}".replace(".", ",") + " %" if pd.notna(x) else "-"
+
+                def color_signo(val):
+                    if pd.isna(val):
+                        return 'color: gray'
+                    return 'color: green' if val > 0 else 'color: red' if val < 0 else 'color: black'
+
+                with metricas.tramo("tabla", tabla="riesgo"):
+                    st.dataframe(
+                        riesgo_fondos.style
+                        .map(color_signo, subset=['Rentabilidad Anual (%)', 'Sharpe'])
+                        .format({
+                            'Volatilidad (%)': formato_pct,
+                            'Rentabilidad Anual (%)': formato_pct,
+                            'Máxima Caída (%)': formato_pct,
+                            'Sharpe': lambda x: f"{x:.2f}".replace(".", ",") if pd.notna(x) else "-",
+                            'Duración Caída (días)': lambda x: f"{x:.0f}" if pd.notna(x) else "-",
+                        }),
+                        use_container_width=True, hide_index=True
+                    )
+                st.caption(
+                    f"Con rentabilidades logarítmicas diarias; {COLUMNA_CARTERA} descuenta las aportaciones. "
+                    f"Sharpe con una tasa libre de riesgo del {TASA_LIBRE_RIESGO:.2f} % anual. "
+                    "La duración de la caída va del máximo anterior a la recuperación (o a hoy), en días hábiles."
+                )
+                st.subheader("🔗 Correlación entre fondos")
+                with metricas.tramo("grafico", grafico="correlacion"):
+                    st.plotly_chart(figura_correlacion(correlacion), use_container_width=True)
+
+
+# ================== DIAGNÓSTICO ==================
+
+metricas.anotar_tramo("ejecucion", time.perf_counter() - inicio_ejecucion, vista=opcion_seleccionada)
+
+if st.sidebar.checkbox("🩺 Diagnóstico", value=False):
+    def _tabla_metricas(filas):
+        tabla = pd.DataFrame(filas)
+        if not tabla.empty:
+            tabla['etiquetas'] = tabla['etiquetas'].map(lambda e: ", ".join(f"{k}={v}" for k, v in e.items()))
+        return tabla
+
+    st.sidebar.caption("Duración por etapa (s): p50 y p95 de las últimas ejecuciones")
+    st.sidebar.dataframe(
+        _tabla_metricas(metricas.tramos()).drop(columns=['total'], errors='ignore').round(4),
+        hide_index=True
+    )
+    st.sidebar.caption("Cachés")
+    st.sidebar.dataframe(_tabla_metricas(metricas.contadores()), hide_index=True)
+    st.sidebar.caption("HTTP por host")
+    st.sidebar.dataframe(
+        pd.DataFrame.from_dict(cliente.estadisticas(), orient='index').round(3)
+    )
+    st.sidebar.caption("Fuentes de precios")
+    st.sidebar.dataframe(pd.DataFrame.from_dict(salud.estadisticas(), orient='index').round(3))
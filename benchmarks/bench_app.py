@@ -0,0 +1,132 @@
+# Rendimiento del script completo de Streamlit sin red, con respuestas HTTP grabadas:
+# tiempo de la primera ejecución (caché vacía) y de una ejecución posterior, número de
+# peticiones HTTP y pico de memoria del proceso.
+#
+#   python benchmarks/bench_app.py [--latencia 0.2] [--fallos 0.1] [--repeticiones 3]
+#   python benchmarks/bench_app.py --grabar        # graba antes las respuestas reales
+#
+# Sin grabaciones previas se generan unas sintéticas: el Fondos.xlsx incluido como libro
+# de Drive y páginas de FT y Morningstar como las de bench_extraccion para cada fondo.
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from configuracion import DIRECTORIO_CACHE  # noqa: E402
+
+# Junto a las demás cachés (FONDOS_CACHE_DIR); absoluta porque la medida se hace en un
+# proceso hijo que arranca en RAIZ
+GRABACIONES = os.path.abspath(os.path.join(DIRECTORIO_CACHE, "grabaciones_bench"))
+APP = os.path.join(RAIZ, "app.py")
+
+
+def grabaciones_sinteticas(directorio):
+    from bench_extraccion import pagina_ft, pagina_morningstar
+    from cartera import URL_LIBRO
+    from grabacion import guardar_grabacion
+    from registro import obtener_registro
+
+    html = {"Content-Type": "text/html; charset=utf-8"}
+    with open(os.path.join(RAIZ, "Fondos.xlsx"), "rb") as f:
+        guardar_grabacion(directorio, "GET", URL_LIBRO, 200, {"ETag": '"libro-1"'}, f.read())
+    ft, morningstar = pagina_ft().encode(), pagina_morningstar().encode()
+    registro = obtener_registro()
+    for isin in registro.isins():
+        for proveedor, cuerpo in (("ft", ft), ("morningstar", morningstar)):
+            url = registro.url(isin, proveedor)
+            if url:
+                guardar_grabacion(directorio, "GET", url, 200, html, cuerpo)
+
+
+def _esperar(condicion, plazo):
+    limite = time.monotonic() + plazo
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.05)
+
+
+def medir():
+    # Se ejecuta en un proceso nuevo con la caché vacía (ver ejecutar)
+    from streamlit.testing.v1 import AppTest
+
+    import actualizador
+    from cliente_http import cliente
+
+    resultado = {}
+    inicio = time.perf_counter()
+    app = AppTest.from_file(APP, default_timeout=300)
+    app.run()
+    resultado["frio"] = time.perf_counter() - inicio
+    resultado["peticiones_frio"] = cliente.adaptador.peticiones
+    resultado["errores"] = len(app.exception)
+
+    # La actualización en segundo plano termina antes de la segunda ejecución
+    _esperar(lambda: not actualizador.calentando(), 120)
+    antes = cliente.adaptador.peticiones
+    inicio = time.perf_counter()
+    app.run()
+    resultado["templado"] = time.perf_counter() - inicio
+    resultado["peticiones_templado"] = cliente.adaptador.peticiones - antes
+    resultado["peticiones_fondo"] = antes - resultado["peticiones_frio"]
+    resultado["errores"] += len(app.exception)
+    resultado["pico_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(resultado))
+
+
+def ejecutar(args, modo="reproducir"):
+    with tempfile.TemporaryDirectory() as cache:
+        entorno = dict(
+            os.environ,
+            FONDOS_CACHE_DIR=cache,
+            FONDOS_HTTP_MODO=modo,
+            FONDOS_HTTP_GRABACIONES=args.grabaciones,
+            FONDOS_HTTP_LATENCIA=str(args.latencia),
+            FONDOS_HTTP_FALLOS=str(args.fallos),
+        )
+        salida = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--medir"],
+            env=entorno, cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grabaciones", default=GRABACIONES)
+    parser.add_argument("--grabar", action="store_true", help="graba las respuestas reales antes de medir")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por petición reproducida")
+    parser.add_argument("--fallos", type=float, default=0.0, help="proporción de peticiones que fallan")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--medir", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        medir()
+        return
+    if args.grabar:
+        ejecutar(args, modo="grabar")
+    elif not os.path.isdir(args.grabaciones) or not os.listdir(args.grabaciones):
+        grabaciones_sinteticas(args.grabaciones)
+
+    resultados = [ejecutar(args) for _ in range(args.repeticiones)]
+    print(f"app.py con grabaciones de {args.grabaciones}")
+    print(f"latencia {args.latencia:.2f} s por petición, {args.fallos:.0%} de fallos, {args.repeticiones} repeticiones")
+    for campo, unidad in (
+        ("frio", "s"), ("templado", "s"), ("peticiones_frio", ""), ("peticiones_fondo", ""),
+        ("peticiones_templado", ""), ("pico_mb", "MB"), ("errores", ""),
+    ):
+        valores = [r[campo] for r in resultados]
+        print(f"  {campo:22s} mediana {statistics.median(valores):9.2f} {unidad:2s}  (mín {min(valores):.2f}, máx {max(valores):.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Escenarios sobre un libro y valores liquidativos sintéticos: asignaciones alternativas,
+# choques de precio y Monte Carlo de 10k trayectorias. Como referencia, las asignaciones
+# también se evalúan con un bucle por escenario sobre las aportaciones.
+#
+#   python benchmarks/bench_escenarios.py [--fondos 15] [--anios 10] [--aportaciones 10000]
+#                                         [--escenarios 10000] [--caminos 10000]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import escenarios  # noqa: E402
+
+# Escenarios que se evalúan con el bucle de referencia (el resto se extrapola)
+ESCENARIOS_BUCLE = 100
+
+
+def datos_sinteticos(fondos, anios, aportaciones, semilla=0):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.bdate_range(end="2026-10-16", periods=anios * escenarios.DIAS_ANIO, name="Fecha")
+    rentabilidades = rng.normal(0.0003, rng.uniform(0.005, 0.02, fondos), (len(fechas), fondos))
+    nav = pd.DataFrame(100 * np.exp(np.cumsum(rentabilidades, axis=0)), index=fechas,
+                       columns=[f"ISIN{i:03d}" for i in range(fondos)])
+    libro = pd.DataFrame({
+        "Fecha": fechas[rng.integers(0, len(fechas), aportaciones)],
+        "Dinero Inv.": rng.integers(50, 1000, aportaciones).astype("float64"),
+    })
+    valores = rng.uniform(1000, 20000, fondos)
+    return nav, libro, valores
+
+
+def asignaciones_en_bucle(libro, nav, pesos):
+    # Referencia: cada escenario recorre las aportaciones y compra participaciones del reparto
+    ultimo = nav.iloc[-1].to_numpy()
+    filas = nav.index.searchsorted(libro["Fecha"], side="right") - 1
+    precios = nav.to_numpy()
+    resultado = []
+    for reparto in pesos:
+        participaciones = np.zeros(nav.shape[1])
+        for fila, importe in zip(filas, libro["Dinero Inv."]):
+            participaciones += importe * reparto / precios[fila]
+        resultado.append(participaciones @ ultimo)
+    return np.array(resultado)
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fondos", type=int, default=15)
+    parser.add_argument("--anios", type=int, default=10)
+    parser.add_argument("--aportaciones", type=int, default=10000)
+    parser.add_argument("--escenarios", type=int, default=10000)
+    parser.add_argument("--caminos", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    nav, libro, valores = datos_sinteticos(args.fondos, args.anios, args.aportaciones)
+    rng = np.random.default_rng(1)
+    pesos = rng.dirichlet(np.ones(args.fondos), args.escenarios)
+    choques = rng.uniform(-0.5, 0.2, (args.escenarios, args.fondos))
+    print(f"{args.fondos} fondos, {len(nav)} días, {args.aportaciones} aportaciones, "
+          f"{args.caminos} caminos, mediana de {args.repeticiones}")
+
+    t, crecimiento = medir(lambda: escenarios.crecimiento_por_fondo(libro, nav), args.repeticiones)
+    print(f"  {'todo en un fondo (' + str(args.fondos) + ' escenarios)':42s}{t * 1000:9.2f} ms")
+    t, vectorizado = medir(lambda: escenarios.valor_asignaciones(
+        escenarios.crecimiento_por_fondo(libro, nav), pesos), args.repeticiones)
+    print(f"  {str(args.escenarios) + ' asignaciones':42s}{t * 1000:9.2f} ms")
+    t_bucle, en_bucle = medir(lambda: asignaciones_en_bucle(libro, nav, pesos[:ESCENARIOS_BUCLE]), 1)
+    print(f"  {str(ESCENARIOS_BUCLE) + ' asignaciones en bucle (referencia)':42s}{t_bucle * 1000:9.2f} ms "
+          f"(~{t_bucle * args.escenarios / ESCENARIOS_BUCLE:.1f} s para {args.escenarios})")
+    assert np.allclose(vectorizado[:ESCENARIOS_BUCLE], en_bucle)
+
+    t, _ = medir(lambda: escenarios.valor_con_choques(valores, choques), args.repeticiones)
+    print(f"  {str(args.escenarios) + ' choques de precio':42s}{t * 1000:9.2f} ms")
+
+    t, (media, factor) = medir(lambda: escenarios.modelo_rentabilidades(nav), args.repeticiones)
+    print(f"  {'modelo de rentabilidades':42s}{t * 1000:9.2f} ms")
+    for anios, pasos in ((1, escenarios.PASOS_MONTECARLO), (10, escenarios.PASOS_MONTECARLO), (1, escenarios.DIAS_ANIO)):
+        t, simulacion = medir(lambda: escenarios.montecarlo(
+            valores, media, factor, args.caminos, anios, pasos, semilla=0), args.repeticiones)
+        print(f"  {'Monte Carlo, ' + str(anios) + ' años, ' + str(pasos) + ' pasos':42s}{t * 1000:9.2f} ms  "
+              f"(mediana final {np.median(simulacion['finales']):,.0f} €)")
+
+
+if __name__ == "__main__":
+    main()
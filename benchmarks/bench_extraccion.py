@@ -0,0 +1,131 @@
+# Micro-benchmark de la extracción de precio y fecha de las páginas de FT y Morningstar:
+# árbol completo de BeautifulSoup (método anterior) frente a extraccion.extraer_*.
+# Mide tiempo de CPU por página y el aumento del pico de memoria (RSS) del proceso.
+#
+#   python benchmarks/bench_extraccion.py [--ft pagina_ft.html] [--morningstar pagina_ms.html]
+#
+# Sin argumentos usa páginas sintéticas con la estructura de las reales (cabecera con
+# scripts, tabla de históricos de un año y pie), de unos cientos de KB.
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import extraccion  # noqa: E402
+
+
+def _relleno(kb):
+    script = "<script>window.__datos = {" + ",".join(f'"k{i}": {i}' for i in range(200)) + "};</script>\n"
+    menu = "<ul class='nav'>" + "".join(f"<li><a href='/s/{i}'>Sección {i}</a></li>" for i in range(50)) + "</ul>\n"
+    bloque = script + menu
+    return bloque * max(1, kb * 1024 // len(bloque))
+
+
+def pagina_ft():
+    filas = "".join(
+        f"<tr><td><span>Friday, October {i % 28 + 1}, 2025</span></td><td>{100 + i / 7:.2f}</td>"
+        f"<td>{101 + i / 7:.2f}</td><td>{99 + i / 7:.2f}</td><td>{100 + i / 7:.2f}</td><td>----</td></tr>"
+        for i in range(260)
+    )
+    return (
+        "<html><head><title>Tearsheet</title>" + _relleno(150) + "</head><body>"
+        "<div class='mod-tearsheet-overview__quote'><ul class='mod-tearsheet-overview__quote__bar'>"
+        "<li><span class='mod-ui-data-list__label'>Price (EUR)</span>"
+        "<span class='mod-ui-data-list__value'>1,234.56</span></li>"
+        "<li><span class='mod-ui-data-list__label'>Today's Change</span>"
+        "<span class='mod-ui-data-list__value'>0.12 / 0.01%</span></li></ul>"
+        "<div class='mod-disclaimer'>Data delayed at least 15 minutes, as of Oct 16 2026.</div></div>"
+        "<table class='mod-ui-table'>" + filas + "</table>" + _relleno(150) + "</body></html>"
+    )
+
+
+def pagina_morningstar():
+    return (
+        "<html><head><title>Snapshot</title>" + _relleno(120) + "</head><body>"
+        "<div id='overviewQuickstatsDiv'><table class='snapshotTextColor snapshotTextFontStyle snapshotTable'>"
+        "<tr><td class='titleBarHeading' colspan='3'>Quick Stats</td></tr>"
+        "<tr><td class='line heading'>NAV<br /><span class='heading'>16/10/2026</span></td>"
+        "<td class='line'>&nbsp;</td><td class='line text'>EUR&nbsp;12.34</td></tr>"
+        "</table></div>" + _relleno(200) + "</body></html>"
+    )
+
+
+def con_beautifulsoup(html, campos):
+    soup = BeautifulSoup(html, "lxml")
+    return {
+        campo: (nodo.text if (nodo := soup.find(etiqueta, class_=clase)) else None)
+        for campo, (etiqueta, clase) in campos.items()
+    }
+
+
+def con_extraccion(html, campos):
+    return extraccion.extraer_textos(html, campos)
+
+
+METODOS = {"beautifulsoup": con_beautifulsoup, "extraccion": con_extraccion}
+
+
+def pico_memoria(metodo, pagina, args):
+    # Intérprete nuevo por medida para que el pico de un método no oculte el del otro
+    orden = [sys.executable, os.path.abspath(__file__), "--medir-memoria", metodo, pagina]
+    for opcion in ("ft", "morningstar"):
+        if getattr(args, opcion):
+            orden += [f"--{opcion}", getattr(args, opcion)]
+    salida = subprocess.run(orden, capture_output=True, text=True, check=True).stdout
+    return float(salida)
+
+
+def tiempo_cpu(metodo, html, campos, repeticiones):
+    funcion = METODOS[metodo]
+    inicio = time.process_time()
+    for _ in range(repeticiones):
+        resultado = funcion(html, campos)
+    return (time.process_time() - inicio) / repeticiones, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ft", help="página de FT guardada")
+    parser.add_argument("--morningstar", help="página de Morningstar guardada")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--medir-memoria", nargs=2, metavar=("METODO", "PAGINA"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    def leer(ruta, por_defecto):
+        if not ruta:
+            return por_defecto()
+        with open(ruta, encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    paginas = {
+        "FT": (leer(args.ft, pagina_ft), extraccion.CAMPOS_FT),
+        "Morningstar": (leer(args.morningstar, pagina_morningstar), extraccion.CAMPOS_MORNINGSTAR),
+    }
+    if args.medir_memoria:
+        metodo, pagina = args.medir_memoria
+        html, campos = paginas[pagina]
+        antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        METODOS[metodo](html, campos)
+        print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - antes) / 1024)
+        return
+
+    # El pico de RSS se hereda en los procesos hijos: se mide antes de cronometrar nada
+    picos = {(nombre, metodo): pico_memoria(metodo, nombre, args) for nombre in paginas for metodo in METODOS}
+    for nombre, (html, campos) in paginas.items():
+        print(f"{nombre}: página de {len(html) / 1024:.0f} KB")
+        for metodo in METODOS:
+            segundos, resultado = tiempo_cpu(metodo, html, campos, args.repeticiones)
+            mb = picos[nombre, metodo]
+            print(f"  {metodo:14s} {segundos * 1000:8.2f} ms CPU/página  +{mb:6.1f} MB pico  {resultado}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Compara los motores de lectura del libro de aportaciones sobre Fondos.xlsx
+# ampliado a 100k filas.
+#
+#   python benchmarks/bench_lectura_excel.py [--filas 100000] [--repeticiones 3]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import aportaciones  # noqa: E402
+
+
+def libro_ampliado(filas):
+    base = pd.read_excel(os.path.join(RAIZ, "Fondos.xlsx"))
+    repeticiones = -(-filas // len(base))
+    df = pd.concat([base] * repeticiones, ignore_index=True).iloc[:filas]
+    # Fechas y precios distintos en cada bloque para que no sea un libro trivial
+    bloque = np.arange(len(df)) // len(base)
+    df["Fecha"] = df["Fecha"] + pd.to_timedelta(bloque % 3650, unit="D")
+    df["Valor Compra"] = df["Valor Compra"] * (1 + (bloque % 100) / 1000)
+    ruta = os.path.join(tempfile.gettempdir(), f"fondos_{filas}.xlsx")
+    if not os.path.exists(ruta):
+        df.to_excel(ruta, index=False)
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    contenido = libro_ampliado(args.filas)
+    print(f"Libro de {args.filas} filas ({len(contenido) / 1e6:.1f} MB)")
+
+    def base():
+        return pd.read_excel(BytesIO(contenido), engine="openpyxl")
+
+    segundos, _ = medir(base, args.repeticiones)
+    print(f"{'read_excel openpyxl (actual)':32s} {segundos:8.3f} s")
+    referencia = segundos
+
+    for motor in aportaciones.MOTORES:
+        try:
+            segundos, df = medir(lambda: aportaciones.leer_libro(contenido, motor), args.repeticiones)
+        except ImportError as e:
+            print(f"{motor:32s} no disponible ({e})")
+            continue
+        print(f"{motor:32s} {segundos:8.3f} s  x{referencia / segundos:5.1f}  ({len(df)} filas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Memoria del libro de aportaciones y tiempo de una reejecución de la vista total con
+# un libro de 1M de filas: representación anterior (nombre del fondo como texto, columna
+# 'Fecha Formateada' y copia completa del libro en cada ejecución) frente al esquema
+# normalizado de aportaciones (fondo categórico y copia superficial).
+#
+# Como referencia también se mide un esquema aún más compacto (día como int32 e importes
+# en float32) y el error que introduce float32 en el total invertido.
+#
+#   python benchmarks/bench_libro.py [--filas 1000000] [--repeticiones 3]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aportaciones import _normalizar  # noqa: E402
+from bench_valoracion import datos_sinteticos  # noqa: E402
+from cartera import calcular_informe  # noqa: E402
+from registro import obtener_registro  # noqa: E402
+
+
+def megas(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def informe_completo(df, precios):
+    # Todas las etapas del informe, como la vista total antes de separarla en pestañas
+    informe = calcular_informe(df, precios)
+    return informe["totales"], informe["resumen"], informe["historial"]
+
+
+def reejecucion_anterior(libro, precios):
+    df = libro.copy()
+    df["Fecha Formateada"] = df["Fecha"].dt.strftime("%d/%m/%Y")
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+    return informe_completo(df, precios)
+
+
+def reejecucion_actual(libro, precios):
+    return informe_completo(libro.copy(deep=False), precios)
+
+
+def medir(funcion, repeticiones, *args):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    df, _, precios = datos_sinteticos(args.filas)
+    # Fondos del registro para que la valoración use sus ISIN
+    registro = obtener_registro()
+    nombres = registro.orden()[:len(precios)]
+    df["Fondo"] = df["Fondo"].map({f"Fondo {i}": nombre for i, nombre in enumerate(nombres)})
+    precios = {registro.isin(nombre): precio for nombre, precio in zip(nombres, precios.values())}
+    # Importes con céntimos, como los reales
+    df["Dinero Inv."] = (df["Dinero Inv."] * 1.0137).round(2)
+    anterior = df.astype({"Fondo": "str"})
+    actual = _normalizar(df)
+    compacto = actual.assign(
+        Fecha=(actual["Fecha"] - pd.Timestamp("1970-01-01")).dt.days.astype("int32"),
+        **{c: actual[c].astype("float32") for c in ("Dinero Inv.", "Valor Compra")},
+    )
+
+    print(f"Libro de {args.filas} filas, {actual['Fondo'].nunique()} fondos")
+    con_formato = anterior.assign(**{"Fecha Formateada": anterior["Fecha"].dt.strftime("%d/%m/%Y")})
+    for nombre, tabla in (
+        ("anterior (texto + fecha formateada)", con_formato),
+        ("anterior sin fecha formateada", anterior),
+        ("normalizado (fondo categórico)", actual),
+        ("compacto (int32 + float32)", compacto),
+    ):
+        print(f"  {nombre:38s} {megas(tabla):8.1f} MB")
+
+    exacto = actual["Dinero Inv."].sum()
+    importes = compacto["Dinero Inv."].to_numpy()
+    suma = abs(float(np.sum(importes, dtype="float32")) - exacto)
+    acumulada = abs(float(np.cumsum(importes, dtype="float32")[-1]) - exacto)
+    print(f"  error en float32 sobre {exacto:,.2f} €: suma {suma:.2f} €, suma acumulada {acumulada:.2f} €")
+
+    t_anterior = medir(reejecucion_anterior, args.repeticiones, anterior, precios)
+    t_actual = medir(reejecucion_actual, args.repeticiones, actual, precios)
+    print("Reejecución de la vista total (mediana)")
+    print(f"  anterior   {t_anterior:7.3f} s")
+    print(f"  actual     {t_actual:7.3f} s   x{t_anterior / t_actual:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Plan de aportación hacia pesos objetivo para universos de 10 a 100k fondos: proyección
+# exacta de rebalanceo frente a un reparto voraz por tramos (cada tramo al fondo más
+# por debajo de su objetivo), con el tiempo y el error de seguimiento resultante.
+#
+#   python benchmarks/bench_rebalanceo.py [--importe 10000] [--tramo 10] [--repeticiones 5]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import rebalanceo  # noqa: E402
+
+UNIVERSOS = (10, 1_000, 100_000)
+# El reparto voraz solo se mide hasta este número de fondos
+MAX_FONDOS_VORAZ = 1_000
+
+
+def cartera_sintetica(fondos, semilla=0):
+    rng = np.random.default_rng(semilla)
+    valores = rng.lognormal(8, 1, fondos)
+    objetivo = rng.dirichlet(np.ones(fondos))
+    return valores, objetivo
+
+
+def voraz(valores, objetivo, importe, tramo):
+    # Referencia: el importe en tramos, cada uno al fondo con más déficit en ese momento
+    deficit = objetivo * (valores.sum() + importe) - valores
+    compra = np.zeros_like(valores)
+    for _ in range(int(importe // tramo)):
+        compra[np.argmax(deficit - compra)] += tramo
+    return compra
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--importe", type=float, default=10_000)
+    parser.add_argument("--tramo", type=float, default=10)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Aportación de {args.importe:,.0f} € (voraz en tramos de {args.tramo:g} €), mediana de {args.repeticiones}")
+    for fondos in UNIVERSOS:
+        valores, objetivo = cartera_sintetica(fondos)
+        t, plan = medir(lambda: rebalanceo.plan_rebalanceo(valores, objetivo, args.importe), args.repeticiones)
+        assert np.isclose(plan.sum(), args.importe) and (plan >= 0).all()
+        error = rebalanceo.error_seguimiento(valores + plan, objetivo)
+        linea = f"  {fondos:>7} fondos  exacto {t * 1000:8.2f} ms  error {error:.6f} pp"
+        if fondos <= MAX_FONDOS_VORAZ:
+            t_voraz, compra = medir(lambda: voraz(valores, objetivo, args.importe, args.tramo), 1)
+            error_voraz = rebalanceo.error_seguimiento(valores + compra, objetivo)
+            linea += f"   voraz {t_voraz * 1000:8.2f} ms  error {error_voraz:.6f} pp"
+        print(linea)
+
+        t, plan = medir(lambda: rebalanceo.plan_rebalanceo(valores, objetivo, 0.0, "compraventa"), args.repeticiones)
+        print(f"  {'':>7}         compraventa {t * 1000:8.2f} ms  "
+              f"error {rebalanceo.error_seguimiento(valores + plan, objetivo):.6f} pp")
+
+
+if __name__ == "__main__":
+    main()
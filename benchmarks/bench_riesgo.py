@@ -0,0 +1,86 @@
+# Métricas de riesgo (volatilidad, rentabilidad anual, Sharpe, máxima caída y su duración,
+# correlaciones) sobre una matriz sintética de valores liquidativos de cientos de fondos y
+# 20 años de días hábiles, con fondos que empiezan en fechas distintas. Como referencia,
+# las mismas métricas con pandas fondo a fondo y DataFrame.corr.
+#
+#   python benchmarks/bench_riesgo.py [--fondos 500] [--anios 20] [--repeticiones 5]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import riesgo  # noqa: E402
+
+
+def nav_sintetica(fondos, anios, semilla=0):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.bdate_range(end="2026-10-16", periods=anios * riesgo.DIAS_ANIO, name="Fecha")
+    # Un factor de mercado común más ruido propio de cada fondo
+    mercado = rng.normal(0.0003, 0.01, (len(fechas), 1))
+    rentabilidades = rng.uniform(0.2, 1.2, fondos) * mercado + rng.normal(0, 0.005, (len(fechas), fondos))
+    nav = 100 * np.exp(np.cumsum(rentabilidades, axis=0))
+    # Fondos lanzados a lo largo del periodo
+    inicios = rng.integers(0, len(fechas) // 2, fondos)
+    nav[np.arange(len(fechas))[:, None] < inicios] = np.nan
+    return pd.DataFrame(nav, index=fechas, columns=[f"ISIN{i:03d}" for i in range(fondos)])
+
+
+def con_pandas(nav):
+    # Referencia: una serie por fondo con las operaciones habituales de pandas
+    filas = {}
+    for isin in nav.columns:
+        precios = nav[isin].dropna()
+        rentabilidades = np.log(precios).diff().dropna()
+        caida = precios / precios.cummax() - 1
+        fondo = caida.to_numpy().argmin()
+        pico = np.flatnonzero(caida.to_numpy()[:fondo + 1] >= 0)[-1]
+        recuperado = np.flatnonzero(caida.to_numpy()[fondo:] >= 0)
+        fin = fondo + recuperado[0] if len(recuperado) else len(precios) - 1
+        filas[isin] = {
+            "Volatilidad (%)": rentabilidades.std() * np.sqrt(riesgo.DIAS_ANIO) * 100,
+            "Máxima Caída (%)": caida.min() * 100,
+            "Duración Caída (días)": fin - pico,
+        }
+    return pd.DataFrame.from_dict(filas, orient="index"), np.log(nav).diff().corr()
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fondos", type=int, default=500)
+    parser.add_argument("--anios", type=int, default=20)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    nav = nav_sintetica(args.fondos, args.anios)
+    print(f"{args.fondos} fondos × {len(nav)} días, mediana de {args.repeticiones}")
+
+    t, (tabla, correlacion) = medir(lambda: riesgo.metricas_riesgo(nav), args.repeticiones)
+    print(f"  vectorizado                {t * 1000:9.1f} ms")
+    t_pandas, (referencia, correlacion_pandas) = medir(lambda: con_pandas(nav), 1)
+    print(f"  pandas fondo a fondo       {t_pandas * 1000:9.1f} ms   x{t_pandas / t:.1f}")
+
+    for columna in referencia.columns:
+        assert np.allclose(tabla[columna], referencia[columna]), columna
+    diferencia = np.nanmax(np.abs(correlacion.to_numpy() - correlacion_pandas.to_numpy()))
+    print(f"  diferencia máxima con DataFrame.corr: {diferencia:.1e}")
+
+
+if __name__ == "__main__":
+    main()
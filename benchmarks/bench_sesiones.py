@@ -0,0 +1,150 @@
+# Prueba de carga: N sesiones simultáneas de la aplicación repartidas entre K carteras
+# distintas, con las respuestas HTTP grabadas de bench_app (sin red).
+#
+#   python benchmarks/bench_sesiones.py [--sesiones 50] [--carteras 5] [--latencia 0.2]
+#
+# Primero N refrescos simultáneos de precios con la caché vacía (lo que hace el
+# actualizador de N procesos al arrancar) y después N sesiones de Streamlit a la vez. Cuenta las peticiones HTTP por
+# host: con la capa de precios compartida cada ISIN se consulta una vez, no N.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_app import APP, GRABACIONES, grabaciones_sinteticas  # noqa: E402
+
+
+def libros_de_prueba(directorio, carteras):
+    # Variantes de Fondos.xlsx con fondos del registro repartidos al azar: las carteras
+    # son distintas pero comparten muchos ISIN
+    from registro import obtener_registro
+
+    base = pd.read_excel(os.path.join(RAIZ, "Fondos.xlsx"))
+    nombres = obtener_registro().orden()
+    rutas = {}
+    for k in range(carteras):
+        rng = np.random.default_rng(k)
+        libro = base.sample(frac=1.0, replace=True, random_state=k).reset_index(drop=True)
+        libro["Fondo"] = rng.choice(nombres[:6], len(libro))
+        libro["Dinero Inv."] = libro["Dinero Inv."] * rng.uniform(0.5, 2.0)
+        rutas[f"Cartera {k + 1}"] = os.path.join(directorio, f"cartera_{k + 1}.xlsx")
+        libro.to_excel(rutas[f"Cartera {k + 1}"], index=False)
+    return rutas
+
+
+def _percentiles(valores):
+    p50, p95 = np.percentile(valores, [50, 95])
+    return {"p50": p50, "p95": p95, "max": max(valores)}
+
+
+def medir(sesiones, nombres_carteras):
+    # Se ejecuta en un proceso nuevo con la caché vacía (ver main)
+    from streamlit.testing.v1 import AppTest
+
+    import cache_precios
+    import metricas
+    from cliente_http import cliente
+    from registro import obtener_registro
+
+    resultado = {}
+
+    # 1. N refrescos de precios a la vez sobre la caché vacía
+    isins = obtener_registro().isins()
+    hilos = [threading.Thread(target=cache_precios.refrescar, args=(isins,)) for _ in range(sesiones)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    resultado["precios_segundos"] = time.perf_counter() - inicio
+    resultado["precios_peticiones"] = cliente.adaptador.peticiones
+    resultado["precios_consultas"] = {
+        fila["etiquetas"]["resultado"]: fila["valor"]
+        for fila in metricas.contadores() if fila["contador"] == "consultas_precios"
+    }
+
+    # 2. N sesiones de la aplicación a la vez, cada una con su cartera
+    tiempos, errores = [], []
+    antes = cliente.adaptador.peticiones
+
+    def sesion(i):
+        app = AppTest.from_file(APP, default_timeout=600)
+        if len(nombres_carteras) > 1:
+            app.run()
+            app.sidebar.selectbox[0].set_value(nombres_carteras[i % len(nombres_carteras)])
+        inicio = time.perf_counter()
+        app.run()
+        tiempos.append(time.perf_counter() - inicio)
+        errores.append(len(app.exception) + len(app.error))
+
+    hilos = [threading.Thread(target=sesion, args=(i,)) for i in range(sesiones)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    resultado["sesiones_segundos"] = time.perf_counter() - inicio
+    resultado["sesion"] = _percentiles(tiempos)
+    resultado["sesiones_peticiones"] = cliente.adaptador.peticiones - antes
+    resultado["errores"] = sum(errores)
+    resultado["por_host"] = {host: stats["peticiones"] for host, stats in cliente.estadisticas().items()}
+    resultado["pico_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(resultado))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sesiones", type=int, default=50)
+    parser.add_argument("--carteras", type=int, default=5)
+    parser.add_argument("--latencia", type=float, default=0.2, help="segundos por petición reproducida")
+    parser.add_argument("--grabaciones", default=GRABACIONES)
+    parser.add_argument("--medir", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir is not None:
+        medir(args.sesiones, args.medir)
+        return
+    if not os.path.isdir(args.grabaciones) or not os.listdir(args.grabaciones):
+        grabaciones_sinteticas(args.grabaciones)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        rutas = libros_de_prueba(directorio, args.carteras)
+        entorno = dict(
+            os.environ,
+            FONDOS_CACHE_DIR=os.path.join(directorio, "cache"),
+            FONDOS_HTTP_MODO="reproducir",
+            FONDOS_HTTP_GRABACIONES=args.grabaciones,
+            FONDOS_HTTP_LATENCIA=str(args.latencia),
+            FONDOS_CARTERAS=";".join(f"{nombre}=archivo:{ruta}" for nombre, ruta in rutas.items()),
+        )
+        salida = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--sesiones", str(args.sesiones), "--medir", *rutas],
+            env=entorno, cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout
+    r = json.loads(salida.strip().splitlines()[-1])
+
+    print(f"{args.sesiones} sesiones, {args.carteras} carteras, latencia {args.latencia:.2f} s por petición")
+    consultas = r["precios_consultas"]
+    print(f"  precios con caché vacía   {r['precios_segundos']:6.2f} s  {r['precios_peticiones']} peticiones HTTP "
+          f"({consultas.get('lanzada', 0)} consultas de ISIN lanzadas, {consultas.get('compartida', 0)} compartidas)")
+    print(f"  sesiones simultáneas      {r['sesiones_segundos']:6.2f} s  {r['sesiones_peticiones']} peticiones HTTP")
+    print(f"  tiempo por sesión         p50 {r['sesion']['p50']:.2f} s  p95 {r['sesion']['p95']:.2f} s  máx {r['sesion']['max']:.2f} s")
+    print(f"  peticiones por host       {r['por_host']}")
+    print(f"  pico de memoria           {r['pico_mb']:.0f} MB   errores {r['errores']}")
+
+
+if __name__ == "__main__":
+    main()
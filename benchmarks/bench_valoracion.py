@@ -0,0 +1,139 @@
+# Valoración por fondo sobre un libro de aportaciones de 100k filas: bucles por fondo
+# con máscaras booleanas (implementación anterior de la vista total) frente a
+# valoracion.valorar_aportaciones + resumen_por_fondo + historial_aportaciones.
+#
+# También mide los agregados por fondo incrementales tras añadir o corregir una aportación.
+#
+#   python benchmarks/bench_valoracion.py [--filas 100000] [--repeticiones 5]
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import valoracion  # noqa: E402
+
+ISINS = [
+    "IE00BYX5NX33", "LU1213836080", "LU1953238794", "IE0031786696", "LU1598720172",
+    "LU1694789451", "ES0140072028", "LU0625737910", "LU3038481936", "ES0165243025",
+    "IE00BH6XSF26", "ES0112611001", "ES0116567035", "LU1112771503", "ES0146309002",
+]
+
+
+def datos_sinteticos(filas, semilla=0):
+    rng = np.random.default_rng(semilla)
+    isin_map = {f"Fondo {i}": isin for i, isin in enumerate(ISINS)}
+    df = pd.DataFrame({
+        "Fecha": pd.Timestamp("2010-01-01") + pd.to_timedelta(rng.integers(0, 5000, filas), unit="D"),
+        "Fondo": rng.choice(list(isin_map), filas),
+        "Dinero Inv.": rng.integers(50, 1000, filas).astype("float64"),
+        "Valor Compra": rng.uniform(5, 500, filas),
+    })
+    precios = {isin: (float(rng.uniform(5, 500)), datetime(2026, 10, 16)) for isin in ISINS}
+    return df, isin_map, precios
+
+
+def con_bucles(df, isin_map, precios):
+    df = df.copy()
+    df["Valor Actual Estimado"] = 0.0
+    for fondo in df["Fondo"].unique():
+        precio_actual, _ = precios[isin_map[fondo]]
+        indices = df[df["Fondo"] == fondo].index
+        df.loc[indices, "Valor Actual Estimado"] = (
+            df.loc[indices, "Dinero Inv."] / df.loc[indices, "Valor Compra"]
+        ) * precio_actual
+    resumen = df.groupby("Fondo").agg({"Dinero Inv.": "sum", "Valor Actual Estimado": "sum"}).reset_index()
+    resumen["Precio Medio Compra"] = 0.0
+    resumen["Precio Actual"] = 0.0
+    for fondo in resumen["Fondo"]:
+        datos_fondo = df[df["Fondo"] == fondo]
+        total = datos_fondo["Dinero Inv."].sum()
+        ponderado = (datos_fondo["Valor Compra"] * datos_fondo["Dinero Inv."]).sum()
+        resumen.loc[resumen["Fondo"] == fondo, "Precio Medio Compra"] = ponderado / total
+        resumen.loc[resumen["Fondo"] == fondo, "Precio Actual"] = precios[isin_map[fondo]][0]
+    precios_actuales = {fondo: precios[isin][0] for fondo, isin in isin_map.items()}
+    df["Precio Actual"] = df["Fondo"].map(precios_actuales)
+    df = df[df["Valor Compra"] > 0]
+    df["Valor Actual Aportación"] = (df["Dinero Inv."] / df["Valor Compra"]) * df["Precio Actual"]
+    df["Rentabilidad %"] = (df["Valor Actual Aportación"] - df["Dinero Inv."]) / df["Dinero Inv."] * 100
+    df["Beneficio €"] = df["Valor Actual Aportación"] - df["Dinero Inv."]
+    historial = df.copy().sort_values("Fecha", ascending=False)
+    return resumen, historial
+
+
+def con_pipeline(df, isin_map, precios):
+    valoradas = valoracion.valorar_aportaciones(df, isin_map, precios)
+    return valoracion.resumen_por_fondo(valoradas), valoracion.historial_aportaciones(valoradas)
+
+
+def medir(funcion, repeticiones, *args):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    datos = datos_sinteticos(args.filas)
+    t_bucles, (resumen_bucles, _) = medir(con_bucles, args.repeticiones, *datos)
+    t_pipeline, (resumen, _) = medir(con_pipeline, args.repeticiones, *datos)
+
+    diferencia = np.abs(
+        resumen.set_index("Fondo")["Valor Actual Estimado"]
+        - resumen_bucles.set_index("Fondo")["Valor Actual Estimado"]
+    ).max()
+    print(f"{args.filas} aportaciones, {len(resumen)} fondos")
+    print(f"  bucles por fondo  {t_bucles * 1000:8.1f} ms")
+    print(f"  pipeline          {t_pipeline * 1000:8.1f} ms  x{t_bucles / t_pipeline:.1f}")
+    print(f"  diferencia máxima en el valor por fondo: {diferencia:.2e}")
+
+    # Agregados por fondo: todo el libro frente al mismo libro, a una aportación nueva al
+    # final de un fondo y a una aportación corregida en mitad del libro. Fondo categórico
+    # y huellas por fondo en attrs, como los deja aportaciones al cargar el libro; el
+    # coste de esas huellas se mide aparte porque se paga una vez por libro cargado.
+    def cargado(libro):
+        libro = libro.astype({"Fondo": "category"})
+        libro.attrs.update(filas=len(libro), huellas_fondos=valoracion.huellas_por_fondo(libro))
+        return libro
+
+    df = cargado(datos[0])
+    t_huellas, _ = medir(lambda: valoracion.huellas_por_fondo(df), args.repeticiones)
+    ampliado = cargado(pd.concat([datos[0], datos[0].iloc[[0]]], ignore_index=True))
+    corregido = datos[0].copy()
+    corregido.loc[len(corregido) // 2, "Dinero Inv."] += 1
+    corregido = cargado(corregido)
+    t_frio, _ = medir(lambda: valoracion.AgregadosFondos().calcular(df), args.repeticiones)
+    agregados = valoracion.AgregadosFondos()
+    agregados.calcular(df)
+    t_mismo, _ = medir(lambda: agregados.calcular(df), args.repeticiones)
+
+    def tras(cambiado):
+        agregados.calcular(df)
+        inicio = time.perf_counter()
+        agregados.calcular(cambiado)
+        return time.perf_counter() - inicio, agregados.filas_sumadas
+
+    t_nueva, filas_nueva = min(tras(ampliado) for _ in range(args.repeticiones))
+    t_corregida, filas_corregida = min(tras(corregido) for _ in range(args.repeticiones))
+    print(f"  huellas por fondo (al cargar)   {t_huellas * 1000:8.3f} ms")
+    print(f"  agregados completos             {t_frio * 1000:8.3f} ms")
+    print(f"  agregados, mismo libro          {t_mismo * 1000:8.3f} ms")
+    print(f"  agregados, 1 fila nueva         {t_nueva * 1000:8.3f} ms  ({filas_nueva} fila sumada)")
+    print(f"  agregados, 1 fila corregida     {t_corregida * 1000:8.3f} ms  ({filas_corregida} filas del fondo)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+
+import precios
+from configuracion import DIRECTORIO_CACHE
+from metricas import contar
+from precios import ultimo_dia_habil
+
+# Ubicación de la caché persistente y tiempos de validez (configurables por entorno)
+RUTA_PRECIOS = os.path.join(DIRECTORIO_CACHE, "precios.sqlite")
+TTL_PRECIOS = int(os.environ.get("FONDOS_TTL_PRECIOS", 12 * 3600))
+# Mientras el valor liquidativo esperado no aparece, no se reintenta más a menudo que esto
+REINTENTO_MINIMO = int(os.environ.get("FONDOS_REINTENTO_PRECIOS", 15 * 60))
+
+
+class AlmacenPrecios:
+    def __init__(self, ruta=RUTA_PRECIOS):
+        self.ruta = ruta
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with closing(self._conectar()) as con, con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS precios (
+                    isin TEXT PRIMARY KEY,
+                    precio REAL NOT NULL,
+                    fecha TEXT NOT NULL,
+                    fuente TEXT,
+                    obtenido REAL NOT NULL
+                )
+            """)
+
+    def _conectar(self):
+        # Una conexión por operación: el almacén se usa desde varios hilos
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    def leer(self, isins):
+        isins = list(isins)
+        if not isins:
+            return {}
+        marcadores = ",".join("?" * len(isins))
+        with closing(self._conectar()) as con:
+            filas = con.execute(
+                f"SELECT isin, precio, fecha, fuente, obtenido FROM precios WHERE isin IN ({marcadores})",
+                isins,
+            ).fetchall()
+        return {
+            isin: {
+                "precio": precio,
+                "fecha": datetime.fromisoformat(fecha),
+                "fuente": fuente,
+                "obtenido": obtenido,
+            }
+            for isin, precio, fecha, fuente, obtenido in filas
+        }
+
+    def leer_todos(self):
+        # Todos los ISIN guardados, para exportar la caché
+        with closing(self._conectar()) as con:
+            isins = [isin for (isin,) in con.execute("SELECT isin FROM precios ORDER BY isin")]
+        return self.leer(isins)
+
+    def guardar(self, isin, precio, fecha, fuente, obtenido=None):
+        # Un scraping fallido nunca sobrescribe un valor bueno
+        if precio is None or fecha is None:
+            return False
+        obtenido = time.time() if obtenido is None else obtenido
+        with closing(self._conectar()) as con, con:
+            cursor = con.execute(
+                """
+                INSERT INTO precios (isin, precio, fecha, fuente, obtenido) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(isin) DO UPDATE SET
+                    precio = excluded.precio, fecha = excluded.fecha,
+                    fuente = excluded.fuente, obtenido = excluded.obtenido
+                WHERE excluded.fecha >= precios.fecha
+                """,
+                (isin, float(precio), fecha.isoformat(), fuente, obtenido),
+            )
+        # Sin filas afectadas si el precio recibido es más antiguo que el guardado
+        return cursor.rowcount > 0
+
+    def marcar_consultado(self, isins, obtenido=None):
+        # Registra una consulta que no trajo un valor liquidativo nuevo para no repetirla enseguida
+        isins = list(isins)
+        if not isins:
+            return
+        obtenido = time.time() if obtenido is None else obtenido
+        marcadores = ",".join("?" * len(isins))
+        with closing(self._conectar()) as con, con:
+            con.execute(
+                f"UPDATE precios SET obtenido = ? WHERE isin IN ({marcadores})",
+                [obtenido, *isins],
+            )
+
+
+def esta_caducado(registro, ttl=TTL_PRECIOS, reintento=REINTENTO_MINIMO, ahora=None):
+    ahora = time.time() if ahora is None else ahora
+    edad = ahora - registro["obtenido"]
+    if edad >= ttl:
+        return True
+    # El valor liquidativo ya debería haber avanzado
+    return registro["fecha"] < ultimo_dia_habil() and edad >= reintento
+
+
+_almacen = None
+# ISIN que se están consultando ahora mismo -> evento que se activa al terminar
+_en_curso = {}
+_cerrojo = threading.Lock()
+
+
+def obtener_almacen():
+    global _almacen
+    with _cerrojo:
+        if _almacen is None:
+            _almacen = AlmacenPrecios()
+        return _almacen
+
+
+def refrescar(isins, almacen=None):
+    # Consulta las fuentes y guarda lo obtenido. Cada ISIN se consulta una sola vez
+    # aunque lo pidan a la vez varias sesiones: quien llega con un ISIN ya en curso
+    # espera a esa consulta en lugar de lanzar otra. Devuelve los resultados propios.
+    almacen = almacen or obtener_almacen()
+    terminado = threading.Event()
+    with _cerrojo:
+        ajenos = {_en_curso[i] for i in isins if i in _en_curso}
+        propios = [i for i in dict.fromkeys(isins) if i not in _en_curso]
+        for isin in propios:
+            _en_curso[isin] = terminado
+    contar("consultas_precios", len(propios), resultado="lanzada")
+    contar("consultas_precios", len(isins) - len(propios), resultado="compartida")
+
+    try:
+        resultados = precios.obtener_precios_con_fuente(propios) if propios else {}
+        sin_precio = []
+        for isin, (precio, fecha, fuente) in resultados.items():
+            if not almacen.guardar(isin, precio, fecha, fuente):
+                sin_precio.append(isin)
+        almacen.marcar_consultado(sin_precio)
+    finally:
+        with _cerrojo:
+            for isin in propios:
+                _en_curso.pop(isin, None)
+        terminado.set()
+
+    for evento in ajenos:
+        evento.wait(precios.PLAZO_TOTAL)
+    return resultados
+
+
+def _contar_lectura(isins, cache, ttl):
+    # Aciertos (precio vigente), caducados y fallos (sin precio) de una lectura de la caché
+    caducados = sum(esta_caducado(cache[i], ttl) for i in isins if i in cache)
+    contar("cache_precios", len(cache) - caducados, resultado="acierto")
+    contar("cache_precios", caducados, resultado="caducado")
+    contar("cache_precios", len(isins) - len(cache), resultado="fallo")
+
+
+def leer_precios(isins, almacen=None):
+    # Solo lectura: {isin: (precio, fecha)} con lo que haya en la caché, sin consultar fuentes
+    almacen = almacen or obtener_almacen()
+    isins = list(dict.fromkeys(i for i in isins if i))
+    cache = almacen.leer(isins)
+    _contar_lectura(isins, cache, ttl=TTL_PRECIOS)
+    return {
+        isin: (cache[isin]["precio"], cache[isin]["fecha"]) if isin in cache else (None, None)
+        for isin in isins
+    }
@@ -0,0 +1,334 @@
+# Núcleo del informe de la cartera sin dependencias de interfaz: carga del libro,
+# precios y agregados. Lo usan la aplicación Streamlit y la línea de comandos:
+#
+#   python cartera.py [--formato csv|parquet|json] [--salida informe] [--archivo Fondos.xlsx]
+#                     [--cartera NOMBRE] [--sin-red]
+
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import cache_precios
+from metricas import tramo
+from aportaciones import cargar_aportaciones, leer_libro_en_cache
+from historico import leer_historico
+from registro import obtener_registro
+from riesgo import riesgo_cartera
+from rentabilidad import tir_aportaciones, tir_por_fondo, twr_cartera, twr_por_fondo
+from valoracion import (
+    COLUMNAS_RESUMEN,
+    AgregadosFondos,
+    historial_aportaciones,
+    matriz_nav,
+    resumen_por_fondo,
+    valor_diario_cartera,
+    valorar_aportaciones,
+)
+
+# Enlace de Google Drive (enlace directo de descarga)
+URL_DRIVE = 'https://drive.google.com/uc?export=download&id={id}'
+URL_LIBRO = URL_DRIVE.format(id='18zva1x4v5UCxamu9qbV97EVA6DbZAOzb')  # Cambia este ID por el tuyo
+FORMATOS = ("csv", "parquet", "json")
+
+# Carteras que ofrece la aplicación: "Nombre=drive:ID;Otra=archivo:/ruta/libro.xlsx".
+# Cada origen puede ser drive:ID, archivo:RUTA o una URL de descarga directa.
+CARTERAS = os.environ.get("FONDOS_CARTERAS", "")
+
+# Agregados por fondo del último libro de cada cartera; entre ejecuciones solo se
+# recalculan los fondos cuyas aportaciones han cambiado. También se guarda el último
+# informe de cada cartera (ver informe_de): las dos cachés tienen el mismo límite.
+MAX_CARTERAS_EN_MEMORIA = 256
+_agregados = OrderedDict()
+_informes = OrderedDict()
+_cerrojo = threading.Lock()
+
+
+def carteras_configuradas():
+    # {nombre: origen} en el orden de FONDOS_CARTERAS; sin configurar, el libro de siempre
+    carteras = {}
+    for entrada in filter(None, (e.strip() for e in CARTERAS.split(";"))):
+        nombre, _, origen = entrada.partition("=")
+        if not origen:
+            raise ValueError(f"Cartera mal definida en FONDOS_CARTERAS: {entrada}")
+        carteras[nombre.strip()] = origen.strip()
+    return carteras or {"Principal": f"url:{URL_LIBRO}"}
+
+
+def cargar_libro(url=URL_LIBRO, archivo=None, contenido=None):
+    # Libro de aportaciones normalizado (ver aportaciones.TIPOS), desde una URL, un fichero local
+    # o el contenido de un fichero subido. Devuelve (df, desde_copia); df es None si no
+    # se pudo descargar ni hay copia guardada.
+    if archivo:
+        with open(archivo, "rb") as f:
+            contenido = f.read()
+    if contenido is not None:
+        df, desde_copia = leer_libro_en_cache(contenido), False
+    else:
+        df, desde_copia = cargar_aportaciones(url)
+    return df, desde_copia
+
+
+def cargar_cartera(origen):
+    # origen: drive:ID, archivo:RUTA, url:URL o directamente una URL
+    tipo, _, valor = origen.partition(":")
+    if tipo == "drive":
+        return cargar_libro(URL_DRIVE.format(id=valor))
+    if tipo == "archivo":
+        return cargar_libro(archivo=valor)
+    if tipo == "url":
+        return cargar_libro(valor)
+    if tipo in ("http", "https"):
+        return cargar_libro(origen)
+    raise ValueError(f"Origen de cartera desconocido: {origen}")
+
+
+def agregados_de(cartera):
+    # Caché de agregados por fondo propia de cada cartera
+    with _cerrojo:
+        agregados = _agregados.get(cartera)
+        if agregados is None:
+            agregados = _agregados[cartera] = AgregadosFondos()
+        _agregados.move_to_end(cartera)
+        while len(_agregados) > MAX_CARTERAS_EN_MEMORIA:
+            _agregados.popitem(last=False)
+        return agregados
+
+
+def isins_del_libro(df):
+    registro = obtener_registro()
+    return tuple(dict.fromkeys(
+        isin for isin in map(registro.isin, df["Fondo"].unique()) if isin
+    ))
+
+
+def fondos_sin_isin(df):
+    registro = obtener_registro()
+    return [fondo for fondo in df["Fondo"].unique() if registro.isin(fondo) is None]
+
+
+def fondos_sin_precio(df, precios):
+    # [(fondo, isin)] de los fondos con ISIN de los que no hay precio
+    registro = obtener_registro()
+    return [
+        (fondo, isin) for fondo, isin in ((f, registro.isin(f)) for f in df["Fondo"].unique())
+        if isin and not precios.get(isin, (None, None))[0]
+    ]
+
+
+def ordenar_resumen(resumen):
+    # Orden de presentación del registro; los fondos que no están en él van al final
+    orden = obtener_registro().orden()
+    categorias = list(dict.fromkeys(orden + sorted(resumen["Fondo"].dropna())))
+    resumen = resumen.assign(Fondo=pd.Categorical(resumen["Fondo"], categories=categorias, ordered=True))
+    return resumen.sort_values("Fondo")
+
+
+def etapa(calcular):
+    # Etapa de Informe: como functools.cached_property, pero con un cerrojo por informe
+    # y etapa. En Python 3.11 cached_property tiene un solo cerrojo por atributo para
+    # todas las instancias, así que sesiones de carteras distintas se esperaban entre sí.
+    nombre = calcular.__name__
+
+    def obtener(self):
+        try:
+            return self._etapas[nombre]
+        except KeyError:
+            pass
+        with self._cerrojo:
+            cerrojo = self._cerrojos.setdefault(nombre, threading.Lock())
+        # Las etapas piden otras anteriores, nunca posteriores: los cerrojos no se cruzan
+        with cerrojo:
+            if nombre not in self._etapas:
+                self._etapas[nombre] = calcular(self)
+            return self._etapas[nombre]
+
+    return property(obtener)
+
+
+class Informe:
+    # Informe de la cartera por etapas (valoración → resumen, historial, serie diaria →
+    # totales; históricos → valores liquidativos → riesgo). Cada etapa se calcula la
+    # primera vez que se pide y se reutiliza después; se accede como a un dict:
+    # informe["resumen"]. historicos puede ser {isin: serie} o una función que lo
+    # devuelva, para leerlos solo si hace falta la serie diaria.
+    def __init__(self, df, precios, historicos=None, cartera=None):
+        self.df = df
+        self.precios = precios
+        self.cartera = cartera
+        self._historicos = historicos
+        self._etapas = {}
+        self._cerrojos = {}
+        self._cerrojo = threading.Lock()
+
+    def __getitem__(self, etapa):
+        return getattr(self, etapa)
+
+    @etapa
+    def valoradas(self):
+        # Valoración de todas las aportaciones en una sola pasada
+        with tramo("valoracion"):
+            return valorar_aportaciones(self.df, obtener_registro().mapa_isin, self.precios)
+
+    @etapa
+    def _resumen(self):
+        with tramo("resumen"):
+            resumen = resumen_por_fondo(self.valoradas, agregados_de(self.cartera).calcular(self.df))
+        with tramo("rentabilidad"):
+            resumen["TIR (%)"] = tir_por_fondo(self.valoradas, resumen).round(2)
+            resumen["TWR (%)"] = twr_por_fondo(self.valoradas, resumen).round(2)
+        return resumen
+
+    @etapa
+    def resumen(self):
+        return ordenar_resumen(self._resumen)
+
+    @etapa
+    def historial(self):
+        with tramo("historial"):
+            return historial_aportaciones(self.valoradas)
+
+    @etapa
+    def historicos(self):
+        return (self._historicos() if callable(self._historicos) else self._historicos) or {}
+
+    @etapa
+    def diario(self):
+        # Valoración diaria real: participaciones acumuladas por el valor liquidativo de cada día
+        with tramo("valor_diario"):
+            return valor_diario_cartera(self.df, obtener_registro().mapa_isin, self.historicos, self.precios).reset_index()
+
+    @etapa
+    def nav(self):
+        # Valores liquidativos por día hábil e ISIN de los fondos de la cartera con datos
+        isins = isins_del_libro(self.df)
+        with tramo("matriz_nav"):
+            return matriz_nav(
+                {isin: self.historicos[isin] for isin in isins if isin in self.historicos},
+                {isin: self.precios[isin] for isin in isins if isin in self.precios},
+            )
+
+    @etapa
+    def riesgo(self):
+        # (métricas de riesgo por fondo y de la cartera, correlaciones) de riesgo.riesgo_cartera
+        with tramo("riesgo"):
+            return riesgo_cartera(self.nav, self.diario)
+
+    @etapa
+    def totales(self):
+        fechas_precios = [fecha for _, fecha in self.precios.values() if fecha]
+        fecha_precios = max(fechas_precios) if fechas_precios else None
+        invertido = self._resumen["Dinero Inv."].sum()
+        estimado = self._resumen["Valor Actual Estimado"].sum()
+        return {
+            "invertido": invertido,
+            "estimado": estimado,
+            "diferencia": estimado - invertido,
+            "rendimiento": (estimado - invertido) / invertido * 100 if invertido else 0,
+            "tir": tir_aportaciones(self.valoradas, estimado, fecha_precios),
+            "twr": twr_cartera(self.diario),
+            "fecha_precios": fecha_precios,
+        }
+
+
+def calcular_informe(df, precios, historicos=None, cartera=None):
+    # Valoración completa de la cartera a partir del libro y los precios ({isin: (precio, fecha)}).
+    # Devuelve un Informe con las tablas (valoradas, resumen, historial, diario) y los totales.
+    # cartera identifica el libro para reutilizar sus agregados entre ejecuciones.
+    return Informe(df, precios, historicos, cartera)
+
+
+def huella_libro(df):
+    # Huella del contenido del libro: la que deja aportaciones al cargarlo o, si no la
+    # tiene, un hash de todas sus filas
+    huella = df.attrs.get("huella")
+    if huella is not None and df.attrs.get("filas") == len(df):
+        return huella
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def informe_de(df, precios, historicos=None, cartera=None, version=None):
+    # Informe memorizado entre ejecuciones y sesiones: se reutiliza, con las etapas ya
+    # calculadas, mientras no cambien el libro, los precios ni la versión de los
+    # históricos (ver historico.version_historicos). Se guarda uno por cartera, el
+    # último, para MAX_CARTERAS_EN_MEMORIA carteras como los agregados.
+    clave = (huella_libro(df), tuple(sorted(precios.items())), version)
+    with _cerrojo:
+        guardado = _informes.get(cartera)
+        if guardado is None or guardado[0] != clave:
+            guardado = _informes[cartera] = (clave, Informe(df, precios, historicos, cartera))
+        _informes.move_to_end(cartera)
+        while len(_informes) > MAX_CARTERAS_EN_MEMORIA:
+            _informes.popitem(last=False)
+        return guardado[1]
+
+
+def exportar(tabla, ruta, formato):
+    if formato == "csv":
+        tabla.to_csv(ruta, index=False)
+    elif formato == "parquet":
+        tabla.to_parquet(ruta, index=False)
+    elif formato == "json":
+        tabla.to_json(ruta, orient="records", date_format="iso", force_ascii=False, indent=2)
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el detalle por fondo y el historial de aportaciones")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--salida", default="informe", help="directorio donde se escriben los ficheros")
+    parser.add_argument("--url", default=URL_LIBRO, help="enlace de descarga del libro de aportaciones")
+    parser.add_argument("--archivo", help="libro de aportaciones local en lugar del enlace")
+    parser.add_argument("--cartera", help="nombre de una de las carteras de FONDOS_CARTERAS")
+    parser.add_argument("--sin-red", action="store_true", help="usa solo los precios guardados en la caché")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.cartera:
+        carteras = carteras_configuradas()
+        if args.cartera not in carteras:
+            parser.error(f"Cartera desconocida: {args.cartera} (disponibles: {', '.join(carteras)})")
+        df, desde_copia = cargar_cartera(carteras[args.cartera])
+    else:
+        df, desde_copia = cargar_libro(args.url, args.archivo)
+    if df is None:
+        parser.exit(1, "No se pudo descargar el libro de aportaciones y no hay copia guardada.\n")
+    if desde_copia:
+        print("Aviso: se usa la última copia guardada del libro de aportaciones")
+
+    isins = isins_del_libro(df)
+    if not args.sin_red:
+        # Aquí sí se espera a las fuentes: un proceso corto no puede refrescar en segundo plano
+        import actualizador
+        actualizador.actualizar(list(isins))
+    precios = cache_precios.leer_precios(isins)
+    for fondo in fondos_sin_isin(df):
+        print(f"Aviso: ISIN no definido para {fondo}")
+    for fondo, isin in fondos_sin_precio(df, precios):
+        print(f"Aviso: no hay precio de {fondo} ({isin})")
+
+    informe = calcular_informe(
+        df, precios, {isin: leer_historico(isin) for isin in isins}, cartera=args.cartera or args.archivo or args.url
+    )
+    os.makedirs(args.salida, exist_ok=True)
+    resumen = informe["resumen"][COLUMNAS_RESUMEN + ["TIR (%)", "TWR (%)"]]
+    for nombre, tabla in (("resumen", resumen), ("historial", informe["historial"])):
+        ruta = os.path.join(args.salida, f"{nombre}.{args.formato}")
+        exportar(tabla, ruta, args.formato)
+        print(f"{ruta}: {len(tabla)} filas")
+
+    totales = informe["totales"]
+    print(
+        f"Invertido {totales['invertido']:.2f} € · Valor {totales['estimado']:.2f} € · "
+        f"Rendimiento {totales['rendimiento']:.2f} % · "
+        f"TIR {totales['tir']:.2f} % · TWR {totales['twr']:.2f} % "
+        f"({time.perf_counter() - inicio:.2f} s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
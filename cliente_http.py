@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+from grabacion import crear_adaptador
+
+# Tiempos de espera por defecto (conexión, lectura) y política de reintentos
+TIMEOUT = (5, 15)
+REINTENTOS = 3
+ESPERA_BASE = 0.5
+ESPERA_MAXIMA = 8
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+CONEXIONES_POR_HOST = 16
+# URLs de las que se guarda el validador y el cuerpo para revalidar (LRU)
+MAX_VALIDADORES = 256
+
+
+def _estadisticas_vacias():
+    return {
+        "peticiones": 0,
+        "errores": 0,
+        "reintentos": 0,
+        "no_modificados": 0,
+        "latencia_total": 0.0,
+        "latencia_maxima": 0.0,
+    }
+
+
+def _respuesta_guardada(url, validador):
+    # Respuesta 200 rehecha a partir del cuerpo guardado, para un 304 Not Modified
+    respuesta = requests.Response()
+    respuesta.status_code = 200
+    respuesta.url = url
+    respuesta._content = validador["contenido"]
+    respuesta.encoding = validador["codificacion"]
+    respuesta.headers.update(validador["cabeceras"])
+    return respuesta
+
+
+class ClienteHTTP:
+    # Sesión compartida por todos los scrapers: reutiliza conexiones keep-alive por host,
+    # aplica timeouts, reintenta con espera exponencial y revalida con ETag/Last-Modified.
+
+    def __init__(self, timeout=TIMEOUT, reintentos=REINTENTOS, espera_base=ESPERA_BASE,
+                 espera_maxima=ESPERA_MAXIMA, conexiones_por_host=CONEXIONES_POR_HOST):
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.sesion = requests.Session()
+        adaptador = crear_adaptador(pool_connections=conexiones_por_host, pool_maxsize=conexiones_por_host)
+        self.adaptador = adaptador
+        self.sesion.mount("http://", adaptador)
+        self.sesion.mount("https://", adaptador)
+        self._validadores = OrderedDict()
+        self._estadisticas = {}
+        self._cerrojo = threading.Lock()
+
+    def _espera(self, intento, respuesta=None):
+        if respuesta is not None and respuesta.headers.get("Retry-After", "").isdigit():
+            return min(float(respuesta.headers["Retry-After"]), self.espera_maxima)
+        # Espera exponencial con jitter completo
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+
+    def _anotar(self, host, latencia, error=False, reintento=False, no_modificado=False):
+        with self._cerrojo:
+            stats = self._estadisticas.setdefault(host, _estadisticas_vacias())
+            stats["peticiones"] += 1
+            stats["latencia_total"] += latencia
+            stats["latencia_maxima"] = max(stats["latencia_maxima"], latencia)
+            stats["errores"] += error
+            stats["reintentos"] += reintento
+            stats["no_modificados"] += no_modificado
+
+    def get(self, url, timeout=None, condicional=True, **kwargs):
+        host = urlsplit(url).netloc
+        cabeceras = dict(kwargs.pop("headers", None) or {})
+        with self._cerrojo:
+            validador = self._validadores.get(url) if condicional else None
+            if validador:
+                self._validadores.move_to_end(url)
+        if validador:
+            if validador["etag"]:
+                cabeceras["If-None-Match"] = validador["etag"]
+            if validador["last_modified"]:
+                cabeceras["If-Modified-Since"] = validador["last_modified"]
+
+        for intento in range(self.reintentos + 1):
+            ultimo = intento == self.reintentos
+            inicio = time.perf_counter()
+            try:
+                respuesta = self.sesion.get(url, headers=cabeceras, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._anotar(host, time.perf_counter() - inicio, error=True, reintento=not ultimo)
+                if ultimo:
+                    raise
+                time.sleep(self._espera(intento))
+                continue
+
+            latencia = time.perf_counter() - inicio
+            if respuesta.status_code in ESTADOS_REINTENTABLES and not ultimo:
+                self._anotar(host, latencia, error=True, reintento=True)
+                time.sleep(self._espera(intento, respuesta))
+                continue
+
+            if respuesta.status_code == 304 and validador:
+                self._anotar(host, latencia, no_modificado=True)
+                return _respuesta_guardada(url, validador)
+
+            self._anotar(host, latencia, error=respuesta.status_code >= 400)
+            if condicional and respuesta.status_code == 200:
+                self._guardar_validador(url, respuesta)
+            return respuesta
+
+    def _guardar_validador(self, url, respuesta):
+        etag = respuesta.headers.get("ETag")
+        last_modified = respuesta.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        # Solo los validadores y el cuerpo: la respuesta entera retiene la conexión y el historial
+        with self._cerrojo:
+            self._validadores[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "contenido": respuesta.content,
+                "codificacion": respuesta.encoding,
+                "cabeceras": {k: v for k, v in respuesta.headers.items() if k.lower() == "content-type"},
+            }
+            self._validadores.move_to_end(url)
+            while len(self._validadores) > MAX_VALIDADORES:
+                self._validadores.popitem(last=False)
+
+    def estadisticas(self):
+        # Copia de los contadores por host con la latencia media calculada
+        with self._cerrojo:
+            copia = {host: dict(stats) for host, stats in self._estadisticas.items()}
+        for stats in copia.values():
+            stats["latencia_media"] = stats["latencia_total"] / stats["peticiones"] if stats["peticiones"] else 0.0
+        return copia
+
+
+cliente = ClienteHTTP()
@@ -0,0 +1,4 @@
+import os
+
+# Directorio común de las cachés persistentes (precios, libro de aportaciones...)
+DIRECTORIO_CACHE = os.environ.get("FONDOS_CACHE_DIR", ".cache")
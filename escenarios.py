@@ -0,0 +1,107 @@
+# Escenarios sobre el libro de aportaciones y los valores liquidativos: otras
+# asignaciones de las mismas aportaciones, choques de precio y trayectorias de Monte
+# Carlo. Cada tipo de escenario se evalúa para miles de casos a la vez con operaciones
+# de matrices de NumPy, sin bucles por escenario.
+
+import numpy as np
+import pandas as pd
+
+from riesgo import DIAS_ANIO, covarianza_por_pares, rentabilidades_diarias
+
+# Ventana de rentabilidades diarias del modelo
+VENTANA_MODELO = 3 * DIAS_ANIO
+# Caminos que se simulan a la vez en Monte Carlo (limita la memoria)
+BLOQUE_CAMINOS = 2000
+# Puntos de control de cada trayectoria
+PASOS_MONTECARLO = 52
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def crecimiento_por_fondo(aportaciones, nav):
+    # Valor hoy, en cada fondo de nav, de todas las aportaciones del libro como si se
+    # hubieran invertido en él en su fecha (al último valor liquidativo de ese día o
+    # anterior). NaN en los fondos sin valor liquidativo en alguna de las fechas.
+    if nav.empty:
+        return pd.Series(np.nan, index=nav.columns, dtype="float64")
+    fechas = aportaciones["Fecha"].to_numpy("datetime64[ns]")
+    importes = aportaciones["Dinero Inv."].to_numpy("float64")
+    filas = nav.index.to_numpy("datetime64[ns]").searchsorted(fechas, side="right") - 1
+    if (filas < 0).any():
+        # Aportaciones anteriores a todos los valores liquidativos
+        return pd.Series(np.nan, index=nav.columns, dtype="float64")
+    # Importe aportado por fila de nav: el coste no depende del número de aportaciones
+    por_fila = np.bincount(filas, weights=importes, minlength=len(nav))
+    usadas = np.flatnonzero(por_fila)
+    precios = nav.to_numpy("float64")
+    with np.errstate(divide="ignore"):
+        participaciones = por_fila[usadas] @ (1.0 / precios[usadas])
+    return pd.Series(participaciones * precios[-1], index=nav.columns)
+
+
+def valor_asignaciones(crecimiento, pesos):
+    # Valor final de cada asignación alternativa: pesos es una matriz escenarios × fondos
+    # (columnas en el orden de crecimiento) con el reparto de cada aportación; las filas
+    # deberían sumar 1. El valor es lineal en los pesos: una sola multiplicación.
+    return np.asarray(pesos, dtype="float64") @ crecimiento.to_numpy("float64")
+
+
+def todo_en_un_fondo(aportaciones, nav, nombres=None):
+    # Una fila por fondo: valor hoy si todas las aportaciones hubieran ido a ese fondo
+    crecimiento = crecimiento_por_fondo(aportaciones, nav)
+    invertido = aportaciones["Dinero Inv."].sum()
+    tabla = pd.DataFrame({
+        "ISIN": crecimiento.index,
+        "Fondo": [(nombres or {}).get(isin, isin) for isin in crecimiento.index],
+        "Valor Final": crecimiento.to_numpy(),
+    })
+    tabla["Diferencia (€)"] = tabla["Valor Final"] - invertido
+    tabla["Rendimiento (%)"] = tabla["Diferencia (€)"] / invertido * 100 if invertido else np.nan
+    return tabla.sort_values("Valor Final", ascending=False, na_position="last", ignore_index=True)
+
+
+def valor_con_choques(valores, choques):
+    # Valor de la cartera bajo cada choque: choques es escenarios × fondos con la
+    # variación de precio de cada fondo (-0.2 = -20 %); valores, el valor actual por fondo
+    choques = np.atleast_2d(np.asarray(choques, dtype="float64"))
+    return (1.0 + choques) @ np.asarray(valores, dtype="float64")
+
+
+def modelo_rentabilidades(nav, ventana=VENTANA_MODELO):
+    # Media y factor de covarianza (Σ = F Fᵀ) de las rentabilidades logarítmicas diarias
+    # de los fondos en la última ventana. Los fondos sin datos quedan con media y
+    # volatilidad cero. Se usa la descomposición en autovalores, que también vale para
+    # covarianzas singulares (fondos sin movimiento o muy correlacionados).
+    media, covarianza, _ = covarianza_por_pares(rentabilidades_diarias(nav.to_numpy("float64")[-(ventana + 1):]))
+    autovalores, autovectores = np.linalg.eigh(covarianza)
+    factor = autovectores * np.sqrt(np.clip(autovalores, 0.0, None))
+    return media, factor
+
+
+def montecarlo(valores, media, factor, caminos=10000, anios=1.0, pasos=PASOS_MONTECARLO, semilla=None,
+               fijo=0.0, bloque=BLOQUE_CAMINOS):
+    # Trayectorias del valor de la cartera con rentabilidades logarítmicas normales
+    # correlacionadas (media y factor de modelo_rentabilidades). Solo se simulan `pasos`
+    # puntos de control repartidos en el horizonte: la suma de d rentabilidades diarias
+    # normales es normal con media d·μ y covarianza d·Σ, así que no hace falta generar
+    # cada día y el coste no crece con el horizonte. fijo es el valor que no se simula
+    # (fondos sin valores liquidativos). Devuelve un dict con los días de cada paso, los
+    # percentiles del valor en cada paso (PERCENTILES × pasos) y el valor final de cada camino.
+    valores = np.asarray(valores, dtype="float64")
+    pasos = max(1, int(pasos))
+    dias = np.linspace(0, anios * DIAS_ANIO, pasos + 1)
+    incremento = dias[1] - dias[0]
+    rng = np.random.default_rng(semilla)
+
+    trayectorias = np.empty((caminos, pasos + 1))
+    for inicio in range(0, caminos, bloque):
+        n = min(bloque, caminos - inicio)
+        ruido = rng.standard_normal((n, pasos, factor.shape[1]))
+        # Rentabilidad acumulada de cada fondo en cada paso: caminos × pasos × fondos
+        acumulada = np.cumsum(incremento * media + np.sqrt(incremento) * (ruido @ factor.T), axis=1)
+        trayectorias[inicio:inicio + n, 0] = valores.sum() + fijo
+        trayectorias[inicio:inicio + n, 1:] = np.exp(acumulada) @ valores + fijo
+    return {
+        "dias": dias,
+        "percentiles": np.percentile(trayectorias, PERCENTILES, axis=0),
+        "finales": trayectorias[:, -1],
+    }
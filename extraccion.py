@@ -0,0 +1,104 @@
+import re
+from datetime import datetime
+
+import lxml.html
+from lxml import etree
+
+# Nodos que interesan de cada página: campo -> (etiqueta, clase).
+# Como en BeautifulSoup, una clase con espacios debe coincidir con el atributo completo
+# y una clase simple basta con que esté entre las del elemento.
+CAMPOS_FT = {
+    "precio": ("span", "mod-ui-data-list__value"),
+    "fecha": ("div", "mod-disclaimer"),
+}
+CAMPOS_MORNINGSTAR = {
+    "precio": ("td", "line text"),
+    "fecha": ("td", "line heading"),
+}
+TAMANO_BLOQUE = 32 * 1024
+
+
+def _coincide(elemento, etiqueta, clase):
+    if elemento.tag != etiqueta:
+        return False
+    atributo = elemento.get("class")
+    if not atributo:
+        return False
+    if " " in clase:
+        return atributo == clase
+    return clase in atributo.split()
+
+
+def _recoger(parser, campos, textos):
+    for _, elemento in parser.read_events():
+        for campo, (etiqueta, clase) in campos.items():
+            if textos[campo] is None and _coincide(elemento, etiqueta, clase):
+                textos[campo] = "".join(elemento.itertext())
+    return all(texto is not None for texto in textos.values())
+
+
+def extraer_textos(html, campos):
+    # Analiza el HTML por bloques con un parser incremental y se detiene en cuanto
+    # ha encontrado el primer nodo de cada campo. Devuelve {campo: texto o None}.
+    etiquetas = {etiqueta for etiqueta, _ in campos.values()}
+    textos = dict.fromkeys(campos)
+    parser = etree.HTMLPullParser(events=("end",), tag=etiquetas)
+
+    for inicio in range(0, len(html), TAMANO_BLOQUE):
+        parser.feed(html[inicio:inicio + TAMANO_BLOQUE])
+        if _recoger(parser, campos, textos):
+            return textos
+
+    parser.close()
+    _recoger(parser, campos, textos)
+    return textos
+
+
+def extraer_ft(html):
+    return extraer_textos(html, CAMPOS_FT)
+
+
+def extraer_morningstar(html):
+    return extraer_textos(html, CAMPOS_MORNINGSTAR)
+
+
+# Tabla de históricos de FT: fecha en la primera celda (formato largo en el primer span)
+# y el cierre en la quinta (Date, Open, High, Low, Close, Volume).
+_XID_FT = re.compile(r'xid(?:&quot;|")\s*:\s*(?:&quot;|")(\d+)')
+FORMATOS_FECHA_FT = ("%A, %B %d, %Y", "%a, %b %d, %Y")
+
+
+def _fecha_ft(texto):
+    for formato in FORMATOS_FECHA_FT:
+        try:
+            return datetime.strptime(texto.strip(), formato)
+        except ValueError:
+            pass
+    return None
+
+
+def extraer_historico_ft(html):
+    # Devuelve [(fecha, cierre)] de las filas de la tabla de precios históricos
+    if not html or not html.strip():
+        return []
+    documento = lxml.html.fragment_fromstring(html, create_parent="div")
+    filas = []
+    for fila in documento.iter("tr"):
+        celdas = fila.findall("td")
+        if len(celdas) < 5:
+            continue
+        spans = celdas[0].findall("span")
+        fecha = _fecha_ft(spans[0].text_content() if spans else celdas[0].text_content())
+        try:
+            cierre = float(celdas[4].text_content().strip().replace(",", ""))
+        except ValueError:
+            continue
+        if fecha is not None:
+            filas.append((fecha, cierre))
+    return filas
+
+
+def extraer_xid_ft(html):
+    # Identificador interno de FT que necesita la consulta de históricos por rango de fechas
+    match = _XID_FT.search(html)
+    return match.group(1) if match else None
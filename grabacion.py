@@ -0,0 +1,111 @@
+# Transporte HTTP de grabación y reproducción para medir la aplicación sin red.
+#
+#   FONDOS_HTTP_MODO=grabar       hace las peticiones reales y guarda cada respuesta
+#   FONDOS_HTTP_MODO=reproducir   sirve las respuestas grabadas sin salir a la red
+#
+# En reproducción se puede inyectar latencia (FONDOS_HTTP_LATENCIA, segundos, con
+# jitter de ±50 %) y fallos de conexión (FONDOS_HTTP_FALLOS, proporción de 0 a 1).
+# Las grabaciones van a FONDOS_HTTP_GRABACIONES: un .json con estado y cabeceras y un
+# .body con el cuerpo por cada URL.
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from configuracion import DIRECTORIO_CACHE
+
+MODO = os.environ.get("FONDOS_HTTP_MODO", "")
+DIRECTORIO_GRABACIONES = os.environ.get("FONDOS_HTTP_GRABACIONES", os.path.join(DIRECTORIO_CACHE, "grabaciones"))
+LATENCIA = float(os.environ.get("FONDOS_HTTP_LATENCIA", 0))
+PROPORCION_FALLOS = float(os.environ.get("FONDOS_HTTP_FALLOS", 0))
+SEMILLA = os.environ.get("FONDOS_HTTP_SEMILLA")
+
+
+def clave_grabacion(metodo, url):
+    return hashlib.sha256(f"{metodo} {url}".encode()).hexdigest()[:32]
+
+
+def guardar_grabacion(directorio, metodo, url, estado, cabeceras, cuerpo):
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, clave_grabacion(metodo, url))
+    with open(ruta + ".body", "wb") as f:
+        f.write(cuerpo)
+    with open(ruta + ".json", "w", encoding="utf-8") as f:
+        json.dump({"metodo": metodo, "url": url, "estado": estado, "cabeceras": dict(cabeceras)}, f, indent=2)
+
+
+class AdaptadorGrabacion(HTTPAdapter):
+    def __init__(self, modo, directorio=DIRECTORIO_GRABACIONES, latencia=LATENCIA,
+                 proporcion_fallos=PROPORCION_FALLOS, semilla=SEMILLA, **kwargs):
+        super().__init__(**kwargs)
+        self.modo = modo
+        self.directorio = directorio
+        self.latencia = latencia
+        self.proporcion_fallos = proporcion_fallos
+        self._azar = random.Random(semilla)
+        self._cerrojo = threading.Lock()
+        # Peticiones recibidas por el transporte (incluidas las que fallan a propósito)
+        self.peticiones = 0
+
+    def send(self, request, **kwargs):
+        with self._cerrojo:
+            self.peticiones += 1
+        if self.modo == "grabar":
+            respuesta = super().send(request, **kwargs)
+            # Solo se graban respuestas completas; los 304 dependen de la caché del cliente
+            if respuesta.status_code != 304:
+                guardar_grabacion(self.directorio, request.method, request.url,
+                                  respuesta.status_code, respuesta.headers, respuesta.content)
+            return respuesta
+        return self._reproducir(request)
+
+    def _reproducir(self, request):
+        with self._cerrojo:
+            espera = self.latencia * self._azar.uniform(0.5, 1.5)
+            falla = self._azar.random() < self.proporcion_fallos
+        if espera:
+            time.sleep(espera)
+        if falla:
+            raise requests.ConnectionError(f"Fallo inyectado: {request.url}", request=request)
+
+        ruta = os.path.join(self.directorio, clave_grabacion(request.method, request.url))
+        try:
+            with open(ruta + ".json", encoding="utf-8") as f:
+                grabada = json.load(f)
+            with open(ruta + ".body", "rb") as f:
+                cuerpo = f.read()
+        except OSError:
+            raise requests.ConnectionError(f"Sin grabación para {request.url}", request=request)
+
+        respuesta = Response()
+        respuesta.request = request
+        respuesta.url = request.url
+        respuesta.status_code = grabada["estado"]
+        respuesta.headers = CaseInsensitiveDict(grabada["cabeceras"])
+        # El cuerpo ya está descomprimido
+        respuesta.headers.pop("Content-Encoding", None)
+        etag = respuesta.headers.get("ETag")
+        if etag and request.headers.get("If-None-Match") == etag:
+            respuesta.status_code = 304
+            cuerpo = b""
+        respuesta._content = cuerpo
+        respuesta.encoding = requests.utils.get_encoding_from_headers(respuesta.headers)
+        respuesta.reason = "OK" if respuesta.status_code == 200 else ""
+        return respuesta
+
+
+def crear_adaptador(**kwargs):
+    # Adaptador que monta ClienteHTTP: el normal o el de grabación según FONDOS_HTTP_MODO
+    if MODO in ("grabar", "reproducir"):
+        return AdaptadorGrabacion(MODO, **kwargs)
+    if MODO:
+        raise ValueError(f"FONDOS_HTTP_MODO desconocido: {MODO}")
+    return HTTPAdapter(**kwargs)
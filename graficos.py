@@ -0,0 +1,243 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Puntos que se envían al navegador por serie diaria y a partir de cuántos se usa WebGL
+PUNTOS_GRAFICO = int(os.environ.get("FONDOS_PUNTOS_GRAFICO", 1500))
+UMBRAL_WEBGL = int(os.environ.get("FONDOS_UMBRAL_WEBGL", 1000))
+MAX_FIGURAS = 32
+
+_figuras = OrderedDict()
+_cerrojo = threading.Lock()
+
+
+def _huella(valor):
+    # Huella de un argumento: contenido de tablas y series, repr del resto
+    if isinstance(valor, pd.DataFrame):
+        return (tuple(valor.columns), len(valor), int(pd.util.hash_pandas_object(valor).sum()))
+    if isinstance(valor, pd.Series):
+        return (valor.name, len(valor), int(pd.util.hash_pandas_object(valor).sum()))
+    return repr(valor)
+
+
+def memorizar(funcion):
+    # Reutiliza la figura mientras los datos de entrada no cambien. Las figuras
+    # devueltas se comparten entre ejecuciones y no deben modificarse.
+    def envoltorio(*args, **kwargs):
+        clave = (funcion.__name__,) + tuple(map(_huella, args)) + tuple(
+            (nombre, _huella(valor)) for nombre, valor in sorted(kwargs.items())
+        )
+        with _cerrojo:
+            if clave in _figuras:
+                _figuras.move_to_end(clave)
+                return _figuras[clave]
+        figura = funcion(*args, **kwargs)
+        with _cerrojo:
+            _figuras[clave] = figura
+            while len(_figuras) > MAX_FIGURAS:
+                _figuras.popitem(last=False)
+        return figura
+
+    envoltorio.__name__ = funcion.__name__
+    return envoltorio
+
+
+def lttb(x, y, objetivo):
+    # Largest-Triangle-Three-Buckets: índices de los `objetivo` puntos que mejor
+    # conservan la forma de la serie (siempre incluye el primero y el último)
+    n = len(y)
+    if objetivo >= n or objetivo < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    bordes = np.linspace(1, n - 1, objetivo - 1).astype("int64")
+    indices = np.empty(objetivo, dtype="int64")
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for i in range(objetivo - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Media del cubo siguiente como tercer vértice del triángulo
+        siguiente = slice(fin, bordes[i + 2] if i + 2 < len(bordes) else n)
+        media_x, media_y = x[siguiente].mean(), y[siguiente].mean()
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fin] - y[anterior])
+            - (x[anterior] - x[inicio:fin]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+
+def reducir_serie(tabla, x, columnas, objetivo=PUNTOS_GRAFICO):
+    # Filas de la tabla que conserva LTTB en alguna de las columnas; todas comparten eje x
+    if len(tabla) <= objetivo:
+        return tabla
+    eje = tabla[x].to_numpy("datetime64[ns]").view("int64")
+    indices = np.unique(np.concatenate([
+        lttb(eje, tabla[columna].to_numpy("float64"), objetivo // len(columnas)) for columna in columnas
+    ]))
+    return tabla.iloc[indices]
+
+
+def _lineas(puntos):
+    return go.Scattergl if puntos > UMBRAL_WEBGL else go.Scatter
+
+
+@memorizar
+def figura_valor_compra(datos):
+    fig = go.Figure()
+    fig.add_trace(_lineas(len(datos))(
+        x=datos['Fecha'], y=datos['Valor Compra'],
+        mode='lines+markers', name='Valor Compra', line=dict(color='teal')
+    ))
+    fig.update_layout(
+        xaxis_title="Fecha",
+        yaxis_title="Valor",
+        template="plotly_white",
+        yaxis=dict(tickformat=".2f"),  # Formato del eje Y con 2 decimales
+        height=500,  # Aumentar el tamaño del gráfico
+        width=1000  # Aumentar el tamaño del gráfico
+    )
+    return fig
+
+
+@memorizar
+def figura_inversion_estimacion(datos):
+    # Barras agrupadas de lo invertido y el valor estimado de cada aportación
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=datos['Fecha'], y=datos['Dinero Inv.'],
+        name="Total Invertido",
+        marker=dict(color="#2c3e50")
+    ))
+    fig.add_trace(go.Bar(
+        x=datos['Fecha'], y=datos['Valor Actual Estimado'],
+        name="Valor Estimado Actual",
+        marker=dict(color="#27ae60")
+    ))
+    fig.update_layout(
+        barmode='group',
+        xaxis_title="Fecha", yaxis_title="Euros", template="plotly_white",
+        xaxis=dict(showgrid=True), yaxis=dict(showgrid=True),
+        plot_bgcolor="rgba(245, 247, 250, 1)",
+        height=500,
+        width=1000,
+        legend=dict(
+            orientation="h",  # Establecer la orientación horizontal
+            yanchor="bottom",  # Posicionar la leyenda debajo del gráfico
+            y=-0.2  # Colocar la leyenda un poco debajo
+        )
+    )
+    return fig
+
+
+@memorizar
+def figura_acumulada(diario):
+    # Inversión acumulada frente a valor de mercado, reducida a PUNTOS_GRAFICO puntos
+    columnas = ['Dinero Inv.', 'Valor de Mercado']
+    reducida = reducir_serie(diario, 'Fecha', columnas)
+    traza = _lineas(len(reducida))
+    colores = px.colors.qualitative.Plotly
+    fig = go.Figure([
+        traza(x=reducida['Fecha'], y=reducida[columna], mode='lines', name=columna,
+              line=dict(color=color), hovertemplate='%{x}<br>%{y:,.2f} €<extra>' + columna + '</extra>')
+        for columna, color in zip(columnas, colores)
+    ])
+    fig.update_layout(
+        title=' ',
+        template="plotly_dark",
+        xaxis_title="Fecha",
+        yaxis_title="Euros (€)",
+        legend_title="Indicador",
+        showlegend=True
+    )
+    return fig
+
+
+@memorizar
+def figura_distribucion(distribucion):
+    # Donut del dinero invertido por fondo
+    fig = go.Figure(
+        data=[
+            go.Pie(
+                labels=distribucion['Fondo'],
+                values=distribucion['Dinero Inv.'],
+                hole=0.5,  # donut más marcado
+                textinfo='percent+label',
+                hovertemplate='%{label}<br>€%{value:,.2f} (%{percent})<extra></extra>',
+                marker=dict(colors=px.colors.sequential.RdBu, line=dict(color='white', width=2))
+            )
+        ]
+    )
+    fig.update_layout(
+        title_text=' ',
+        title_font_size=20,
+        title_x=0.5,
+        showlegend=False,
+        margin=dict(t=60, b=0, l=0, r=0),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+    )
+    return fig
+
+
+@memorizar
+def figura_montecarlo(bandas):
+    # Abanico de percentiles del valor simulado: bandas indexada por fecha con una
+    # columna por percentil (de menor a mayor)
+    columnas = list(bandas.columns)
+    mediana = columnas[len(columnas) // 2]
+    fig = go.Figure()
+    for bajo, alto, opacidad in zip(columnas, columnas[::-1], (0.15, 0.3)):
+        if bajo == alto:
+            break
+        fig.add_trace(go.Scatter(x=bandas.index, y=bandas[alto], mode='lines', line=dict(width=0),
+                                 showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=bandas.index, y=bandas[bajo], mode='lines', line=dict(width=0),
+                                 fill='tonexty', fillcolor=f'rgba(39, 174, 96, {opacidad})',
+                                 name=f'{bajo} – {alto}', hovertemplate='%{x}<br>%{y:,.2f} €'))
+    fig.add_trace(go.Scatter(x=bandas.index, y=bandas[mediana], mode='lines', name=str(mediana),
+                             line=dict(color='#27ae60'), hovertemplate='%{x}<br>%{y:,.2f} €'))
+    fig.update_layout(
+        xaxis_title="Fecha", yaxis_title="Euros (€)", template="plotly_white",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3)
+    )
+    return fig
+
+
+@memorizar
+def figura_correlacion(correlacion):
+    # Mapa de calor de la matriz de correlaciones (etiquetas en filas y columnas); los
+    # valores se escriben en las celdas solo si caben
+    etiquetas = [str(c) for c in correlacion.columns]
+    fig = go.Figure(go.Heatmap(
+        z=correlacion.to_numpy(), x=etiquetas, y=etiquetas,
+        zmin=-1, zmax=1, colorscale='RdBu', reversescale=True,
+        text=correlacion.to_numpy().round(2) if len(etiquetas) <= 20 else None,
+        texttemplate='%{text}' if len(etiquetas) <= 20 else None,
+        hovertemplate='%{y}<br>%{x}<br>%{z:.2f}<extra></extra>',
+    ))
+    fig.update_layout(
+        template="plotly_white", height=min(max(400, 25 * len(etiquetas)), 1200),
+        yaxis=dict(autorange='reversed'), margin=dict(t=30, b=0, l=0, r=0),
+    )
+    return fig
+
+
+@memorizar
+def figura_pesos(tabla):
+    # Peso actual (a valor de mercado), objetivo y tras el plan de cada fondo
+    fig = go.Figure()
+    for columna, color in (('Peso Actual (%)', '#2980b9'), ('Objetivo (%)', '#95a5a6'), ('Peso Final (%)', '#27ae60')):
+        fig.add_trace(go.Bar(x=tabla['Fondo'], y=tabla[columna], name=columna.replace(' (%)', ''),
+                             marker_color=color, hovertemplate='%{x}<br>%{y:.2f} %<extra></extra>'))
+    fig.update_layout(
+        barmode='group', yaxis_title="Peso (%)", template="plotly_white",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3)
+    )
+    return fig
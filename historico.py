@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cache_precios import ultimo_dia_habil
+from cliente_http import cliente
+from configuracion import DIRECTORIO_CACHE
+from extraccion import extraer_historico_ft, extraer_xid_ft
+from precios import MAX_HILOS, TIMEOUT_PETICION, obtener_url_alternativa
+from precios_locales import RUTAS_PRECIOS, obtener_precios_locales
+
+DIRECTORIO_HISTORICO = os.path.join(DIRECTORIO_CACHE, "historico")
+URL_HISTORICO_FT = (
+    "https://markets.ft.com/data/equities/ajax/get-historical-prices"
+    "?startDate={inicio:%Y/%m/%d}&endDate={fin:%Y/%m/%d}&symbol={xid}"
+)
+# Primera fecha que se pide si no se indica otra y no hay nada guardado, y tamaño de cada tramo
+INICIO_HISTORICO = datetime(2015, 1, 1)
+DIAS_POR_CONSULTA = 365
+REINTENTO_MINIMO = int(os.environ.get("FONDOS_REINTENTO_HISTORICO", 3600))
+
+_ultimo_intento = {}
+_refrescando = set()
+_cerrojo = threading.Lock()
+
+
+def _ruta(isin):
+    return os.path.join(DIRECTORIO_HISTORICO, f"{isin}.parquet")
+
+
+def _leer_guardado(isin):
+    # Serie descargada y guardada de un ISIN (vacía si no hay)
+    try:
+        return pd.read_parquet(_ruta(isin))
+    except (OSError, ValueError):
+        return pd.DataFrame({"fecha": pd.Series(dtype="datetime64[ns]"), "precio": pd.Series(dtype="float64")})
+
+
+def leer_historico(isin, locales=True):
+    # Serie de un ISIN: DataFrame con columnas fecha y precio (vacío si no hay). La
+    # guardada se completa al leerla con la de los ficheros de precios locales, que
+    # nunca se guarda con ella; locales=False devuelve solo lo descargado.
+    historico = _leer_guardado(isin)
+    if not locales or not RUTAS_PRECIOS:
+        return historico
+    local = obtener_precios_locales().serie(isin)
+    if local.empty:
+        return historico
+    # En una misma fecha manda lo descargado
+    return (
+        pd.concat([local, historico.astype(local.dtypes.to_dict())], ignore_index=True)
+        .drop_duplicates("fecha", keep="last")
+        .sort_values("fecha", ignore_index=True)
+    )
+
+
+def isins_guardados():
+    try:
+        nombres = os.listdir(DIRECTORIO_HISTORICO)
+    except OSError:
+        return []
+    return sorted(nombre[:-len(".parquet")] for nombre in nombres if nombre.endswith(".parquet"))
+
+
+def version_historicos(isins):
+    # Versión de las series guardadas sin leerlas: cambia cuando se actualiza alguna o
+    # cambian los ficheros de precios locales
+    version = [("fichero", obtener_precios_locales().firma)] if RUTAS_PRECIOS else []
+    for isin in dict.fromkeys(i for i in isins if i):
+        try:
+            version.append((isin, os.stat(_ruta(isin)).st_mtime_ns))
+        except OSError:
+            version.append((isin, None))
+    return tuple(version)
+
+
+def _guardar_historico(isin, historico):
+    os.makedirs(DIRECTORIO_HISTORICO, exist_ok=True)
+    temporal = _ruta(isin) + ".tmp"
+    historico.to_parquet(temporal, index=False)
+    os.replace(temporal, _ruta(isin))
+
+
+def _descargar_ft(isin, desde, hasta):
+    website = obtener_url_alternativa(isin)
+    if not website:
+        return []
+    pagina = cliente.get(website, timeout=TIMEOUT_PETICION).text
+    filas = extraer_historico_ft(pagina)
+    # La página solo trae el último mes; para huecos mayores se consulta por tramos
+    if filas and min(f for f, _ in filas) <= desde:
+        return filas
+    xid = extraer_xid_ft(pagina)
+    if not xid:
+        return filas
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(inicio + timedelta(days=DIAS_POR_CONSULTA - 1), hasta)
+        respuesta = cliente.get(URL_HISTORICO_FT.format(inicio=inicio, fin=fin, xid=xid), timeout=TIMEOUT_PETICION)
+        if respuesta.status_code == 200:
+            filas.extend(extraer_historico_ft(respuesta.json().get("html", "")))
+        inicio = fin + timedelta(days=1)
+    return filas
+
+
+def actualizar_historico(isin, inicio=None):
+    # Descarga solo las fechas posteriores a la última guardada y las añade a la serie
+    # guardada (sin los precios locales, que se combinan al leer). Devuelve la serie guardada.
+    historico = _leer_guardado(isin)
+    if len(historico):
+        desde = (historico["fecha"].max() + timedelta(days=1)).to_pydatetime()
+    else:
+        desde = pd.Timestamp(inicio or INICIO_HISTORICO).to_pydatetime()
+    hasta = datetime.now()
+    with _cerrojo:
+        _ultimo_intento[isin] = time.time()
+    if desde.date() > hasta.date():
+        return historico
+
+    nuevas = pd.DataFrame(_descargar_ft(isin, desde, hasta), columns=["fecha", "precio"])
+    nuevas = nuevas[nuevas["fecha"] >= desde]
+    if nuevas.empty:
+        return historico
+    historico = (
+        pd.concat([historico, nuevas.astype(historico.dtypes.to_dict())], ignore_index=True)
+        .drop_duplicates("fecha", keep="last")
+        .sort_values("fecha", ignore_index=True)
+    )
+    _guardar_historico(isin, historico)
+    return historico
+
+
+def necesita_actualizar(isin, historico):
+    with _cerrojo:
+        intento = _ultimo_intento.get(isin, 0)
+    if time.time() - intento < REINTENTO_MINIMO:
+        return False
+    return historico.empty or historico["fecha"].max() < ultimo_dia_habil()
+
+
+def _actualizar_en_segundo_plano(isins, inicio):
+    with _cerrojo:
+        isins = [i for i in isins if i not in _refrescando]
+        _refrescando.update(isins)
+    if not isins:
+        return
+
+    def actualizar(isin):
+        try:
+            actualizar_historico(isin, inicio)
+        except Exception as e:
+            print(f"Error al actualizar el histórico de {isin}: {e}")
+        finally:
+            with _cerrojo:
+                _refrescando.discard(isin)
+
+    def tarea():
+        with ThreadPoolExecutor(max_workers=MAX_HILOS) as pool:
+            list(pool.map(actualizar, isins))
+
+    threading.Thread(target=tarea, name="refresco-historico", daemon=True).start()
+
+
+def obtener_historicos(isins, inicio=None):
+    # Devuelve {isin: serie guardada} al momento y completa en segundo plano las series
+    # a las que les falten valores liquidativos publicados desde la última consulta.
+    # inicio es la primera fecha que interesa cuando aún no hay nada guardado.
+    historicos = {isin: leer_historico(isin) for isin in dict.fromkeys(i for i in isins if i)}
+    pendientes = [isin for isin, historico in historicos.items() if necesita_actualizar(isin, historico)]
+    if pendientes:
+        _actualizar_en_segundo_plano(pendientes, inicio)
+    return historicos
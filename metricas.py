@@ -0,0 +1,164 @@
+# Instrumentación ligera: duración de cada etapa (tramos) y contadores de aciertos y
+# fallos de las cachés. Se consultan desde el panel de diagnóstico de la aplicación,
+# como texto de Prometheus (FONDOS_PUERTO_METRICAS) o como log JSON por tramo
+# (FONDOS_LOG_METRICAS=1).
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Duraciones que se guardan por tramo para calcular percentiles
+MUESTRAS_POR_TRAMO = 1000
+PUERTO_METRICAS = int(os.environ.get("FONDOS_PUERTO_METRICAS", 0))
+LOG_METRICAS = os.environ.get("FONDOS_LOG_METRICAS", "") not in ("", "0")
+
+registro_log = logging.getLogger("fondos.metricas")
+if LOG_METRICAS and not registro_log.handlers:
+    registro_log.addHandler(logging.StreamHandler())
+    registro_log.setLevel(logging.INFO)
+
+_tramos = {}
+_contadores = {}
+_cerrojo = threading.Lock()
+_servidor = None
+
+
+def _clave(nombre, etiquetas):
+    return (nombre, tuple(sorted(etiquetas.items())))
+
+
+def anotar_tramo(nombre, segundos, **etiquetas):
+    clave = _clave(nombre, etiquetas)
+    with _cerrojo:
+        datos = _tramos.get(clave)
+        if datos is None:
+            datos = _tramos[clave] = {"muestras": deque(maxlen=MUESTRAS_POR_TRAMO), "n": 0, "total": 0.0}
+        datos["muestras"].append(segundos)
+        datos["n"] += 1
+        datos["total"] += segundos
+    if LOG_METRICAS:
+        registro_log.info(json.dumps({"tramo": nombre, "segundos": round(segundos, 6), **etiquetas}))
+
+
+@contextmanager
+def tramo(nombre, **etiquetas):
+    # Mide el bloque aunque termine con excepción
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        anotar_tramo(nombre, time.perf_counter() - inicio, **etiquetas)
+
+
+def contar(nombre, n=1, **etiquetas):
+    if not n:
+        return
+    clave = _clave(nombre, etiquetas)
+    with _cerrojo:
+        _contadores[clave] = _contadores.get(clave, 0) + n
+
+
+def tramos():
+    # Una fila por tramo y etiquetas con número de muestras, p50, p95, máximo y último (s)
+    with _cerrojo:
+        copia = {clave: (list(d["muestras"]), d["n"], d["total"]) for clave, d in _tramos.items()}
+    filas = []
+    for (nombre, etiquetas), (muestras, n, total) in sorted(copia.items()):
+        p50, p95 = np.percentile(muestras, [50, 95])
+        filas.append({
+            "tramo": nombre, "etiquetas": dict(etiquetas), "n": n, "total": total,
+            "p50": p50, "p95": p95, "max": max(muestras), "ultimo": muestras[-1],
+        })
+    return filas
+
+
+def contadores():
+    with _cerrojo:
+        return [
+            {"contador": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+            for (nombre, etiquetas), valor in sorted(_contadores.items())
+        ]
+
+
+def _etiquetas_prometheus(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in sorted(etiquetas.items())) + "}"
+
+
+def texto_prometheus(extra=None):
+    # Formato de exposición de Prometheus. Los tramos son summaries con cuantiles 0.5 y
+    # 0.95; extra son gauges adicionales {nombre: [(etiquetas, valor)]}.
+    lineas = ["# TYPE fondos_tramo_segundos summary"]
+    for fila in tramos():
+        etiquetas = dict(fila["etiquetas"], tramo=fila["tramo"])
+        for cuantil, campo in (("0.5", "p50"), ("0.95", "p95")):
+            lineas.append(f"fondos_tramo_segundos{_etiquetas_prometheus(dict(etiquetas, quantile=cuantil))} {fila[campo]:.6f}")
+        lineas.append(f"fondos_tramo_segundos_sum{_etiquetas_prometheus(etiquetas)} {fila['total']:.6f}")
+        lineas.append(f"fondos_tramo_segundos_count{_etiquetas_prometheus(etiquetas)} {fila['n']}")
+    nombres = sorted({fila["contador"] for fila in contadores()})
+    for nombre in nombres:
+        lineas.append(f"# TYPE fondos_{nombre}_total counter")
+        for fila in contadores():
+            if fila["contador"] == nombre:
+                lineas.append(f"fondos_{nombre}_total{_etiquetas_prometheus(fila['etiquetas'])} {fila['valor']}")
+    for nombre, valores in (extra or {}).items():
+        lineas.append(f"# TYPE fondos_{nombre} gauge")
+        for etiquetas, valor in valores:
+            lineas.append(f"fondos_{nombre}{_etiquetas_prometheus(etiquetas)} {valor}")
+    return "\n".join(lineas) + "\n"
+
+
+def metricas_externas():
+    # Estado del cliente HTTP por host y de la salud de cada fuente de precios
+    from cliente_http import cliente
+    from precios import salud
+
+    extra = {}
+    for host, stats in cliente.estadisticas().items():
+        for campo in ("peticiones", "errores", "reintentos", "no_modificados", "latencia_media", "latencia_maxima"):
+            extra.setdefault(f"http_{campo}", []).append(({"host": host}, stats[campo]))
+    for fuente, datos in salud.estadisticas().items():
+        for campo in ("aciertos", "sin_precio", "fallos", "tasa_acierto", "latencia_media"):
+            if datos[campo] is not None:
+                extra.setdefault(f"fuente_{campo}", []).append(({"fuente": fuente}, datos[campo]))
+    return extra
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = texto_prometheus(metricas_externas()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor(puerto=PUERTO_METRICAS):
+    # Servidor de /metrics en un hilo, una vez por proceso; sin puerto configurado no hace nada
+    global _servidor
+    if not puerto:
+        return None
+    with _cerrojo:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer(("", puerto), _Manejador)
+            except OSError as e:
+                print(f"No se pudo abrir el puerto de métricas {puerto}: {e}")
+                return None
+            threading.Thread(target=_servidor.serve_forever, name="metricas", daemon=True).start()
+        return _servidor
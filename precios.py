@@ -0,0 +1,255 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import pandas as pd
+import requests
+
+from cliente_http import ESTADOS_REINTENTABLES, cliente
+from extraccion import extraer_ft, extraer_morningstar
+from metricas import anotar_tramo
+from precios_locales import obtener_precio_y_fecha_local, url_local
+from registro import obtener_registro
+
+# Tiempo máximo por petición HTTP (conexión, lectura) y plazo total del lote
+TIMEOUT_PETICION = (5, 15)
+PLAZO_TOTAL = 30
+MAX_HILOS = 16
+# Una fuente que falla tantas veces seguidas se deja de consultar durante el enfriamiento.
+# Solo cuentan los fallos de la fuente entera (red, timeouts, 429/5xx), no que no tenga
+# el precio de un ISIN concreto.
+FALLOS_PARA_ENFRIAR = int(os.environ.get("FONDOS_FALLOS_FUENTE", 3))
+ENFRIAMIENTO = int(os.environ.get("FONDOS_ENFRIAMIENTO_FUENTE", 300))
+
+
+def obtener_url_alternativa(isin):
+    return obtener_registro().url(isin, "ft")
+
+
+def obtener_url_morningstar(isin):
+    return obtener_registro().url(isin, "morningstar")
+
+
+def _descargar(website, timeout):
+    # Los errores de red y los 429/5xx se propagan como requests.RequestException: son
+    # fallos de la fuente. Un 404 o una página sin precio solo afectan a ese ISIN.
+    respuesta = cliente.get(website, timeout=timeout)
+    if respuesta.status_code in ESTADOS_REINTENTABLES:
+        respuesta.raise_for_status()
+    return respuesta
+
+
+def obtener_precio_y_fecha_alt(isin, timeout=TIMEOUT_PETICION):
+    website = obtener_url_alternativa(isin)
+    if not website:
+        return None, None
+    result = _descargar(website, timeout)
+    textos = extraer_ft(result.text)
+    if textos["precio"] is None:
+        print(f"⚠️ No se encontró el precio para {isin} en FT.")
+        return None, None
+    precio_str = textos["precio"].strip()
+    precio_str = precio_str.replace(',', '')  # elimina separador de miles
+    precio = float(precio_str)
+    match = re.search(r'as of ([A-Za-z]+ \d{1,2} \d{4})', textos["fecha"].strip())
+    fecha_str = match.group(1)
+    fecha_obj = datetime.strptime(fecha_str, "%b %d %Y")
+    return round(precio, 2) if precio else None, fecha_obj
+def obtener_precio_y_fecha_mor(isin, timeout=TIMEOUT_PETICION):
+    website = obtener_url_morningstar(isin)
+    if not website:
+        return None, None
+    result = _descargar(website, timeout)
+    try:
+        textos = extraer_morningstar(result.text)
+
+        if textos["precio"] is None or textos["fecha"] is None:
+            return None, None
+
+        # Obtener precio
+        precio_texto = textos["precio"].strip()
+        # Extraer el número final (normalmente viene como "EUR 123.45")
+        match_precio = re.search(r"(\d+,\d+|\d+\.\d+)$", precio_texto)
+        if not match_precio:
+            return None, None
+        precio = float(match_precio.group(1).replace(",", "."))
+
+        # Obtener fecha
+        fecha_texto = textos["fecha"].strip()
+        # Extraer fechas válidas (día entre 1 y 31)
+        match_fecha = re.search(r"\b([1-9]|[12][0-9]|3[01])/([01][0-9])/(\d{4})\b", fecha_texto)
+        if not match_fecha:
+            return None, None
+        fecha = datetime.strptime(match_fecha.group(0), "%d/%m/%Y")
+
+        return round(precio, 2), fecha
+    except Exception as e:
+        print(f"Error mor ({isin}): {e}")
+        return None, None
+
+
+def ultimo_dia_habil(hoy=None):
+    # Fecha del último valor liquidativo que cabe esperar (día hábil anterior a hoy)
+    hoy = pd.Timestamp(hoy or datetime.now()).normalize()
+    return (hoy - pd.offsets.BDay(1)).to_pydatetime()
+
+
+class SaludFuentes:
+    # Aciertos, consultas sin precio, fallos y latencia de cada fuente. Tras
+    # FALLOS_PARA_ENFRIAR fallos seguidos de la fuente (no respuestas sin el precio de
+    # un ISIN) se salta durante ENFRIAMIENTO segundos; las demás se ordenan por tasa de
+    # acierto y latencia media.
+    def __init__(self, fallos_para_enfriar=FALLOS_PARA_ENFRIAR, enfriamiento=ENFRIAMIENTO):
+        self.fallos_para_enfriar = fallos_para_enfriar
+        self.enfriamiento = enfriamiento
+        self._datos = {}
+        self._cerrojo = threading.Lock()
+
+    def _fuente(self, fuente):
+        return self._datos.setdefault(fuente, {
+            "aciertos": 0, "sin_precio": 0, "fallos": 0, "fallos_seguidos": 0,
+            "latencia_total": 0.0, "enfriada_hasta": 0.0,
+        })
+
+    def anotar(self, fuente, resultado, latencia):
+        # resultado: "acierto", "sin_precio" (la fuente respondió sin el precio) o "fallo"
+        with self._cerrojo:
+            datos = self._fuente(fuente)
+            datos["latencia_total"] += latencia
+            if resultado == "acierto":
+                datos["aciertos"] += 1
+                datos["fallos_seguidos"] = 0
+            elif resultado == "sin_precio":
+                datos["sin_precio"] += 1
+                datos["fallos_seguidos"] = 0
+            else:
+                datos["fallos"] += 1
+                datos["fallos_seguidos"] += 1
+                if datos["fallos_seguidos"] >= self.fallos_para_enfriar:
+                    datos["enfriada_hasta"] = time.time() + self.enfriamiento
+                    datos["fallos_seguidos"] = 0
+                    print(f"⚠️ Fuente {fuente} en enfriamiento durante {self.enfriamiento}s.")
+
+    def disponible(self, fuente, ahora=None):
+        ahora = time.time() if ahora is None else ahora
+        with self._cerrojo:
+            return self._datos.get(fuente, {}).get("enfriada_hasta", 0.0) <= ahora
+
+    def _puntuacion(self, fuente):
+        datos = self._datos.get(fuente)
+        if not datos:
+            return (1.0, 0.0)
+        consultas = datos["aciertos"] + datos["sin_precio"] + datos["fallos"]
+        return (datos["aciertos"] / consultas, -datos["latencia_total"] / consultas)
+
+    def ordenar(self, fuentes):
+        # Fuentes disponibles de mejor a peor; las que están en enfriamiento no se devuelven
+        disponibles = [f for f in fuentes if self.disponible(f)]
+        with self._cerrojo:
+            return sorted(disponibles, key=self._puntuacion, reverse=True)
+
+    def estadisticas(self):
+        with self._cerrojo:
+            resultado = {}
+            for fuente, datos in self._datos.items():
+                consultas = datos["aciertos"] + datos["sin_precio"] + datos["fallos"]
+                resultado[fuente] = dict(
+                    datos,
+                    tasa_acierto=datos["aciertos"] / consultas if consultas else None,
+                    latencia_media=datos["latencia_total"] / consultas if consultas else None,
+                )
+            return resultado
+
+
+salud = SaludFuentes()
+
+# Fuentes de precios: nombre -> (url del ISIN, consulta). Los ficheros locales
+# (FONDOS_PRECIOS_LOCALES) compiten como una fuente más y responden sin red.
+FUENTES = {
+    "morningstar": (obtener_url_morningstar, obtener_precio_y_fecha_mor),
+    "ft": (obtener_url_alternativa, obtener_precio_y_fecha_alt),
+    "fichero": (url_local, obtener_precio_y_fecha_local),
+}
+
+
+def _consultar(fuente, isin, timeout):
+    # Consulta una fuente y anota en la salud si trajo precio y cuánto tardó. Solo un
+    # error de red o de servidor cuenta como fallo de la fuente
+    inicio = time.monotonic()
+    resultado = None, None
+    fallo = False
+    try:
+        resultado = FUENTES[fuente][1](isin, timeout)
+    except requests.RequestException as e:
+        fallo = True
+        print(f"Error {fuente} ({isin}): {e}")
+    except Exception as e:
+        print(f"Error {fuente} ({isin}): {e}")
+    latencia = time.monotonic() - inicio
+    salud.anotar(fuente, "fallo" if fallo else "acierto" if resultado[1] is not None else "sin_precio", latencia)
+    anotar_tramo("scraping", latencia, fuente=fuente, isin=isin)
+    return resultado
+
+
+def _resultado_futuro(futuro):
+    # Un futuro sin terminar (plazo agotado) cuenta como fuente sin precio
+    if futuro is None or not futuro.done() or futuro.cancelled():
+        return None, None
+    return futuro.result()
+
+
+def obtener_precios_con_fuente(isins, max_hilos=MAX_HILOS, timeout=TIMEOUT_PETICION, plazo_total=PLAZO_TOTAL):
+    # Lanza en paralelo las consultas a todas las fuentes de todos los ISIN y devuelve
+    # {isin: (precio, fecha, fuente)} con el precio más reciente de cada uno.
+    # Las fuentes de cada ISIN compiten: en cuanto una trae el valor liquidativo del
+    # último día hábil se da el ISIN por resuelto y no se espera a las demás.
+    isins = list(dict.fromkeys(i for i in isins if i))
+    if not isins:
+        return {}
+
+    esperada = ultimo_dia_habil()
+    pool = ThreadPoolExecutor(max_workers=max_hilos)
+    futuros = {}
+    de_futuro = {}
+    # Primero la mejor fuente de cada ISIN, así con pocos hilos es la que empieza antes
+    fuentes_isin = {
+        isin: [f for f in salud.ordenar(FUENTES) if FUENTES[f][0](isin)] for isin in isins
+    }
+    for ronda in range(len(FUENTES)):
+        for isin, fuentes in fuentes_isin.items():
+            if ronda < len(fuentes):
+                futuro = pool.submit(_consultar, fuentes[ronda], isin, timeout)
+                futuros.setdefault(isin, {})[fuentes[ronda]] = futuro
+                de_futuro[futuro] = isin
+
+    inicio = time.monotonic()
+    pendientes = set(de_futuro)
+    while pendientes:
+        restante = plazo_total - (time.monotonic() - inicio)
+        if restante <= 0:
+            print(f"⚠️ Plazo de {plazo_total}s agotado al obtener precios.")
+            break
+        hechos, pendientes = wait(pendientes, timeout=restante, return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            isin = de_futuro[futuro]
+            _, fecha = _resultado_futuro(futuro)
+            if fecha is not None and fecha >= esperada:
+                # Resuelto: las demás fuentes del ISIN se cancelan o se ignoran
+                for otro in futuros[isin].values():
+                    otro.cancel()
+                pendientes -= set(futuros[isin].values())
+    # No se espera a los hilos que sigan colgados: su resultado se descarta
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    resultados = {}
+    for isin in isins:
+        mejor = None, None, None
+        for fuente, futuro in futuros.get(isin, {}).items():
+            precio, fecha = _resultado_futuro(futuro)
+            if fecha is not None and (mejor[1] is None or fecha > mejor[1]):
+                mejor = precio, fecha, fuente
+        resultados[isin] = mejor
+    return resultados
@@ -0,0 +1,221 @@
+# Precios desde ficheros locales: valores liquidativos por ISIN y fecha para equipos sin
+# salida a FT ni a Morningstar. FONDOS_PRECIOS_LOCALES apunta a uno o varios ficheros
+# o directorios (separados por ':'); en un directorio cada fichero es un ISIN
+# (IE00BYX5NX33.parquet) o trae su propia columna isin. Se leen CSV, Parquet y Arrow
+# (.arrow/.feather); Parquet y Arrow con memoria mapeada.
+#
+# El mismo formato es el que vuelca la exportación de la caché, para obtener los precios
+# en una máquina y reutilizarlos en otras:
+#
+#   python precios_locales.py --salida precios.parquet
+#   python precios_locales.py --salida precios/ --por-isin [--formato csv]
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+RUTAS_PRECIOS = [r for r in os.environ.get("FONDOS_PRECIOS_LOCALES", "").split(os.pathsep) if r]
+# Cada cuánto se comprueba si los ficheros han cambiado
+REVISAR_CADA = int(os.environ.get("FONDOS_REVISAR_PRECIOS_LOCALES", 60))
+EXTENSIONES = (".csv", ".parquet", ".arrow", ".feather")
+FORMATOS = ("parquet", "csv", "arrow")
+# Nombres de columna que se aceptan además de isin, fecha y precio
+ALIAS_COLUMNAS = {"date": "fecha", "nav": "precio", "price": "precio", "vl": "precio"}
+
+_precios = None
+_cerrojo = threading.Lock()
+
+
+def _ficheros(rutas):
+    ficheros = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            ficheros.extend(
+                os.path.join(ruta, nombre) for nombre in sorted(os.listdir(ruta))
+                if nombre.lower().endswith(EXTENSIONES)
+            )
+        elif os.path.exists(ruta):
+            ficheros.append(ruta)
+        else:
+            print(f"⚠️ No existe el fichero de precios {ruta}.")
+    return ficheros
+
+
+def firma(rutas):
+    # Cambia cuando se añade, quita o modifica alguno de los ficheros
+    firmas = []
+    for fichero in _ficheros(rutas):
+        estado = os.stat(fichero)
+        firmas.append((fichero, estado.st_mtime_ns, estado.st_size))
+    return tuple(firmas)
+
+
+def leer_fichero(ruta):
+    # Tabla isin, fecha, precio de un fichero; sin columna isin, el ISIN es el nombre del fichero
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".parquet":
+        tabla = pq.read_table(ruta, memory_map=True)
+    elif extension in (".arrow", ".feather"):
+        with pa.memory_map(ruta) as fuente:
+            tabla = pa.ipc.open_file(fuente).read_all()
+    elif extension == ".csv":
+        tabla = pa_csv.read_csv(ruta)
+    else:
+        raise ValueError(f"Formato de precios no soportado: {ruta}")
+
+    df = tabla.to_pandas()
+    df.columns = [ALIAS_COLUMNAS.get(str(c).strip().lower(), str(c).strip().lower()) for c in df.columns]
+    if "isin" not in df.columns:
+        df["isin"] = os.path.splitext(os.path.basename(ruta))[0].upper()
+    faltan = [c for c in ("fecha", "precio") if c not in df.columns]
+    if faltan:
+        raise ValueError(f"Faltan columnas en {ruta}: {', '.join(faltan)}")
+    return pd.DataFrame({
+        "isin": df["isin"].astype("str").str.strip().str.upper(),
+        "fecha": pd.to_datetime(df["fecha"]).astype("datetime64[ns]"),
+        "precio": pd.to_numeric(df["precio"], errors="coerce"),
+    })
+
+
+def _tabla_vacia():
+    return pd.DataFrame({
+        "isin": pd.Series(dtype="str"),
+        "fecha": pd.Series(dtype="datetime64[ns]"),
+        "precio": pd.Series(dtype="float64"),
+    })
+
+
+class PreciosLocales:
+    # Todas las series de los ficheros, ordenadas por ISIN y fecha, con la posición de
+    # cada ISIN para servir su serie o su último precio sin recorrer la tabla
+    def __init__(self, rutas=RUTAS_PRECIOS):
+        self.rutas = list(rutas)
+        self.firma = firma(self.rutas)
+        self.revisado = time.monotonic()
+        tablas = []
+        for fichero, _, _ in self.firma:
+            try:
+                tablas.append(leer_fichero(fichero))
+            except (OSError, ValueError, pa.ArrowException) as e:
+                print(f"⚠️ No se pudo leer el fichero de precios {fichero}: {e}")
+        tabla = pd.concat(tablas, ignore_index=True) if tablas else _tabla_vacia()
+        # Si un ISIN y fecha se repiten, manda el último fichero
+        self.tabla = (
+            tabla.dropna().drop_duplicates(["isin", "fecha"], keep="last")
+            .sort_values(["isin", "fecha"], ignore_index=True)
+        )
+        isins, inicios = np.unique(self.tabla["isin"].to_numpy(), return_index=True)
+        fines = np.append(inicios[1:], len(self.tabla))
+        self._posiciones = {isin: (int(inicio), int(fin)) for isin, inicio, fin in zip(isins, inicios, fines)}
+
+    def tiene(self, isin):
+        return isin in self._posiciones
+
+    def isins(self):
+        return list(self._posiciones)
+
+    def serie(self, isin):
+        # DataFrame fecha, precio como los de historico (vacío si el ISIN no está)
+        inicio, fin = self._posiciones.get(isin, (0, 0))
+        return self.tabla.iloc[inicio:fin][["fecha", "precio"]].reset_index(drop=True)
+
+    def ultimo(self, isin):
+        # (precio, fecha) del valor liquidativo más reciente, o (None, None)
+        if isin not in self._posiciones:
+            return None, None
+        fila = self.tabla.iloc[self._posiciones[isin][1] - 1]
+        return float(fila["precio"]), fila["fecha"].to_pydatetime()
+
+
+def obtener_precios_locales():
+    # Instancia compartida; se vuelve a leer si los ficheros han cambiado (como mucho cada REVISAR_CADA s)
+    global _precios
+    with _cerrojo:
+        if _precios is None:
+            _precios = PreciosLocales()
+        elif _precios.rutas and time.monotonic() - _precios.revisado >= REVISAR_CADA:
+            if firma(_precios.rutas) != _precios.firma:
+                _precios = PreciosLocales(_precios.rutas)
+            else:
+                _precios.revisado = time.monotonic()
+        return _precios
+
+
+def url_local(isin):
+    # Hace el papel de la URL de las demás fuentes: si no es None, la fuente tiene el ISIN
+    return "fichero" if RUTAS_PRECIOS and obtener_precios_locales().tiene(isin) else None
+
+
+def obtener_precio_y_fecha_local(isin, timeout=None):
+    return obtener_precios_locales().ultimo(isin)
+
+
+def tabla_cache():
+    # Caché de precios completa en el formato de los ficheros: las series guardadas de
+    # historico más el último precio de cada ISIN de la caché de precios
+    import cache_precios
+    import historico
+
+    tablas = [historico.leer_historico(isin).assign(isin=isin) for isin in historico.isins_guardados()]
+    ultimos = cache_precios.obtener_almacen().leer_todos()
+    tablas.append(pd.DataFrame(
+        [(isin, r["fecha"], r["precio"]) for isin, r in ultimos.items()], columns=["isin", "fecha", "precio"]
+    ))
+    tabla = pd.concat([t for t in tablas if len(t)] or [_tabla_vacia()], ignore_index=True)
+    tabla = tabla.astype({"fecha": "datetime64[ns]", "precio": "float64"})[["isin", "fecha", "precio"]]
+    return tabla.drop_duplicates(["isin", "fecha"], keep="last").sort_values(["isin", "fecha"], ignore_index=True)
+
+
+def escribir(tabla, ruta, formato):
+    if formato == "parquet":
+        tabla.to_parquet(ruta, index=False)
+    elif formato == "csv":
+        tabla.to_csv(ruta, index=False, date_format="%Y-%m-%d")
+    elif formato == "arrow":
+        tabla.to_feather(ruta)
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+
+def exportar(salida, formato=None, por_isin=False):
+    # Vuelca la caché en un fichero (formato por su extensión si no se indica) o, con
+    # por_isin, en un directorio con un fichero por ISIN. Devuelve las filas escritas.
+    tabla = tabla_cache()
+    if por_isin:
+        formato = formato or "parquet"
+        os.makedirs(salida, exist_ok=True)
+        extension = ".arrow" if formato == "arrow" else f".{formato}"
+        for isin, serie in tabla.groupby("isin", sort=False):
+            escribir(serie[["fecha", "precio"]], os.path.join(salida, isin + extension), formato)
+    else:
+        formato = formato or {".csv": "csv", ".arrow": "arrow", ".feather": "arrow"}.get(
+            os.path.splitext(salida)[1].lower(), "parquet"
+        )
+        directorio = os.path.dirname(salida)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        escribir(tabla, salida, formato)
+    return len(tabla)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta la caché de precios para usarla como FONDOS_PRECIOS_LOCALES")
+    parser.add_argument("--salida", required=True, help="fichero o, con --por-isin, directorio de salida")
+    parser.add_argument("--formato", choices=FORMATOS, help="por defecto, según la extensión de la salida")
+    parser.add_argument("--por-isin", action="store_true", help="un fichero por ISIN en el directorio de salida")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    filas = exportar(args.salida, args.formato, args.por_isin)
+    print(f"{args.salida}: {filas} precios ({time.perf_counter() - inicio:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
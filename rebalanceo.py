@@ -0,0 +1,120 @@
+# Rebalanceo hacia pesos objetivo: desviación de la cartera a valor de mercado y plan de
+# movimientos (solo aportar, solo retirar o comprar y vender) que deja los pesos lo más
+# cerca posible del objetivo. El error de seguimiento se mide como la distancia euclídea
+# entre pesos (en puntos porcentuales), que no necesita historia de precios.
+#
+# El plan óptimo es la proyección del déficit de cada fondo sobre {l ≤ x ≤ u, Σx = importe}:
+# un problema cuadrático con una sola restricción de igualdad cuya solución es
+# x = clip(déficit − τ, l, u) para un único τ. Se busca τ por bisección para todos los
+# fondos a la vez y se termina con la fórmula cerrada sobre los fondos no acotados.
+
+import numpy as np
+import pandas as pd
+
+ITERACIONES_BISECCION = 100
+MODOS = ("aportar", "compraventa")
+
+
+def normalizar_pesos(objetivo):
+    # Pesos objetivo como fracciones que suman 1 (los negativos cuentan como 0)
+    objetivo = np.clip(np.asarray(objetivo, dtype="float64"), 0.0, None)
+    total = objetivo.sum()
+    if total <= 0:
+        raise ValueError("Los pesos objetivo deben sumar más de 0")
+    return objetivo / total
+
+
+def error_seguimiento(valores, objetivo):
+    # Distancia entre los pesos de valores y los pesos objetivo, en puntos porcentuales
+    valores = np.asarray(valores, dtype="float64")
+    total = valores.sum()
+    pesos = valores / total if total > 0 else np.zeros_like(valores)
+    return float(np.linalg.norm(pesos - normalizar_pesos(objetivo)) * 100)
+
+
+def proyectar(deficit, importe, inferior, superior):
+    # x que minimiza ||x − deficit||² con inferior ≤ x ≤ superior y Σx = importe.
+    # Σ clip(deficit − τ, inferior, superior) decrece con τ: se acota τ por bisección
+    # y, con los fondos que quedan entre los límites, se resuelve exacto.
+    deficit = np.asarray(deficit, dtype="float64")
+    inferior = np.broadcast_to(np.asarray(inferior, dtype="float64"), deficit.shape)
+    superior = np.broadcast_to(np.asarray(superior, dtype="float64"), deficit.shape)
+    if inferior.sum() > importe or superior.sum() < importe:
+        raise ValueError("No hay ningún plan que cumpla los límites con ese importe")
+
+    def suma(tau):
+        return np.clip(deficit - tau, inferior, superior).sum()
+
+    # Cotas de τ. Con τ ≤ min(deficit − superior) los fondos con límite superior están en
+    # él y los demás aportan deficit − τ, así que la suma es al menos
+    # Σ superior + Σ (deficit − τ) ≥ importe si además τ ≤ (Σ superior + Σ deficit −
+    # importe) / n con n los fondos sin límite superior. Igual, al revés, para alto.
+    con_superior = np.isfinite(superior)
+    bajo = np.min(deficit[con_superior] - superior[con_superior], initial=np.inf)
+    if not con_superior.all():
+        sin_limite = ~con_superior
+        bajo = min(bajo, (superior[con_superior].sum() + deficit[sin_limite].sum() - importe) / sin_limite.sum())
+    con_inferior = np.isfinite(inferior)
+    alto = np.max(deficit[con_inferior] - inferior[con_inferior], initial=-np.inf)
+    if not con_inferior.all():
+        sin_limite = ~con_inferior
+        alto = max(alto, (inferior[con_inferior].sum() + deficit[sin_limite].sum() - importe) / sin_limite.sum())
+    for _ in range(ITERACIONES_BISECCION):
+        medio = (bajo + alto) / 2
+        if suma(medio) > importe:
+            bajo = medio
+        else:
+            alto = medio
+        if alto - bajo <= 1e-12 * max(1.0, abs(medio)):
+            break
+    tau = (bajo + alto) / 2
+    x = np.clip(deficit - tau, inferior, superior)
+    libres = (deficit - tau > inferior) & (deficit - tau < superior)
+    if libres.any():
+        # Fórmula cerrada de τ con el conjunto de fondos libres ya fijado
+        fijos = x[~libres].sum()
+        tau = (deficit[libres].sum() + fijos - importe) / libres.sum()
+        x[libres] = np.clip(deficit[libres] - tau, inferior[libres], superior[libres])
+    return x
+
+
+def plan_rebalanceo(valores, objetivo, importe=0.0, modo="aportar"):
+    # Movimiento en euros por fondo (positivo compra, negativo venta) que deja la
+    # cartera más cerca de los pesos objetivo:
+    #   aportar:      reparte importe (> 0) solo con compras o, si es negativo, lo
+    #                 retira solo con ventas
+    #   compraventa:  compra y vende lo necesario con una entrada neta de importe
+    # Las ventas nunca superan el valor del fondo.
+    valores = np.asarray(valores, dtype="float64")
+    if modo not in MODOS:
+        raise ValueError(f"Modo de rebalanceo desconocido: {modo}")
+    if valores.sum() + importe < 0:
+        raise ValueError("No se puede retirar más que el valor de la cartera")
+    deficit = normalizar_pesos(objetivo) * (valores.sum() + importe) - valores
+    if modo == "compraventa":
+        return proyectar(deficit, importe, -valores, np.inf)
+    if importe >= 0:
+        return proyectar(deficit, importe, 0.0, np.inf)
+    return proyectar(deficit, importe, -valores, 0.0)
+
+
+def tabla_rebalanceo(fondos, valores, objetivo, importe=0.0, modo="aportar"):
+    # Una fila por fondo con su valor y peso actuales, el objetivo, la desviación a
+    # valor de mercado y el plan (movimiento, valor y peso resultantes)
+    valores = np.asarray(valores, dtype="float64")
+    pesos_objetivo = normalizar_pesos(objetivo)
+    movimiento = plan_rebalanceo(valores, pesos_objetivo, importe, modo)
+    total = valores.sum()
+    final = valores + movimiento
+    tabla = pd.DataFrame({
+        "Fondo": list(fondos),
+        "Valor Actual": valores,
+        "Peso Actual (%)": valores / total * 100 if total > 0 else 0.0,
+        "Objetivo (%)": pesos_objetivo * 100,
+    })
+    tabla["Desviación (%)"] = tabla["Peso Actual (%)"] - tabla["Objetivo (%)"]
+    tabla["Desviación (€)"] = valores - pesos_objetivo * total
+    tabla["Movimiento (€)"] = movimiento
+    tabla["Valor Final"] = final
+    tabla["Peso Final (%)"] = final / final.sum() * 100 if final.sum() > 0 else 0.0
+    return tabla
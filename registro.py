@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+
+# Registro de fondos: nombre en el libro, ISIN, fuentes de precio, orden de presentación y,
+# opcionalmente, peso objetivo en la cartera ("objetivo", en %).
+# Añadir un fondo es añadir una línea a fondos.json (o al fichero de FONDOS_REGISTRO).
+RUTA_REGISTRO = os.environ.get(
+    "FONDOS_REGISTRO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fondos.json")
+)
+
+
+class RegistroFondos:
+    # Fondos en orden de presentación con índices por ISIN y por nombre. Las URL de
+    # cada fuente salen de la plantilla del proveedor con el ISIN y los parámetros del fondo.
+    def __init__(self, proveedores, fondos):
+        self.proveedores = dict(proveedores)
+        self.fondos = []
+        self._por_isin = {}
+        self._por_nombre = {}
+        for fondo in fondos:
+            fondo = {
+                "nombre": fondo["nombre"].strip(), "isin": fondo["isin"], "fuentes": fondo.get("fuentes", {}),
+                "objetivo": fondo.get("objetivo"),
+            }
+            if fondo["nombre"] in self._por_nombre:
+                raise ValueError(f"Fondo duplicado en el registro: {fondo['nombre']}")
+            for proveedor in fondo["fuentes"]:
+                if proveedor not in self.proveedores:
+                    raise ValueError(f"Proveedor desconocido '{proveedor}' en {fondo['nombre']}")
+            self.fondos.append(fondo)
+            self._por_nombre[fondo["nombre"]] = fondo
+            self._por_isin.setdefault(fondo["isin"], fondo)
+        # Nombre -> ISIN, la forma que esperan valoracion y rentabilidad
+        self.mapa_isin = {fondo["nombre"]: fondo["isin"] for fondo in self.fondos}
+
+    @classmethod
+    def desde_fichero(cls, ruta=RUTA_REGISTRO):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        return cls(datos.get("proveedores", {}), datos.get("fondos", []))
+
+    def por_isin(self, isin):
+        return self._por_isin.get(isin)
+
+    def por_nombre(self, nombre):
+        if not isinstance(nombre, str):
+            return None
+        return self._por_nombre.get(nombre.strip())
+
+    def isin(self, nombre):
+        fondo = self.por_nombre(nombre)
+        return fondo["isin"] if fondo else None
+
+    def isins(self):
+        return list(self._por_isin)
+
+    def orden(self):
+        return [fondo["nombre"] for fondo in self.fondos]
+
+    def objetivos(self):
+        # Peso objetivo (%) por nombre de los fondos que lo tienen
+        return {fondo["nombre"]: float(fondo["objetivo"]) for fondo in self.fondos if fondo["objetivo"] is not None}
+
+    def url(self, isin, proveedor):
+        # URL del fondo en un proveedor, o None si el fondo no tiene esa fuente
+        fondo = self._por_isin.get(isin)
+        if fondo is None or proveedor not in fondo["fuentes"]:
+            return None
+        return self.proveedores[proveedor].format(isin=isin, **fondo["fuentes"][proveedor])
+
+
+_registro = None
+_cerrojo = threading.Lock()
+
+
+def obtener_registro():
+    # Se carga una vez por proceso
+    global _registro
+    with _cerrojo:
+        if _registro is None:
+            _registro = RegistroFondos.desde_fichero()
+        return _registro
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+# Intervalo de búsqueda de la TIR anual y tolerancias del método de Newton con bisección
+TIR_MINIMA = -0.9999
+TIR_MAXIMA = 100.0
+TOLERANCIA = 1e-10
+MAX_ITERACIONES = 100
+
+
+def _van(tasas, grupos, anios, importes, n):
+    # Valor actual neto y su derivada para cada grupo a la tasa de ese grupo
+    with np.errstate(over="ignore", invalid="ignore"):
+        descuento = (1.0 + tasas[grupos]) ** (-anios)
+        van = np.bincount(grupos, weights=importes * descuento, minlength=n)
+        derivada = np.bincount(grupos, weights=-anios * importes * descuento / (1.0 + tasas[grupos]), minlength=n)
+    return van, derivada
+
+
+def xirr(grupos, fechas, importes, n=None):
+    # TIR anual (en tanto por uno) de varios grupos de flujos a la vez. grupos son códigos
+    # 0..n-1, fechas datetime64 e importes con signo (aportaciones negativas). Todos los
+    # grupos avanzan juntos: un paso de Newton por iteración, acotado por bisección.
+    # Devuelve NaN en los grupos sin cambio de signo en el intervalo de búsqueda.
+    grupos = np.asarray(grupos, dtype="int64")
+    importes = np.asarray(importes, dtype="float64")
+    fechas = np.asarray(fechas, dtype="datetime64[ns]")
+    n = int(grupos.max()) + 1 if n is None else n
+    if n == 0:
+        return np.array([])
+
+    # Años desde el primer flujo de cada grupo
+    inicio = np.full(n, np.iinfo("int64").max)
+    np.minimum.at(inicio, grupos, fechas.view("int64"))
+    anios = (fechas.view("int64") - inicio[grupos]) / (365.0 * 86400e9)
+
+    bajo = np.full(n, TIR_MINIMA)
+    alto = np.full(n, TIR_MAXIMA)
+    van_bajo, _ = _van(bajo, grupos, anios, importes, n)
+    van_alto, _ = _van(alto, grupos, anios, importes, n)
+    validos = np.sign(van_bajo) * np.sign(van_alto) < 0
+
+    tasas = np.full(n, 0.1)
+    convergido = ~validos
+    for _ in range(MAX_ITERACIONES):
+        van, derivada = _van(tasas, grupos, anios, importes, n)
+        # Mantener el intervalo con cambio de signo
+        mismo_signo = np.sign(van) == np.sign(van_bajo)
+        bajo = np.where(mismo_signo, tasas, bajo)
+        van_bajo = np.where(mismo_signo, van, van_bajo)
+        alto = np.where(mismo_signo, alto, tasas)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            nuevas = tasas - van / derivada
+        # Si Newton se sale del intervalo se toma el punto medio
+        fuera = ~np.isfinite(nuevas) | (nuevas <= bajo) | (nuevas >= alto)
+        nuevas = np.where(fuera, (bajo + alto) / 2, nuevas)
+        convergido = convergido | (np.abs(nuevas - tasas) < TOLERANCIA)
+        tasas = np.where(convergido, tasas, nuevas)
+        if convergido.all():
+            break
+
+    return np.where(validos, tasas, np.nan)
+
+
+def tir_por_fondo(valoradas, resumen):
+    # TIR anual (%) de cada fondo del resumen: aportaciones como flujos negativos y el
+    # valor actual como flujo positivo en la fecha del precio
+    codigos = pd.Categorical(valoradas["Fondo"], categories=resumen["Fondo"]).codes
+    aportadas = codigos >= 0
+    fecha_final = pd.to_datetime(resumen["Fecha Precio"], format="%d/%m/%Y", errors="coerce").to_numpy("datetime64[ns]")
+    con_valor = ~np.isnat(fecha_final) & (resumen["Valor Actual Estimado"].to_numpy() > 0)
+
+    grupos = np.concatenate([codigos[aportadas], np.flatnonzero(con_valor)])
+    fechas = np.concatenate([
+        valoradas["Fecha"].to_numpy("datetime64[ns]")[aportadas],
+        fecha_final[con_valor],
+    ])
+    importes = np.concatenate([
+        -valoradas["Dinero Inv."].to_numpy("float64")[aportadas],
+        resumen["Valor Actual Estimado"].to_numpy("float64")[con_valor],
+    ])
+    tasas = xirr(grupos, fechas, importes, n=len(resumen)) if len(grupos) else np.full(len(resumen), np.nan)
+    return pd.Series(np.where(con_valor, tasas * 100, np.nan), index=resumen.index)
+
+
+def twr_por_fondo(valoradas, resumen):
+    # Rentabilidad ponderada por tiempo (%) de cada fondo: en un fondo es la variación de
+    # su valor liquidativo desde la primera aportación hasta el precio actual
+    primera = valoradas.sort_values("Fecha", kind="stable").drop_duplicates("Fondo")
+    precio_inicial = resumen["Fondo"].map(primera.set_index("Fondo")["Valor Compra"]).astype("float64")
+    precio_actual = resumen["Precio Actual"].replace(0.0, np.nan)
+    return (precio_actual / precio_inicial - 1) * 100
+
+
+def rendimientos_cartera(diario):
+    # Factor de rendimiento de cada día (1 + r) de la serie diaria de valor_diario_cartera,
+    # descontando lo aportado ese día; 1 mientras la cartera no tiene valor
+    valor = diario["Valor de Mercado"].to_numpy("float64")
+    aportado = np.diff(diario["Dinero Inv."].to_numpy("float64"))
+    anterior = valor[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(anterior > 0, (valor[1:] - aportado) / anterior, 1.0)
+
+
+def twr_cartera(diario):
+    # Rentabilidad ponderada por tiempo (%) de la cartera a partir de la serie diaria de
+    # valor_diario_cartera: encadena los rendimientos diarios descontando las aportaciones
+    if len(diario) < 2:
+        return np.nan
+    return (np.prod(rendimientos_cartera(diario)) - 1) * 100
+
+
+def tir_aportaciones(valoradas, valor_actual, fecha_valor):
+    # TIR anual (%) de un conjunto de aportaciones (un fondo o toda la cartera) como un solo grupo
+    if not valor_actual or fecha_valor is None or valoradas.empty:
+        return np.nan
+    fechas = np.append(valoradas["Fecha"].to_numpy("datetime64[ns]"), np.datetime64(pd.Timestamp(fecha_valor), "ns"))
+    importes = np.append(-valoradas["Dinero Inv."].to_numpy("float64"), valor_actual)
+    return xirr(np.zeros(len(fechas), dtype="int64"), fechas, importes, n=1)[0] * 100
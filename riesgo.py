@@ -0,0 +1,134 @@
+# Métricas de riesgo a partir de rentabilidades diarias: volatilidad anualizada,
+# rentabilidad anual, ratio de Sharpe, máxima caída y su duración, y correlaciones entre
+# series. Se calculan a la vez para todas las columnas de una matriz fechas × series de
+# precios (los valores liquidativos de matriz_nav más el índice de la cartera), sin
+# bucles por fondo.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from rentabilidad import rendimientos_cartera
+
+# Tasa libre de riesgo anual (%) para el ratio de Sharpe
+TASA_LIBRE_RIESGO = float(os.environ.get("FONDOS_TASA_LIBRE_RIESGO", 0))
+# Días hábiles por año para anualizar
+DIAS_ANIO = 252
+COLUMNA_CARTERA = "Cartera"
+COLUMNAS_RIESGO = [
+    "Volatilidad (%)", "Rentabilidad Anual (%)", "Sharpe", "Máxima Caída (%)",
+    "Duración Caída (días)", "Observaciones",
+]
+
+
+def rentabilidades_diarias(precios):
+    # Rentabilidades logarítmicas diarias de un array fechas × series (NaN donde falta
+    # alguno de los dos precios o no es positivo)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rentabilidades = np.diff(np.log(precios), axis=0)
+    rentabilidades[~np.isfinite(rentabilidades)] = np.nan
+    return rentabilidades
+
+
+def covarianza_por_pares(rentabilidades):
+    # Media de cada serie y covarianza de cada par con las observaciones que tienen ambas
+    # series. Devuelve también el número de observaciones de cada par (diagonal: de cada
+    # serie); las series o pares sin al menos dos observaciones quedan a cero.
+    validas = np.isfinite(rentabilidades)
+    n = validas.sum(axis=0)
+    rentabilidades = np.where(validas, rentabilidades, 0.0)
+    media = np.divide(rentabilidades.sum(axis=0), n, out=np.zeros(rentabilidades.shape[1]), where=n > 0)
+    centradas = np.where(validas, rentabilidades - media, 0.0)
+    pares = validas.T.astype("float64") @ validas.astype("float64")
+    covarianza = np.divide(centradas.T @ centradas, pares - 1, out=np.zeros_like(pares), where=pares > 1)
+    return media, covarianza, pares
+
+
+def correlacion_por_pares(rentabilidades):
+    # Correlación de cada par de series con las observaciones que tienen ambas, como
+    # DataFrame.corr, pero con las sumas de todos los pares en productos de matrices.
+    # Se centra cada serie por su media antes, solo por precisión.
+    validas = np.isfinite(rentabilidades)
+    marca = validas.astype("float64")
+    por_serie = validas.sum(axis=0)
+    media = np.divide(np.where(validas, rentabilidades, 0.0).sum(axis=0), por_serie,
+                      out=np.zeros(rentabilidades.shape[1]), where=por_serie > 0)
+    x = np.where(validas, rentabilidades - media, 0.0)
+    n = marca.T @ marca
+    # suma[i, j]: suma de la serie i en las fechas en que también hay dato de j
+    suma = x.T @ marca
+    cuadrados = (x * x).T @ marca
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covarianza = x.T @ x - suma * suma.T / n
+        varianza = cuadrados - suma * suma / n
+        correlacion = np.clip(covarianza / np.sqrt(varianza * varianza.T), -1.0, 1.0)
+    correlacion[(n < 2) | ~np.isfinite(correlacion)] = np.nan
+    correlacion[np.diag_indices_from(correlacion)] = np.where(np.diag(varianza) > 0, 1.0, np.nan)
+    return correlacion
+
+
+def caidas(precios):
+    # Máxima caída desde el máximo anterior (fracción, negativa) y su duración en días
+    # hábiles, del máximo previo a la recuperación (o hasta la última fecha si no se ha
+    # recuperado), para cada columna de un array fechas × series
+    filas = np.arange(len(precios))[:, None]
+    columnas = np.arange(precios.shape[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        caida = precios / np.fmax.accumulate(precios, axis=0) - 1.0
+    caida = np.where(np.isfinite(caida), caida, 0.0)
+    en_maximo = caida >= 0
+    # Fila del último máximo hasta cada fecha
+    ultimo_maximo = np.maximum.accumulate(np.where(en_maximo, filas, 0), axis=0)
+    fondo = caida.argmin(axis=0)
+    recuperacion = en_maximo & (filas > fondo)
+    fin = np.where(recuperacion.any(axis=0), recuperacion.argmax(axis=0), len(precios) - 1)
+    maxima = caida[fondo, columnas]
+    duracion = np.where(maxima < 0, fin - ultimo_maximo[fondo, columnas], 0)
+    return maxima, duracion
+
+
+def indice_cartera(diario):
+    # Índice de la cartera (1 el primer día) encadenando los rendimientos diarios sin las
+    # aportaciones, indexado por Fecha como matriz_nav
+    if len(diario) < 2:
+        return pd.Series(dtype="float64", index=pd.DatetimeIndex([], name="Fecha"), name=COLUMNA_CARTERA)
+    valores = np.concatenate([[1.0], np.cumprod(rendimientos_cartera(diario))])
+    return pd.Series(valores, index=pd.DatetimeIndex(diario["Fecha"], name="Fecha"), name=COLUMNA_CARTERA)
+
+
+def metricas_riesgo(matriz, tasa_libre=TASA_LIBRE_RIESGO):
+    # Métricas de cada columna de matriz (fechas × series de precios) en una pasada.
+    # Devuelve (tabla con una fila por serie y COLUMNAS_RIESGO, matriz de correlaciones).
+    precios = matriz.to_numpy("float64")
+    if len(precios) < 2:
+        vacia = pd.DataFrame(np.nan, index=matriz.columns, columns=COLUMNAS_RIESGO)
+        return vacia, pd.DataFrame(np.nan, index=matriz.columns, columns=matriz.columns)
+    rentabilidades = rentabilidades_diarias(precios)
+    observaciones = np.isfinite(rentabilidades).sum(axis=0)
+    sin_datos = observaciones < 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = np.where(sin_datos, np.nan, np.nansum(rentabilidades, axis=0) / observaciones)
+        desviacion = np.sqrt(np.nansum((rentabilidades - media) ** 2, axis=0) / (observaciones - 1))
+        exceso = media - np.log1p(tasa_libre / 100) / DIAS_ANIO
+        sharpe = np.where(desviacion > 0, exceso / desviacion * np.sqrt(DIAS_ANIO), np.nan)
+    maxima, duracion = caidas(precios)
+    correlacion = correlacion_por_pares(rentabilidades)
+
+    tabla = pd.DataFrame({
+        "Volatilidad (%)": desviacion * np.sqrt(DIAS_ANIO) * 100,
+        "Rentabilidad Anual (%)": np.expm1(media * DIAS_ANIO) * 100,
+        "Sharpe": sharpe,
+        "Máxima Caída (%)": maxima * 100,
+        "Duración Caída (días)": duracion.astype("float64"),
+        "Observaciones": observaciones,
+    }, index=matriz.columns)
+    tabla.loc[sin_datos, COLUMNAS_RIESGO[:-1]] = np.nan
+    return tabla, pd.DataFrame(correlacion, index=matriz.columns, columns=matriz.columns)
+
+
+def riesgo_cartera(nav, diario, tasa_libre=TASA_LIBRE_RIESGO):
+    # Métricas de los fondos de nav y de la cartera (fila COLUMNA_CARTERA, a partir de
+    # la serie diaria de valor_diario_cartera) con sus correlaciones
+    matriz = nav.join(indice_cartera(diario), how="outer")
+    return metricas_riesgo(matriz, tasa_libre)
@@ -0,0 +1,314 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+def matriz_precios(observaciones, fechas):
+    # observaciones: DataFrame fecha, clave, precio. Devuelve fechas × clave con el último
+    # precio conocido en cada fecha (arrastrando el anterior los días sin dato).
+    matriz = observaciones.pivot(index="fecha", columns="clave", values="precio")
+    indice = matriz.index.union(fechas)
+    return matriz.reindex(indice).ffill().reindex(fechas)
+
+
+def _acumulado(aportaciones, columna, fechas, claves):
+    # Suma acumulada por clave de una columna del libro, evaluada en cada fecha
+    por_dia = aportaciones.pivot_table(index="fecha", columns="clave", values=columna, aggfunc="sum")
+    indice = por_dia.index.union(fechas)
+    return por_dia.reindex(index=indice, columns=claves).fillna(0).cumsum().reindex(fechas)
+
+
+def valor_diario_cartera(df, isin_map, historicos=None, precios_actuales=None):
+    # Valor de mercado diario de la cartera: participaciones acumuladas de cada fondo por
+    # su valor liquidativo de cada día. Los precios salen del histórico guardado, del
+    # precio actual y, a falta de ellos, del propio valor de compra de cada aportación.
+    # Devuelve un DataFrame indexado por Fecha (días hábiles) con 'Dinero Inv.' acumulado
+    # y 'Valor de Mercado'.
+    aportaciones = df[df["Valor Compra"] > 0]
+    if aportaciones.empty:
+        return pd.DataFrame(columns=["Dinero Inv.", "Valor de Mercado"], index=pd.DatetimeIndex([], name="Fecha"))
+
+    # Los fondos sin ISIN se identifican por su nombre y solo usan sus precios de compra
+    aportaciones = pd.DataFrame({
+        "fecha": aportaciones["Fecha"].dt.normalize(),
+        "clave": aportaciones["Fondo"].map(isin_map).fillna(aportaciones["Fondo"]),
+        "Dinero Inv.": aportaciones["Dinero Inv."],
+        "participaciones": aportaciones["Dinero Inv."] / aportaciones["Valor Compra"],
+        "precio": aportaciones["Valor Compra"],
+    })
+    claves = aportaciones["clave"].unique()
+
+    # Prioridad en una misma fecha: histórico > precio actual > valor de compra
+    observaciones = [aportaciones[["fecha", "clave", "precio"]]]
+    if precios_actuales:
+        observaciones.append(pd.DataFrame(
+            [(pd.Timestamp(fecha).normalize(), isin, precio)
+             for isin, (precio, fecha) in precios_actuales.items() if precio and fecha],
+            columns=["fecha", "clave", "precio"],
+        ))
+    for isin, historico in (historicos or {}).items():
+        if len(historico):
+            observaciones.append(historico.assign(clave=isin)[["fecha", "clave", "precio"]])
+    observaciones = pd.concat(observaciones, ignore_index=True)
+    observaciones = observaciones[observaciones["clave"].isin(claves)]
+    observaciones = observaciones.drop_duplicates(["fecha", "clave"], keep="last")
+
+    fechas = pd.bdate_range(aportaciones["fecha"].min(), observaciones["fecha"].max(), name="Fecha")
+    precios = matriz_precios(observaciones, fechas).reindex(columns=claves)
+    participaciones = _acumulado(aportaciones, "participaciones", fechas, claves)
+    invertido = _acumulado(aportaciones, "Dinero Inv.", fechas, claves)
+
+    return pd.DataFrame({
+        "Dinero Inv.": invertido.sum(axis=1),
+        "Valor de Mercado": (participaciones * precios).sum(axis=1),
+    })
+
+
+def matriz_nav(historicos, precios_actuales=None):
+    # Valores liquidativos por día hábil (filas) e ISIN (columnas) a partir de las series
+    # guardadas ({isin: serie}) y del precio actual ({isin: (precio, fecha)}). Los días sin
+    # dato arrastran el último valor; antes del primer valor de cada ISIN queda NaN.
+    isins = list(dict.fromkeys([*(historicos or {}), *(precios_actuales or {})]))
+    # Prioridad en una misma fecha: histórico > precio actual
+    observaciones = [pd.DataFrame(
+        [(pd.Timestamp(fecha).normalize(), isin, precio)
+         for isin, (precio, fecha) in (precios_actuales or {}).items() if precio and fecha],
+        columns=["fecha", "clave", "precio"],
+    )]
+    for isin, historico in (historicos or {}).items():
+        if len(historico):
+            observaciones.append(historico.assign(clave=isin)[["fecha", "clave", "precio"]])
+    observaciones = pd.concat(observaciones, ignore_index=True).drop_duplicates(["fecha", "clave"], keep="last")
+    if observaciones.empty:
+        return pd.DataFrame(columns=isins, index=pd.DatetimeIndex([], name="Fecha"), dtype="float64")
+    fechas = pd.bdate_range(observaciones["fecha"].min(), observaciones["fecha"].max(), name="Fecha")
+    return matriz_precios(observaciones, fechas).reindex(columns=isins).astype("float64")
+
+
+COLUMNAS_RESUMEN = [
+    "Fondo", "Dinero Inv.", "Valor Actual Estimado", "Rendimiento (%)", "Diferencia (€)",
+    "Precio Medio Compra", "Precio Actual", "Fecha Precio",
+]
+
+
+def tabla_fondos(isin_map, precios):
+    # Una fila por fondo con su ISIN y su precio actual (NaN si no hay precio)
+    fondos = pd.DataFrame({"Fondo": list(isin_map), "ISIN": list(isin_map.values())})
+    fondos["Precio Actual"] = fondos["ISIN"].map(lambda isin: precios.get(isin, (None, None))[0]).astype("float64")
+    fondos["Fecha Precio"] = pd.to_datetime(fondos["ISIN"].map(lambda isin: precios.get(isin, (None, None))[1]))
+    return fondos
+
+
+def _sumas_por_codigo(codigos, valores, n):
+    # Suma por grupo ignorando NaN, como groupby().sum(), pero con bincount
+    valores = np.nan_to_num(np.asarray(valores, dtype="float64"), nan=0.0, posinf=np.inf, neginf=-np.inf)
+    validos = codigos >= 0
+    return np.bincount(codigos[validos], weights=valores[validos], minlength=n)
+
+
+def _por_fila(valores_por_fondo, codigos):
+    # Lleva a cada fila el valor de su fondo; código -1 (fondo vacío) da NaN
+    valores = np.append(np.asarray(valores_por_fondo, dtype="float64"), np.nan)
+    return valores[codigos]
+
+
+def valorar_aportaciones(df, isin_map, precios):
+    # Añade a cada aportación su ISIN, el precio actual del fondo y su valoración.
+    # Los nombres de fondo se codifican una sola vez y los datos del fondo se llevan a
+    # cada fila indexando por código, sin comparar cadenas fila a fila.
+    codigos, nombres = pd.factorize(df["Fondo"])
+    fondos = tabla_fondos(isin_map, precios).drop_duplicates("Fondo").set_index("Fondo").reindex(nombres)
+
+    codigos_isin, isins = pd.factorize(fondos["ISIN"])
+    codigos_isin = np.append(codigos_isin, -1)[codigos]
+    precio = _por_fila(fondos["Precio Actual"], codigos)
+    fecha = _por_fila(fondos["Fecha Precio"].to_numpy("datetime64[ns]").view("int64"), codigos)
+    fecha[np.append(fondos["Fecha Precio"].isna().to_numpy(), True)[codigos]] = np.nan
+
+    participaciones = df["Dinero Inv."].to_numpy() / df["Valor Compra"].to_numpy()
+    # Sin precio actual la aportación no suma al valor estimado del fondo
+    valor = np.nan_to_num(participaciones * precio, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    return df.assign(**{
+        "ISIN": pd.Categorical.from_codes(codigos_isin, isins),
+        "Precio Actual": precio,
+        "Fecha Precio": pd.to_datetime(fecha, unit="ns"),
+        "Participaciones": participaciones,
+        "Valor Actual Estimado": valor,
+    })
+
+
+def _agregar(df):
+    # Agregados de cada fondo que solo dependen del libro, no del precio actual
+    codigos, nombres = pd.factorize(df["Fondo"])
+    n = len(nombres)
+    dinero = df["Dinero Inv."].to_numpy("float64")
+    compra = df["Valor Compra"].to_numpy("float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        participaciones = dinero / compra
+    return pd.DataFrame({
+        "Dinero Inv.": _sumas_por_codigo(codigos, dinero, n),
+        "Participaciones": _sumas_por_codigo(codigos, participaciones, n),
+        "Ponderado": _sumas_por_codigo(codigos, compra * dinero, n),
+    }, index=pd.Index(nombres, name="Fondo", dtype="object"))
+
+
+# Columnas de importes del libro de las que dependen los agregados (además del fondo)
+COLUMNAS_AGREGADOS = ["Dinero Inv.", "Valor Compra"]
+COLUMNAS_SUMAS = ["Dinero Inv.", "Participaciones", "Ponderado"]
+
+
+def _hashes_filas(dinero, compra):
+    # Hash de cada fila a partir de sus importes; se desborda a propósito (mod 2^64)
+    with np.errstate(over="ignore"):
+        return pd.util.hash_array(dinero) ^ (pd.util.hash_array(compra) * np.uint64(0x9E3779B97F4A7C15))
+
+
+def _sumas(dinero, compra):
+    # [dinero, participaciones, ponderado] de unas filas, con los NaN como en _agregar
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columnas = (dinero, dinero / compra, compra * dinero)
+    return np.array([np.nan_to_num(c, nan=0.0, posinf=np.inf, neginf=-np.inf).sum() for c in columnas])
+
+
+def _columnas_libro(df):
+    # Código de fondo por fila, nombres de los fondos e importes, sin comparar cadenas si
+    # la columna de fondos es categórica
+    fondos = df["Fondo"].array
+    if isinstance(fondos, pd.Categorical):
+        codigos, nombres = fondos.codes, fondos.categories
+    else:
+        codigos, nombres = pd.factorize(fondos)
+        nombres = pd.Index(nombres)
+    return codigos, nombres, df["Dinero Inv."].to_numpy("float64"), df["Valor Compra"].to_numpy("float64")
+
+
+class HuellasFondos(dict):
+    # {fondo: (filas, suma de los hashes de sus filas mod 2^64)}. pandas copia df.attrs
+    # en profundidad en cada operación; como no se modifica después de crearla, la
+    # "copia" es la misma instancia y no cuesta nada.
+    def __deepcopy__(self, memo):
+        return self
+
+
+def huellas_por_fondo(df):
+    # Huella de cada fondo del libro. aportaciones la calcula una vez al cargar el libro y
+    # la deja en df.attrs["huellas_fondos"]; al ser una suma, un añadido al final de un
+    # fondo se comprueba hasheando solo las filas nuevas.
+    codigos, nombres, dinero, compra = _columnas_libro(df)
+    validos = codigos >= 0
+    sumas = np.zeros(len(nombres), dtype="uint64")
+    np.add.at(sumas, codigos[validos], _hashes_filas(dinero, compra)[validos])
+    filas = np.bincount(codigos[validos], minlength=len(nombres))
+    return HuellasFondos((nombre, (int(f), int(h))) for nombre, f, h in zip(nombres, filas, sumas) if f)
+
+
+class AgregadosFondos:
+    # Dinero invertido, participaciones y suma ponderada de compra de cada fondo del
+    # último libro visto, con la huella de cada fondo (ver huellas_por_fondo). Solo se
+    # tocan los fondos cuya huella ha cambiado: si sus filas anteriores siguen igual y
+    # se han añadido otras al final, se suman las nuevas; si no, se recalcula ese fondo.
+    # Se comparte entre sesiones, así que calcular se serializa con un cerrojo.
+    def __init__(self):
+        self._cerrojo = threading.Lock()
+        self._huellas = {}
+        self._agregados = None
+        # Filas sumadas en la última llamada
+        self.filas_sumadas = 0
+
+    def calcular(self, df):
+        huellas = df.attrs.get("huellas_fondos") if df.attrs.get("filas") == len(df) else None
+        if huellas is None:
+            huellas = huellas_por_fondo(df)
+        with self._cerrojo:
+            cambiados = [fondo for fondo, huella in huellas.items() if self._huellas.get(fondo) != huella]
+            if not cambiados and len(huellas) == len(self._huellas):
+                self.filas_sumadas = 0
+                return self._agregados
+            if self._agregados is None or 2 * len(cambiados) > len(huellas):
+                agregados = _agregar(df)
+                self.filas_sumadas = len(df)
+            else:
+                fondos = list(huellas)
+                valores = self._agregados.reindex(fondos, fill_value=0.0).to_numpy(copy=True)
+                self.filas_sumadas = 0
+                codigos, nombres, dinero, compra = _columnas_libro(df)
+                for fondo in cambiados:
+                    posiciones = np.flatnonzero(codigos == nombres.get_loc(fondo))
+                    fila = fondos.index(fondo)
+                    vistas, suma = self._huellas.get(fondo, (0, 0))
+                    nuevas = posiciones[vistas:]
+                    if 0 < vistas < len(posiciones) and \
+                            (suma + int(_hashes_filas(dinero[nuevas], compra[nuevas]).sum(dtype="uint64"))) % 2 ** 64 == huellas[fondo][1]:
+                        valores[fila] += _sumas(dinero[nuevas], compra[nuevas])
+                    else:
+                        nuevas = posiciones
+                        valores[fila] = _sumas(dinero[nuevas], compra[nuevas])
+                    self.filas_sumadas += len(nuevas)
+                agregados = pd.DataFrame(valores, index=pd.Index(fondos, name="Fondo", dtype="object"), columns=COLUMNAS_SUMAS)
+            self._huellas, self._agregados = huellas, agregados
+            return agregados
+
+
+def resumen_por_fondo(valoradas, agregados=None):
+    # Dinero invertido, valor, participaciones y precio medio ponderado de cada fondo.
+    # agregados (de AgregadosFondos.calcular) evita volver a sumar las filas del libro.
+    codigos, nombres = pd.factorize(valoradas["Fondo"], sort=True)
+    n = len(nombres)
+
+    # Fila de la primera aportación de cada fondo, para los datos que son del fondo
+    primeras = np.zeros(n, dtype="int64")
+    posiciones = np.flatnonzero(codigos >= 0)
+    primeras[codigos[posiciones[::-1]]] = posiciones[::-1]
+    del_fondo = valoradas.iloc[primeras]
+
+    if agregados is None:
+        invertido = _sumas_por_codigo(codigos, valoradas["Dinero Inv."], n)
+        valor = _sumas_por_codigo(codigos, valoradas["Valor Actual Estimado"], n)
+        participaciones = _sumas_por_codigo(codigos, valoradas["Participaciones"], n)
+        ponderado = _sumas_por_codigo(codigos, valoradas["Valor Compra"] * valoradas["Dinero Inv."], n)
+    else:
+        agregados = agregados.reindex(nombres)
+        invertido = agregados["Dinero Inv."].to_numpy()
+        participaciones = agregados["Participaciones"].to_numpy()
+        ponderado = agregados["Ponderado"].to_numpy()
+        # Sin precio actual el fondo no suma valor estimado
+        precio = del_fondo["Precio Actual"].to_numpy("float64")
+        valor = np.where(np.isnan(precio), 0.0, participaciones * np.nan_to_num(precio))
+
+    resumen = pd.DataFrame({
+        "Fondo": nombres,
+        "Dinero Inv.": invertido,
+        "Valor Actual Estimado": valor,
+        "Participaciones": participaciones,
+        "ISIN": del_fondo["ISIN"].to_numpy(),
+        "Precio Actual": del_fondo["Precio Actual"].to_numpy(),
+        "Fecha Precio": del_fondo["Fecha Precio"].to_numpy(),
+    })
+    with np.errstate(divide="ignore", invalid="ignore"):
+        resumen["Rendimiento (%)"] = ((valor - invertido) / invertido * 100).round(2)
+        precio_medio = ponderado / invertido
+    resumen["Diferencia (€)"] = (valor - invertido).round(2)
+    con_precio_medio = resumen["ISIN"].notna() & (resumen["Dinero Inv."] != 0)
+    resumen["Precio Medio Compra"] = np.where(con_precio_medio, precio_medio, 0.0)
+    resumen["Precio Actual"] = resumen["Precio Actual"].fillna(0.0)
+    resumen["Fecha Precio"] = resumen["Fecha Precio"].dt.strftime("%d/%m/%Y").fillna("")
+    return resumen[COLUMNAS_RESUMEN + ["ISIN", "Participaciones"]]
+
+
+def historial_aportaciones(valoradas):
+    # Valor actual de cada aportación; si el fondo no tiene precio se usa el de compra
+    historial = valoradas[valoradas["Valor Compra"] > 0]
+    precio = historial["Precio Actual"].fillna(historial["Valor Compra"])
+    valor = historial["Participaciones"] * precio
+    return pd.DataFrame({
+        "Fecha": historial["Fecha"],
+        # Como categoría, reordenar la columna no copia cadenas
+        "Fondo": pd.Categorical(historial["Fondo"]),
+        "Dinero Inv.": historial["Dinero Inv."],
+        "Valor Compra": historial["Valor Compra"],
+        "Precio Actual": precio,
+        "Valor Actual Aportación": valor,
+        "Beneficio €": valor - historial["Dinero Inv."],
+        "Rentabilidad %": (valor - historial["Dinero Inv."]) / historial["Dinero Inv."] * 100,
+    }, index=historial.index).sort_values("Fecha", ascending=False, kind="stable")